@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bts_tools - Tools to easily manage the bitshares client
+# Copyright (c) 2018 Nicolas Wack <wackou@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Measure the duration of a feed fetching cycle with simulated feed providers, some of which
+are slow to reply.
+
+The "before" numbers replicate the previous implementation, which submitted all the requests
+to a pool of 6 threads.
+
+Usage: python benchmarks/bench_feed_fetch.py
+"""
+
+from bts_tools import feed_fetcher
+from bts_tools.feed_providers import FeedPrice
+from concurrent.futures import ThreadPoolExecutor
+import types
+import time
+
+# provider name -> time taken to reply, in seconds
+PROVIDERS = {'Fast{}'.format(i): 0.1 for i in range(8)}
+PROVIDERS.update({'Slow{}'.format(i): 1.0 for i in range(4)})
+
+NMARKETS = 3  # number of markets queried on each provider
+
+
+def make_provider(name, delay):
+    def get(asset, base):
+        time.sleep(delay)
+        return FeedPrice(1, asset, base, provider=name)
+    return types.SimpleNamespace(NAME=name, get=get)
+
+
+def before(markets, providers):
+    """previous implementation of feeds._fetch_feeds()"""
+    with ThreadPoolExecutor(max_workers=6) as e:
+        futures = [e.submit(providers[provider].get, asset, base) for asset, base, provider in markets]
+        return [f.result() for f in futures]
+
+
+def main():
+    providers = {name: make_provider(name, delay) for name, delay in PROVIDERS.items()}
+    markets = [('ASSET{}'.format(i), 'USD', name) for name in PROVIDERS for i in range(NMARKETS)]
+
+    start = time.time()
+    before(markets, providers)
+    t_before = time.time() - start
+
+    start = time.time()
+    feeds = feed_fetcher.fetch_feeds(markets, providers, max_concurrent=32, max_per_provider=NMARKETS)
+    t_after = time.time() - start
+    assert len(feeds) == len(markets)
+
+    print('{} requests, slowest one: {:.1f}s'.format(len(markets), max(PROVIDERS.values())))
+    print('fetch cycle   before: {:.2f}s   after: {:.2f}s   ({:.1f}x)'.format(t_before, t_after, t_before / t_after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bts_tools - Tools to easily manage the bitshares client
+# Copyright (c) 2018 Nicolas Wack <wackou@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Measure the FeedPrice construction throughput, as in CoinMarketCap.get_all() which creates
+more than 1000 of them at once.
+
+The "before" numbers replicate the previous implementation, which called inspect.stack() to find
+the provider name and ASSET_MAP of the calling module.
+
+Usage: python benchmarks/bench_feedprice.py [n]
+"""
+
+from bts_tools.feed_providers import FeedPrice, ProviderContext, to_bts
+import inspect
+import pendulum
+import sys
+import timeit
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+NAME = 'Bench'
+ASSET_MAP = {'BTC': 'bitcoin', 'BTS': 'bitshares', 'GOLD': 'XAU'}
+
+ctx = ProviderContext(NAME, ASSET_MAP)
+
+NOW = pendulum.utcnow()
+
+
+class OldFeedPrice(FeedPrice):
+    """previous implementation of FeedPrice.__init__"""
+    def __init__(self, price, asset, base, volume=None, last_updated=None, provider=None):
+        super().__init__(price, asset, base, volume, last_updated, provider='')
+        self.provider = provider
+        if self.provider is None:
+            frm = inspect.stack()[1]
+            mod = inspect.getmodule(frm[0])
+            self.provider = getattr(mod, 'NAME', None)
+
+
+def old_to_bts(asset):
+    """previous implementation of to_bts()"""
+    frm = inspect.stack()[1]
+    mod = inspect.getmodule(frm[0])
+    asset_map = getattr(mod, 'ASSET_MAP', {})
+    asset = asset.upper()
+    for b, y in asset_map.items():
+        if asset == y:
+            return b
+    return asset
+
+
+def report(name, n, elapsed, reference=None):
+    print('{:40s} {:10.0f} objects/s{}'.format(name, n / elapsed,
+                                               '   ({:.0f}x)'.format(reference / elapsed) if reference else ''))
+
+
+def main():
+    t_old = timeit.timeit(lambda: OldFeedPrice(1.0, old_to_bts('XAU'), 'USD', volume=1, last_updated=NOW), number=N)
+    t_compat = timeit.timeit(lambda: FeedPrice(1.0, to_bts('XAU'), 'USD', volume=1, last_updated=NOW), number=N)
+    t_ctx = timeit.timeit(lambda: ctx.feed_price(1.0, ctx.to_bts('XAU'), 'USD', volume=1, last_updated=NOW), number=N)
+
+    report('inspect.stack() (before)', N, t_old)
+    report('FeedPrice() + to_bts() from module', N, t_compat, t_old)
+    report('ProviderContext', N, t_ctx, t_old)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bts_tools - Tools to easily manage the bitshares client
+# Copyright (c) 2018 Nicolas Wack <wackou@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Measure the time it takes to look up the price of a market in a FeedSet containing the
+results of several get_all() providers, as done by the feed rules on every cycle.
+
+The "before" numbers replicate the previous implementation of FeedSet.filter(), which went
+through the whole list for each lookup.
+
+Usage: python benchmarks/bench_feedset.py [nfeeds]
+"""
+
+from bts_tools.feed_providers import FeedPrice, FeedSet
+from collections.abc import Sequence, Set
+import pendulum
+import sys
+import timeit
+
+NFEEDS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+N = 200
+
+NOW = pendulum.utcnow()
+
+
+def old_filter(feeds, asset=None, base=None):
+    """previous implementation of FeedSet.filter()"""
+    def is_valid(f):
+        if asset is not None:
+            if isinstance(asset, str) and f.asset != asset:
+                return False
+            elif isinstance(asset, (Sequence, Set)) and f.asset not in asset:
+                return False
+        if base is not None:
+            if isinstance(base, str) and f.base != base:
+                return False
+            elif isinstance(base, (Sequence, Set)) and f.base not in base:
+                return False
+        return True
+
+    return [f for f in feeds if is_valid(f)]
+
+
+def make_feeds():
+    feeds = FeedSet()
+    for i in range(NFEEDS):
+        feeds.append(FeedPrice(1.0 + i, 'ASSET{}'.format(i % (NFEEDS // 4)), 'USD', volume=1,
+                               last_updated=NOW, provider='Provider{}'.format(i % 4)))
+    return feeds
+
+
+def main():
+    t_build = timeit.timeit(make_feeds, number=1)
+    feeds = make_feeds()
+    feeds.filter('ASSET1', 'USD')  # build the index
+    markets = [('ASSET{}'.format(i), 'USD') for i in range(0, NFEEDS // 4, max(1, NFEEDS // 400))]
+
+    t_before = timeit.timeit(lambda: [old_filter(feeds, a, b) for a, b in markets], number=N // 10) * 10
+    t_after = timeit.timeit(lambda: [feeds.filter(a, b) for a, b in markets], number=N)
+
+    nlookups = N * len(markets)
+    print('building a FeedSet of {} feeds: {:.2f} ms'.format(NFEEDS, t_build * 1000))
+    print('price lookup by market           before: {:8.2f} us/lookup   after: {:8.2f} us/lookup   ({:.0f}x)'
+          .format(t_before / nlookups * 1e6, t_after / nlookups * 1e6, t_before / t_after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bts_tools - Tools to easily manage the bitshares client
+# Copyright (c) 2018 Nicolas Wack <wackou@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Measure the time it takes to import the modules needed by the command-line tools, and check
+that it doesn't load the heavy dependencies which are only needed by some of the commands or by
+the web app. Exits with an error if one of them gets loaded.
+
+Usage: python benchmarks/bench_import.py [nruns]
+"""
+
+import subprocess
+import sys
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+MODULES = ['bts_tools', 'bts_tools.core', 'bts_tools.cmdline']
+
+# modules that should only be loaded on first use
+HEAVY_MODULES = ['autobahn', 'ecdsa', 'geoip2', 'bs4', 'flask', 'psutil', 'jinja2']
+
+CHECK = """
+import sys, time
+start = time.time()
+import {module}
+elapsed = time.time() - start
+from bts_tools import core
+print(elapsed)
+print(' '.join(m for m in {heavy} if m in sys.modules))
+print(core.get_version.cache_info().currsize)
+"""
+
+
+def import_module(module):
+    out = subprocess.run([sys.executable, '-c', CHECK.format(module=module, heavy=HEAVY_MODULES)],
+                         stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout.split('\n')
+    return float(out[0]), out[1].split(), int(out[2])
+
+
+if __name__ == '__main__':
+    failed = False
+    for module in MODULES:
+        times = []
+        for _ in range(N):
+            elapsed, loaded, version_computed = import_module(module)
+            times.append(elapsed)
+        print('import {:20s} {:6.1f} ms'.format(module, min(times) * 1000))
+        if loaded:
+            print('    heavy modules loaded at import: {}'.format(', '.join(loaded)))
+            failed = True
+        if version_computed:
+            print('    version computed at import')
+            failed = True
+    sys.exit(1 if failed else 0)
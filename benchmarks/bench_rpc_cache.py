@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bts_tools - Tools to easily manage the bitshares client
+# Copyright (c) 2018 Nicolas Wack <wackou@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Micro-benchmark of the per-call overhead of GrapheneClient.rpc_call on a cache hit.
+
+The "before" numbers replicate the previous implementation, which converted the args to
+hashable types and returned a copy of the cached value on each call.
+
+Usage: python benchmarks/bench_rpc_cache.py
+"""
+
+from bts_tools import core, rpcutils
+from bts_tools.core import hashabledict
+import timeit
+import copy
+
+N = 20000
+
+
+def fake_peers(n=1000):
+    return [{'endpoint': '10.0.{}.{}:1776'.format(i // 256, i % 256),
+             'last_connection_attempt_time': '2018-02-09T12:00:00',
+             'last_connection_disposition': 'last_connection_succeeded',
+             'last_seen_time': '2018-02-09T12:00:00',
+             'number_of_successful_connection_attempts': i,
+             'number_of_failed_connection_attempts': 0}
+            for i in range(n)]
+
+
+def make_node():
+    core.config = core.config or {}
+    node = rpcutils.GrapheneClient('seed', 'bench', None, {}, type='bts')
+    peers = fake_peers()
+    history = [{'op': {'block_num': i, 'op': [0, {}]}} for i in range(1000)]
+
+    def fake_rpc_call(funcname, *args, timeout=None):
+        if funcname == 'network_get_potential_peers':
+            return peers
+        if funcname == 'get_account_history':
+            return history
+        return {'head_block_num': 1}
+
+    node._rpc_call = fake_rpc_call
+    return node
+
+
+def before(cache, funcname, *args):
+    """previous implementation of a cache hit in GrapheneClient.rpc_call"""
+    args = tuple(hashabledict(arg) if isinstance(arg, dict) else
+                 tuple(arg) if isinstance(arg, list) else
+                 arg
+                 for arg in args)
+    return copy.copy(cache[(funcname, args)])
+
+
+def report(name, t_before, t_after):
+    print('{:40s} before: {:8.2f} us/call   after: {:8.2f} us/call   ({:.1f}x)'
+          .format(name, t_before / N * 1e6, t_after / N * 1e6, t_before / t_after))
+
+
+def main():
+    node = make_node()
+    calls = [('network_get_potential_peers', ()),
+             ('get_account_history', ('bittwenty.feed', 100)),
+             ('get_objects', (['1.6.1', '1.6.2', '1.6.3'],)),
+             ('some_call', ({'asset_id': '1.3.0', 'publisher': '1.2.1'},))]
+
+    for funcname, args in calls:
+        old_cache = {}
+        old_args = tuple(hashabledict(arg) if isinstance(arg, dict) else
+                         tuple(arg) if isinstance(arg, list) else
+                         arg
+                         for arg in args)
+        old_cache[(funcname, old_args)] = node._rpc_call(funcname, *args)
+        node.rpc_call(funcname, *args)  # fill the cache
+
+        t_before = timeit.timeit(lambda: before(old_cache, funcname, *args), number=N)
+        t_after = timeit.timeit(lambda: node.rpc_call(funcname, *args), number=N)
+        report('{}({})'.format(funcname, ', '.join(repr(arg) for arg in args))[:40], t_before, t_after)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bts_tools - Tools to easily manage the bitshares client
+# Copyright (c) 2018 Nicolas Wack <wackou@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Measure the startup time of the command-line tools and of the initialization done when
+creating the web app, with and without the config cache (see core.load_config).
+
+This uses the config.yaml file in ~/.bts_tools.
+
+Usage: python benchmarks/bench_startup.py [nruns]
+"""
+
+from bts_tools import core
+import subprocess
+import time
+import sys
+import os
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+BTS_LIST = [sys.executable, '-c', 'import sys; sys.argv = ["bts", "list"]; from bts_tools.cmdline import main_bts; main_bts()']
+APP_INIT = [sys.executable, '-c', 'import bts_tools; bts_tools.init(); import bts_tools.frontend']
+
+
+def clear_cache():
+    try:
+        os.remove(core.BTS_TOOLS_CONFIG_CACHE_FILE)
+    except FileNotFoundError:
+        pass
+
+
+def timed_run(cmd, cold):
+    times = []
+    for _ in range(N):
+        if cold:
+            clear_cache()
+        start = time.time()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.time() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+    subprocess.run(APP_INIT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)  # warm up the disk caches
+    for name, cmd in [('bts list', BTS_LIST), ('app init', APP_INIT)]:
+        cold = timed_run(cmd, cold=True)
+        warm = timed_run(cmd, cold=False)
+        print('{:10s} no config cache: {:6.3f}s   config cache: {:6.3f}s   ({:.1f}x)'.format(name, cold, warm, cold / warm))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bts_tools - Tools to easily manage the bitshares client
+# Copyright (c) 2018 Nicolas Wack <wackou@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Compare the latency of read-only database calls going through the cli_wallet with the same
+calls sent directly to the witness node over its websocket connection.
+
+This needs a running witness node and cli_wallet for the first node defined in config.yaml.
+
+Usage: python benchmarks/bench_ws_routing.py [ncalls]
+"""
+
+import bts_tools
+from bts_tools import core, rpcutils, graphene
+import time
+import sys
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+
+def connect(node):
+    graphene.connect(node.type(), node.witness_host, node.witness_port, node.witness_user, node.witness_password)
+    for _ in range(100):
+        if graphene.is_connected(node.witness_host, node.witness_port):
+            time.sleep(0.5)  # give it time to login
+            return
+        time.sleep(0.1)
+    sys.exit('Could not connect to witness node on {}:{}'.format(node.witness_host, node.witness_port))
+
+
+def timed(node, funcname, args):
+    start = time.time()
+    for _ in range(N):
+        node.rpc_call(funcname, *args, cached=False)
+    return (time.time() - start) / N
+
+
+def main():
+    bts_tools.init()
+    node = rpcutils.main_node
+    connect(node)
+
+    head_block_num = node.get_head_block_num()
+    calls = [('get_block', (head_block_num - 1,)),
+             ('get_dynamic_global_properties', ()),
+             ('get_account', (node.name,)),
+             ('get_witness', (node.name,)),
+             ('get_asset', ('USD',)),
+             ('get_bitasset_data', ('USD',))]
+
+    routing = core.config.setdefault('rpc', {}).setdefault('routing', {})
+    for funcname, args in calls:
+        try:
+            routing[funcname] = 'wallet'
+            t_wallet = timed(node, funcname, args)
+            routing[funcname] = 'witness'
+            t_witness = timed(node, funcname, args)
+        except Exception as e:
+            print('{:40s} failed: {}'.format(funcname, e))
+            continue
+        print('{:40s} cli_wallet: {:8.2f} ms/call   witness: {:8.2f} ms/call   ({:.1f}x)'
+              .format('{}({})'.format(funcname, ', '.join(repr(arg) for arg in args))[:40],
+                      t_wallet * 1000, t_witness * 1000, t_wallet / t_witness))
+
+
+if __name__ == '__main__':
+    main()
@@ -26,7 +26,22 @@ setupLogging(with_time=True, with_lineno=True)
 # default logging levels
 logging.getLogger('bts_tools').setLevel(logging.INFO)
 
-from .rpcutils import main_node as rpc
+
+def __getattr__(name):
+    # rpcutils is imported on first use only, so that importing the package stays cheap
+    if name == 'rpc':
+        from .rpcutils import main_node
+        return main_node
+    # same for the submodules, eg: bts_tools.process used in the templates
+    if not name.startswith('_'):
+        import importlib
+        try:
+            return importlib.import_module('{}.{}'.format(__name__, name))
+        except ModuleNotFoundError as e:
+            if e.name != '{}.{}'.format(__name__, name):
+                raise
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
+
 
 def init(loglevels=None):
     from .core import load_config
@@ -25,7 +25,6 @@ from pathlib import Path
 from ruamel import yaml
 from .core import (platform, run, get_data_dir, get_bin_name, get_gui_bin_name, get_cli_bin_name,
                    get_all_bin_names, get_full_bin_name, hash_salt_password)
-from .privatekey import PrivateKey
 from . import core, init
 from .rpcutils import rpc_call, GrapheneClient
 import argparse
@@ -226,10 +225,15 @@ def main(flavor='bts'):
   - deploy_node            : full deploy of a seed or witness node on given ip address. Needs ssh root access
 """
 
-    COMMAND_PLUGINS = {name: core.get_plugin('bts_tools.commands', name)
-                       for name in core.list_valid_plugins('bts_tools.commands')}
-    DESC_PLUGINS = '\n'.join('  - {:22} : {}'.format(name, plugin.short_description())
-                             for name, plugin in COMMAND_PLUGINS.items())
+    # descriptions are read from the manifest when possible, so we don't have to import all the commands
+    COMMAND_PLUGINS = core.get_plugin_dict('bts_tools.commands')
+
+    def short_description(name, plugin):
+        return (core.plugin_metadata('bts_tools.commands', name).get('short_description') or
+                plugin.short_description())
+
+    DESC_PLUGINS = '\n'.join('  - {:22} : {}'.format(name, short_description(name, plugin))
+                             for name, plugin in sorted(COMMAND_PLUGINS.items()))
 
     DESC_EXAMPLES = """
     
@@ -265,7 +269,7 @@ Examples:
     args = parser.parse_args()
 
     if args.command == 'version':
-        log.info('Version: %s', core.VERSION)
+        log.info('Version: %s', core.get_version())
         return
 
     init()
@@ -400,6 +404,7 @@ Examples:
                         private_key = role.get('signing_key')
                         if witness_id and private_key:
                             witness_id = '"{}"'.format(witness_id)
+                            from .privatekey import PrivateKey
                             public_key = format(PrivateKey(private_key).pubkey, client['type'])
                             private_key_pair = '["{}", "{}"]'.format(public_key, private_key)
                             run_args += ['--witness-id', witness_id,
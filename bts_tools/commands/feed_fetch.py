@@ -21,6 +21,7 @@
 from .. import core
 from ..rpcutils import GrapheneClient, rpc_call
 from ..feeds import get_feed_prices_new, publish_bts_feed, FeedPrice
+from ..feed_rules import get_plan
 from ruamel import yaml
 import sys
 import logging
@@ -64,6 +65,9 @@ def run_command(config_filename=None):
     for f in sorted(result.filter(base='BTS'), key=lambda f: (f.asset, f.base)):
         print(f)
     print(FeedPrice(price=result.price('ALTCAP', 'BTC'), asset='ALTCAP', base='BTC'))
+
+    print('\nFeed rules:\n')
+    print(get_plan(cfg['rules'], node.rpc_id).dump())
         # print(repr(f))
     # publish price
     # for f in result.filter(base='BTS'):
@@ -23,7 +23,6 @@ from pathlib import Path
 import os
 import sys
 import os.path
-import psutil
 import logging
 
 log = logging.getLogger(__name__)
@@ -75,5 +74,6 @@ def run_command(boost_ver=60, base_build_dir=None, prefix=None):
     run('./bootstrap.sh')
 
     log.info('Compiling and installing')
+    import psutil
     run('./b2 --without-python -j{} --prefix={}/boost_1.{}_install install'.format(psutil.cpu_count(), prefix, boost_ver))
 
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bts_tools - Tools to easily manage the bitshares client
+# Copyright (c) 2018 Nicolas Wack <wackou@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from .. import core, rpcutils
+from ..core import AttributeDict
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from os.path import join, exists
+import json
+import time
+import os
+import logging
+
+log = logging.getLogger(__name__)
+
+# don't load autobahn and all the monitoring plugins when listing the available commands
+graphene = core.lazy_import('bts_tools.graphene')
+indexing = core.lazy_import('bts_tools.monitoring.indexing')
+
+DEFAULT_WORKERS = 4
+DEFAULT_CHUNK_SIZE = 100000
+CONNECT_TIMEOUT = 30  # seconds to wait for being logged in on the witness node
+
+
+def short_description():
+    return 'reindex the full blockchain using parallel workers'
+
+
+def help():
+    return """reindex [nworkers]
+
+Reindex the blocks produced by the monitored witnesses from the start of the blockchain.
+The blockchain is split in chunks which are fetched in parallel, and progress is saved after
+each chunk so that an interrupted reindex resumes where it stopped.
+
+The monitoring web app should not be running at the same time, as it also writes the database.
+
+nworkers: number of chunks fetched at the same time (default: reindex.workers in config.yaml)
+"""
+
+
+def chunks(start, end, chunk_size):
+    """Split [start, end] into consecutive (first, last) ranges, aligned on chunk_size so they are
+    the same for all runs and checkpoints can be reused."""
+    return [(first, min(first - first % chunk_size + chunk_size - 1, end))
+            for first in [start] + list(range(start - start % chunk_size + chunk_size, end + 1, chunk_size))]
+
+
+def index_chunk(node, fetch, first, last, rpc_id=None):
+    """Count the blocks produced by each witness in the given range. If rpc_id is given, the
+    blocks are also recorded in the db of this client.
+
+    type: {'produced': {witness: int}, 'last_produced': {witness: timestamp}}"""
+    produced = defaultdict(int)
+    last_produced = {}
+    blocks = []
+    for block_num, block in indexing.fetch_blocks(node, first, last, fetch=fetch):
+        if isinstance(block, Exception):
+            raise block
+        if block is None:
+            block = node.get_block(block_num, cached=False)
+            if block is None:
+                raise core.RPCError('Could not get block number {}'.format(block_num))
+        produced[block['witness']] += 1
+        last_produced[block['witness']] = block['timestamp']  # blocks come in order
+        blocks.append((block_num, block['witness'], datetime.strptime(block['timestamp'], '%Y-%m-%dT%H:%M:%S')))
+
+    if rpc_id is not None and core.db_store is not None:
+        core.db_store.write_blocks(rpc_id, blocks)
+
+    return {'produced': produced, 'last_produced': last_produced}
+
+
+def merge_chunks(results):
+    """Sum the produced blocks and keep the latest timestamps of all the given chunk results."""
+    produced = defaultdict(int)
+    last_produced = {}
+    for r in results:
+        for witness_id, n in r['produced'].items():
+            produced[witness_id] += n
+        for witness_id, timestamp in r['last_produced'].items():
+            last_produced[witness_id] = max(timestamp, last_produced.get(witness_id, timestamp))
+    return produced, last_produced
+
+
+def checkpoint_file(rpc_id):
+    return join(core.BTS_TOOLS_HOMEDIR, 'reindex_{}_{}.json'.format(*rpc_id))
+
+
+def load_checkpoint(rpc_id):
+    filename = checkpoint_file(rpc_id)
+    if not exists(filename):
+        return {}
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save_checkpoint(rpc_id, checkpoint):
+    filename = checkpoint_file(rpc_id)
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(filename + '.tmp', filename)
+
+
+def connect(node):
+    """Connect to the witness node over websocket, so blocks can be fetched from there directly."""
+    if node.proxy_host or node.witness_host is None:
+        return
+    graphene.connect(node.type(), node.witness_host, node.witness_port, node.witness_user, node.witness_password)
+    if graphene.wait_until_ready(node.witness_host, node.witness_port, timeout=CONNECT_TIMEOUT):
+        return
+    log.warning('Could not connect to witness node on {}:{}, fetching blocks through the wallet'
+                .format(node.witness_host, node.witness_port))
+
+
+def run_command(nworkers=None, env=None):
+    if not core.config['index_full_blockchain']:
+        log.error('Reindexing is only useful with "index_full_blockchain: true" in config.yaml')
+        return
+
+    cfg = core.config.get('reindex', {})
+    nworkers = int(nworkers or cfg.get('workers', DEFAULT_WORKERS))
+    chunk_size = cfg.get('chunk_size', DEFAULT_CHUNK_SIZE)
+
+    nodes = [n for n in rpcutils.nodes if env in (n.client_name, n.type())]
+    if not nodes:
+        log.error('No node defined in config.yaml for {}'.format(env))
+        return
+    main_node = nodes[0]
+
+    # use one connection to each wallet of the same blockchain that we know of
+    fetchers = list({n.rpc_id: n for n in rpcutils.nodes if n.type() == main_node.type()}.values())
+    fetch_methods = {}
+    for node in fetchers:
+        connect(node)
+        fetch_methods[node.rpc_id] = indexing.block_fetcher(node, AttributeDict(fetch_method=None), 1)
+
+    core.load_db()
+    db = core.db[main_node.rpc_id]
+    indexing.init_ctx(main_node, AttributeDict(), {})
+    monitor_witnesses = db['static']['monitor_witnesses'] or [n.name for n in nodes if n.is_witness()]
+
+    head_block_num = main_node.get_head_block_num()
+    checkpoint = load_checkpoint(main_node.rpc_id)
+    done = checkpoint.setdefault('chunks', {})
+    all_chunks = chunks(1, head_block_num, chunk_size)
+    chunk_keys = ['{}-{}'.format(first, last) for first, last in all_chunks]
+    # chunks from a previous run which don't match the current ones (the last chunk ended at a lower
+    # head block, or the chunk size changed) would overlap with them, they need to be indexed again
+    for key in set(done) - set(chunk_keys):
+        del done[key]
+    todo = [(first, last) for (first, last), key in zip(all_chunks, chunk_keys) if key not in done]
+
+    log.info('Reindexing blocks 1 to {} on {} using {} worker(s) on {} connection(s): {} chunk(s) to go, {} done'
+             .format(head_block_num, main_node.rpc_id, nworkers, len(fetchers), len(todo), len(done)))
+
+    start_time = time.time()
+    nblocks = 0
+    with ThreadPoolExecutor(max_workers=nworkers, thread_name_prefix='reindex') as executor:
+        futures = {}
+        for i, (first, last) in enumerate(todo):
+            node = fetchers[i % len(fetchers)]
+            futures[executor.submit(index_chunk, node, fetch_methods[node.rpc_id], first, last,
+                                    main_node.rpc_id)] = (first, last)
+
+        for f in as_completed(futures):
+            first, last = futures[f]
+            try:
+                done['{}-{}'.format(first, last)] = f.result()
+            except Exception as e:
+                log.error('Could not index blocks {} to {}: {}'.format(first, last, e))
+                continue
+            save_checkpoint(main_node.rpc_id, checkpoint)
+            nblocks += last - first + 1
+            log.info('[{:3d}/{}] Indexed blocks {} to {} ({:.0f} blocks/s)'
+                     .format(len(done), len(all_chunks), first, last, nblocks / max(time.time() - start_time, 1e-3)))
+
+    missing = [key for key in chunk_keys if key not in done]
+    if missing:
+        log.error('{} chunk(s) could not be indexed, run the reindex command again to retry them'.format(len(missing)))
+        return
+
+    # merge the results of all chunks into the database
+    produced, last_produced = merge_chunks(done[key] for key in chunk_keys)
+    for witness_name in monitor_witnesses:
+        witness = indexing.witness_key(main_node, witness_name)
+        db['total_produced'][witness_name] = produced.get(witness, 0)
+        if witness in last_produced:
+            db['last_produced'][witness_name] = datetime.strptime(last_produced[witness], '%Y-%m-%dT%H:%M:%S')
+        log.info('Witness {} produced {} blocks'.format(witness_name, db['total_produced'][witness_name]))
+    db['last_indexed_block'] = head_block_num
+    db['static']['need_reindex'] = False
+    core.save_db()
+
+    os.remove(checkpoint_file(main_node.rpc_id))
+    log.info('Reindexing done in {:.0f} seconds'.format(time.time() - start_time))
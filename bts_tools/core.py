@@ -20,11 +20,12 @@
 from os.path import join, dirname, expanduser, exists, abspath
 from collections import namedtuple, defaultdict, abc, Mapping
 from subprocess import Popen, PIPE
-from functools import wraps
-from jinja2 import Environment, PackageLoader
+from functools import wraps, lru_cache
 from pathlib import Path
 from ruamel import yaml
 import importlib
+import threading
+import json
 import pwd
 import sys
 import os
@@ -61,7 +62,9 @@ if os.environ.get('HOME') == '/root' and username != 'root':
 BTS_TOOLS_HOMEDIR = '~/.bts_tools'
 BTS_TOOLS_HOMEDIR = expanduser(BTS_TOOLS_HOMEDIR)
 BTS_TOOLS_CONFIG_FILE = join(BTS_TOOLS_HOMEDIR, 'config.yaml')
-BTS_TOOLS_DB_FILE = join(BTS_TOOLS_HOMEDIR, 'db.yaml')
+BTS_TOOLS_CONFIG_CACHE_FILE = join(BTS_TOOLS_HOMEDIR, 'config_cache.pickle')
+BTS_TOOLS_DB_FILE = join(BTS_TOOLS_HOMEDIR, 'db.yaml')  # deprecated since DB_VERSION 2, only used for migrating
+BTS_TOOLS_SQLITE_FILE = join(BTS_TOOLS_HOMEDIR, 'db.sqlite')
 
 
 class AttributeDict(dict):
@@ -93,7 +96,8 @@ class CaseInsensitiveAttributeDict(dict):
 
 config = None
 db = {}
-DB_VERSION = 1
+db_store = None  # store.SQLiteStore, in memory when the db doesn't need to be persisted
+DB_VERSION = 4
 
 
 def append_unique(l1, l2):
@@ -147,49 +151,134 @@ def trace(f):
 
 
 def save_db():
-    global db
-    log.info('Saving database file {}'.format(BTS_TOOLS_DB_FILE))
-    with open(BTS_TOOLS_DB_FILE, 'w') as f:
-        yaml.dump(db, f)
+    """Commit the db of all clients to disk."""
+    if db_store is None:
+        return
+    log.info('Saving database file {}'.format(db_store.filename))
+    db_store.commit_all(db)
+
+
+def commit_db(rpc_id):
+    """Commit the db of the given client to disk. This is cheap enough to be called regularly
+    while indexing, so that progress is not lost if the tools are killed."""
+    if db_store is not None:
+        db_store.commit(rpc_id, db[rpc_id])
+
+
+def record_block(rpc_id, block_num, witness, timestamp):
+    """Record a block produced by the given witness, it will be written on the next commit_db().
+    The witness is as given in the blocks: its id on bts chains, its name on steem chains."""
+    if db_store is not None:
+        db_store.add_block(rpc_id, block_num, witness, timestamp)
+
+
+def record_missed(rpc_id, witness, timestamp, nmissed=1):
+    """Record blocks missed by the given witness (see record_block()), they will be written on
+    the next commit_db()."""
+    if db_store is not None:
+        db_store.add_missed(rpc_id, witness, timestamp, nmissed)
+
+
+def truncate_db(rpc_id, block_num):
+    """Forget all the blocks recorded after block_num, and return them."""
+    if db_store is not None:
+        return db_store.truncate(rpc_id, block_num)
+    return []
+
+
+def migrate_yaml_db(store):
+    """Import the db.yaml file used up to DB_VERSION 1 into the given store, and rename it so
+    that it doesn't get imported again."""
+    log.info('Migrating database file {} to {}'.format(BTS_TOOLS_DB_FILE, BTS_TOOLS_SQLITE_FILE))
+    try:
+        with open(BTS_TOOLS_DB_FILE) as f:
+            old_db = yaml.load(f)
+        if old_db['version'] != 1:
+            raise ValueError('unknown database version: {}'.format(old_db['version']))
+        store.commit_all(old_db)
+    except Exception as e:
+        log.warning('Could not migrate database, need to reindex... ({})'.format(e))
+    os.rename(BTS_TOOLS_DB_FILE, BTS_TOOLS_DB_FILE + '.bak')
 
 
 def load_db():
-    global db
+    global db, db_store
+
+    from .store import SQLiteStore
+
+    db = defaultdict(dict)
+    db['version'] = DB_VERSION
 
     if not config['index_full_blockchain']:
         # in this case, we'll just index what happens while the tools are online
-        # this also means there's no need to persist the DB
-        db = defaultdict(dict)
-        db['version'] = DB_VERSION
+        # this also means there's no need to persist the DB, and old blocks can be forgotten
+        db_store = SQLiteStore(':memory:', retention=config.get('index_retention', 7 * 86400))
         return
 
-    log.info('Loading database file {}'.format(BTS_TOOLS_DB_FILE))
-    try:
-        with open(BTS_TOOLS_DB_FILE) as f:
-            db = yaml.load(f)
-        if db['version'] != DB_VERSION:
+    log.info('Loading database file {}'.format(BTS_TOOLS_SQLITE_FILE))
+    db_store = SQLiteStore(BTS_TOOLS_SQLITE_FILE)
+
+    if db_store.is_empty() and exists(BTS_TOOLS_DB_FILE):
+        migrate_yaml_db(db_store)
+        db_store.set_version(DB_VERSION)
+    elif db_store.get_version() != DB_VERSION:
+        if db_store.get_version() is not None:
             log.info('Database version upgrade, need to reindex...')
-            raise ValueError('need to reindex')
-    except Exception:
-        db = defaultdict(dict)
-        db['version'] = DB_VERSION
+        db_store.reset()
+        db_store.set_version(DB_VERSION)
+
+    db.update(db_store.load())
 
     # FIXME: see http://grodola.blogspot.com/2016/02/how-to-always-execute-exit-functions-in-py.html
     import atexit
     atexit.register(save_db)
 
 
-def load_config(loglevels=None):
-    log.info('Using home dir for BTS tools: %s' % BTS_TOOLS_HOMEDIR)
-    global config
-    if not exists(BTS_TOOLS_CONFIG_FILE):
-        log.info('Copying default config file to %s' % BTS_TOOLS_CONFIG_FILE)
-        try:
-            os.makedirs(BTS_TOOLS_HOMEDIR)
-        except OSError:
-            pass
-        shutil.copyfile(join(dirname(__file__), 'config.yaml'),
-                        BTS_TOOLS_CONFIG_FILE)
+CONFIG_CACHE_VERSION = 1
+
+
+def config_cache_key():
+    """Return a key identifying the contents of all the files the config is built from: config.yaml
+    is identified by the hash of its contents, the default config templates (and this file, which
+    does the merging) by their modification time and size."""
+    with open(BTS_TOOLS_CONFIG_FILE, 'rb') as f:
+        config_hash = hashlib.sha256(f.read()).hexdigest()
+    templates_dir = join(dirname(__file__), 'templates', 'config')
+    sources = [__file__] + sorted(join(templates_dir, f) for f in os.listdir(templates_dir))
+    return (CONFIG_CACHE_VERSION, config_hash,
+            tuple((f, os.stat(f).st_mtime_ns, os.stat(f).st_size) for f in sources))
+
+
+def load_cached_config(key):
+    """Return the config stored in the cache file if it has been built with the given key, None otherwise."""
+    import pickle
+    try:
+        with open(BTS_TOOLS_CONFIG_CACHE_FILE, 'rb') as f:
+            cached_key, cached_config = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.debug('Could not read config cache file {}: {}'.format(BTS_TOOLS_CONFIG_CACHE_FILE, e))
+        return None
+    return cached_config if cached_key == key else None
+
+
+def save_cached_config(key, cfg):
+    import pickle
+    try:
+        with open(BTS_TOOLS_CONFIG_CACHE_FILE + '.tmp', 'wb') as f:
+            pickle.dump((key, cfg), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(BTS_TOOLS_CONFIG_CACHE_FILE + '.tmp', BTS_TOOLS_CONFIG_CACHE_FILE)
+    except Exception as e:
+        log.debug('Could not write config cache file {}: {}'.format(BTS_TOOLS_CONFIG_CACHE_FILE, e))
+
+
+def build_config():
+    """Render config.yaml and the default config, and return them merged together.
+
+    This also writes the default and merged configs as default_config.yaml and full_config.yaml
+    in ~/.bts_tools for reference."""
+    from jinja2 import Environment, PackageLoader
 
     # load config file
     try:
@@ -210,7 +299,7 @@ def load_config(loglevels=None):
 
     # load yaml config
     try:
-        config = yaml.load(config_contents, Loader=yaml.RoundTripLoader)
+        cfg = yaml.load(config_contents, Loader=yaml.RoundTripLoader)
     except:
         log.error('-'*100)
         log.error('Config file contents is not a valid YAML object:')
@@ -226,8 +315,8 @@ def load_config(loglevels=None):
         log.error('Could not load defaults for config.yaml file...')
         raise
 
-    with open(join(BTS_TOOLS_HOMEDIR, 'default_config.yaml'), 'w') as cfg:
-        cfg.write(yaml.dump(default, indent=4, Dumper=yaml.RoundTripDumper))
+    with open(join(BTS_TOOLS_HOMEDIR, 'default_config.yaml'), 'w') as f:
+        f.write(yaml.dump(default, indent=4, Dumper=yaml.RoundTripDumper))
 
     def recursive_update(a, b):
         for k, v in b.items():
@@ -238,12 +327,35 @@ def load_config(loglevels=None):
             else:
                 a[k] = v
 
-    recursive_update(default, config)
-    config = default
+    recursive_update(default, cfg)
 
     # write full_config.yaml in ~/.bts_tools
-    with open(join(BTS_TOOLS_HOMEDIR, 'full_config.yaml'), 'w') as cfg:
-        cfg.write(yaml.dump(config, indent=4, Dumper=yaml.RoundTripDumper))
+    with open(join(BTS_TOOLS_HOMEDIR, 'full_config.yaml'), 'w') as f:
+        f.write(yaml.dump(default, indent=4, Dumper=yaml.RoundTripDumper))
+
+    return default
+
+
+def load_config(loglevels=None):
+    log.info('Using home dir for BTS tools: %s' % BTS_TOOLS_HOMEDIR)
+    global config
+    if not exists(BTS_TOOLS_CONFIG_FILE):
+        log.info('Copying default config file to %s' % BTS_TOOLS_CONFIG_FILE)
+        try:
+            os.makedirs(BTS_TOOLS_HOMEDIR)
+        except OSError:
+            pass
+        shutil.copyfile(join(dirname(__file__), 'config.yaml'),
+                        BTS_TOOLS_CONFIG_FILE)
+
+    # rendering and parsing the config files is slow, so the result is cached until one of them changes
+    key = config_cache_key()
+    config = load_cached_config(key)
+    if config is None:
+        config = build_config()
+        save_cached_config(key, config)
+    else:
+        log.debug('Loaded config from cache file: %s' % BTS_TOOLS_CONFIG_CACHE_FILE)
 
 
     # setup given logging levels, otherwise from config file
@@ -513,6 +625,7 @@ def run(cmd, capture_io=False, verbose=True, log_on_fail=True,
     return r
 
 
+@lru_cache()
 def get_version():
     version_file = join(HERE, 'version.txt')
     if exists(version_file):
@@ -523,7 +636,12 @@ def get_version():
     except Exception:
         return 'unknown'
 
-VERSION = get_version()
+
+def __getattr__(name):
+    # VERSION is computed on first access, as it might need to run git
+    if name == 'VERSION':
+        return get_version()
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
 
 
 class UnauthorizedError(Exception):
@@ -534,6 +652,16 @@ class RPCError(Exception):
     pass
 
 
+class BatchNotSupportedError(RPCError):
+    """Raised when the remote end doesn't understand JSON-RPC batch requests."""
+    pass
+
+
+class RPCTimeoutError(RPCError):
+    """Raised when an rpc call didn't get a response before its timeout or deadline."""
+    pass
+
+
 class NoFeedData(Exception):
     pass
 
@@ -556,6 +684,60 @@ class hashabledict(dict):
         return self.__key() == other.__key()
 
 
+def _readonly(self, *args, **kwargs):
+    raise TypeError('{} object is read-only'.format(type(self).__name__))
+
+
+class frozendict(dict):
+    """Read-only dict, allows to share cached values without having to copy them.
+    Use copy.copy() or copy.deepcopy() to get a mutable version of it."""
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class frozenlist(list):
+    """Read-only list, allows to share cached values without having to copy them.
+    Use copy.copy() or copy.deepcopy() to get a mutable version of it."""
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+def freeze(obj):
+    """Recursively convert all dicts and lists in obj to their read-only counterpart."""
+    if isinstance(obj, dict):
+        return obj if isinstance(obj, frozendict) else frozendict((k, freeze(v)) for k, v in obj.items())
+    elif isinstance(obj, list):
+        return obj if isinstance(obj, frozenlist) else frozenlist(freeze(x) for x in obj)
+    return obj
+
+
+def thaw(obj):
+    """Recursively convert obj back to mutable dicts and lists."""
+    if isinstance(obj, dict):
+        return {k: thaw(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [thaw(x) for x in obj]
+    return obj
+
+
 def make_hashable(obj):
     if isinstance(obj, (str, bytes)):
         return obj
@@ -592,10 +774,84 @@ def hash_salt_password(password):
     return pw_hash_b64.decode('utf-8'), salt_b64.decode('utf-8')
 
 
-# FIXME: this should probably be moved somewhere else
-def list_valid_plugins(plugin_type):
-    """This will look for files inside a python (sub)package and return a list of names
-    in this package which can be imported."""
+PLUGIN_MANIFEST = 'plugins.json'
+
+_plugins = {}    # type: {plugin_type: CaseInsensitiveAttributeDict}
+_manifests = {}  # type: {plugin_type: manifest}
+_plugins_lock = threading.Lock()
+
+
+def plugin_files(plugin_type):
+    """Return the names of the modules inside a plugins package that are potential plugins."""
+    base_dir = Path(importlib.import_module(plugin_type).__file__).parent
+    return sorted(p.parts[-1][:-3] for p in base_dir.glob('*.py') if not p.parts[-1].startswith('_'))
+
+
+def plugin_hashes(plugin_type):
+    """Return the sha1 of the source of each module inside a plugins package, which is used to
+    check whether its manifest is up to date. type: {module_name: hex digest}"""
+    base_dir = Path(importlib.import_module(plugin_type).__file__).parent
+    return {name: hashlib.sha1((base_dir / '{}.py'.format(name)).read_bytes()).hexdigest()
+            for name in plugin_files(plugin_type)}
+
+
+def plugin_manifest(plugin_type):
+    """Return the contents of the manifest of a plugins package, or None if it doesn't have one
+    or if it is not up to date (ie: a module of the package has been added, removed or modified
+    since it was built).
+
+    The manifest lists the valid plugins of the package along with some metadata about them, so
+    that they can be listed without importing all of them. It can be regenerated using
+    build_plugin_manifest(). type: {plugin_name: {key: value}}"""
+    try:
+        return _manifests[plugin_type]
+    except KeyError:
+        manifest = _manifests[plugin_type] = _read_plugin_manifest(plugin_type)
+        return manifest
+
+
+def _read_plugin_manifest(plugin_type):
+    manifest_file = Path(importlib.import_module(plugin_type).__file__).parent / PLUGIN_MANIFEST
+    try:
+        with open(str(manifest_file)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        log.warning('Invalid plugin manifest {}: {}'.format(manifest_file, e))
+        return None
+
+    if manifest.get('modules') != plugin_hashes(plugin_type):
+        log.debug('Plugin manifest {} is out of date, looking for plugins in all modules'.format(manifest_file))
+        return None
+    return manifest['plugins']
+
+
+def build_plugin_manifest(plugin_type, write=True):
+    """Import all the plugins of the given package and return its manifest. It is also written
+    to the manifest file of the package, unless write is False.
+
+    For plugins defining a short_description() function, it is stored in the manifest."""
+    manifest = {'modules': plugin_hashes(plugin_type), 'plugins': {}}
+    for plugin_name in _scan_valid_plugins(plugin_type):
+        plugin = get_plugin(plugin_type, plugin_name)
+        metadata = {}
+        if hasattr(plugin, 'short_description'):
+            metadata['short_description'] = plugin.short_description()
+        manifest['plugins'][plugin_name] = metadata
+
+    if not write:
+        return manifest
+
+    manifest_file = Path(importlib.import_module(plugin_type).__file__).parent / PLUGIN_MANIFEST
+    with open(str(manifest_file), 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+        f.write('\n')
+    _manifests.pop(plugin_type, None)
+    return manifest
+
+
+def _scan_valid_plugins(plugin_type):
     base_module = importlib.import_module(plugin_type)
     if 'REQUIRED_FUNCTIONS' not in dir(base_module):
         msg = 'Module {} does not look to be a valid plugins directory. It needs to define ' \
@@ -603,42 +859,105 @@ def list_valid_plugins(plugin_type):
         log.error(msg)
         return []
 
-    base_dir = Path(base_module.__file__).parent
     result = []
-    for p in base_dir.glob('*.py'):
-        basename = p.parts[-1]
-        if not basename.startswith('_'):
-            plugin_name = basename[:-3]  # remove trailing '.py'
-            # potential candidate, check for required functions
-            plugin_members = dir(get_plugin(plugin_type, plugin_name))
-            is_valid = True
-            for func in base_module.REQUIRED_FUNCTIONS:
-                if func not in plugin_members:
-                    log.warning('Function {} is not defined for potential plugin {}:{}, not importing it'
-                                .format(func, plugin_type, plugin_name))
-                    is_valid = False
-                    break
-            for var in getattr(base_module, 'REQUIRED_VARS', []):  # REQUIRED_VARS is optional
-                if var not in plugin_members:
-                    log.warning('Variable {} is not defined for potential plugin {}:{}, not importing it'
-                                .format(var, plugin_type, plugin_name))
-                    is_valid = False
-                    break
-            if is_valid:
-                result.append(plugin_name)
+    for plugin_name in plugin_files(plugin_type):
+        # potential candidate, check for required functions
+        plugin_members = dir(get_plugin(plugin_type, plugin_name))
+        is_valid = True
+        for func in base_module.REQUIRED_FUNCTIONS:
+            if func not in plugin_members:
+                log.warning('Function {} is not defined for potential plugin {}:{}, not importing it'
+                            .format(func, plugin_type, plugin_name))
+                is_valid = False
+                break
+        for var in getattr(base_module, 'REQUIRED_VARS', []):  # REQUIRED_VARS is optional
+            if var not in plugin_members:
+                log.warning('Variable {} is not defined for potential plugin {}:{}, not importing it'
+                            .format(var, plugin_type, plugin_name))
+                is_valid = False
+                break
+        if is_valid:
+            result.append(plugin_name)
     return result
 
 
+# FIXME: this should probably be moved somewhere else
+def list_valid_plugins(plugin_type):
+    """This will look for files inside a python (sub)package and return a list of names
+    in this package which can be imported.
+
+    If the package has an up-to-date manifest, the names are read from it instead of importing
+    all the modules of the package."""
+    manifest = plugin_manifest(plugin_type)
+    if manifest is not None:
+        return sorted(manifest)
+    return _scan_valid_plugins(plugin_type)
+
+
+class LazyModule(object):
+    """Proxy for a module that is only imported the first time one of its attributes is accessed."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return '<lazy module {}>'.format(self._name)
+
+
+def lazy_import(name):
+    """Return a proxy for the given module, which is imported on first use. This is used for
+    modules with heavy dependencies (eg: autobahn) that simple commands don't need."""
+    return LazyModule(name)
+
+
 def get_plugin(plugin_type, plugin_name):
     plugin = importlib.import_module('{}.{}'.format(plugin_type, plugin_name))
     return plugin
 
 
 def get_plugin_dict(plugin_type):
-    result = CaseInsensitiveAttributeDict()
-    for plugin_name in list_valid_plugins(plugin_type):
-        result[plugin_name] = get_plugin(plugin_type, plugin_name)
-    return result
+    """Return a dict of all the plugins in the given package, indexed by name.
+
+    It is only built the first time it is requested, use reload_plugins() to look for plugins
+    again. If the package has a manifest, plugins are only imported when first used."""
+    try:
+        return _plugins[plugin_type]
+    except KeyError:
+        pass
+
+    with _plugins_lock:
+        if plugin_type not in _plugins:
+            result = CaseInsensitiveAttributeDict()
+            manifest = plugin_manifest(plugin_type)
+            for plugin_name in (sorted(manifest) if manifest is not None else _scan_valid_plugins(plugin_type)):
+                result[plugin_name] = (lazy_import('{}.{}'.format(plugin_type, plugin_name))
+                                       if manifest is not None else get_plugin(plugin_type, plugin_name))
+            _plugins[plugin_type] = result
+        return _plugins[plugin_type]
+
+
+def plugin_metadata(plugin_type, plugin_name):
+    """Return the metadata stored in the manifest for the given plugin, or an empty dict if there is none."""
+    return (plugin_manifest(plugin_type) or {}).get(plugin_name, {})
+
+
+def reload_plugins(plugin_type=None):
+    """Forget the plugins found for the given package (or for all of them), so that they are
+    looked for again on the next call to get_plugin_dict()."""
+    with _plugins_lock:
+        if plugin_type is None:
+            _plugins.clear()
+            _manifests.clear()
+        else:
+            _plugins.pop(plugin_type, None)
+            _manifests.pop(plugin_type, None)
+    importlib.invalidate_caches()
 
 
 def replace_in_file(filename, old, new, **kwargs):
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bts_tools - Tools to easily manage the bitshares client
+# Copyright (c) 2018 Nicolas Wack <wackou@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Concurrent fetching of the feed prices from the feed providers.
+
+All the requests of a cycle are started at once on an asyncio event loop, and run in a thread
+pool as the feed providers are written as blocking functions. The number of requests running at
+the same time is limited globally and for each provider, and the requests which are still
+running once the timeout for the cycle has elapsed are cancelled, so that a slow provider can't
+delay the whole cycle.
+
+A thread can't be interrupted, so the HTTP requests done through ``ProviderContext.get()`` also
+have their timeout shortened to the time left in the cycle: the worker thread of a cancelled
+request is then freed at the end of the cycle instead of up to ``HTTP_TIMEOUT`` seconds later.
+"""
+
+from . import core
+from .feed_providers import FeedPrice, FeedSet, request_deadline
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_CONCURRENT = 16    # max number of requests running at the same time
+DEFAULT_MAX_PER_PROVIDER = 2   # max number of requests running at the same time on a single provider
+DEFAULT_TIMEOUT = 90           # time after which the requests still running are cancelled, in seconds
+
+
+def fetch_settings():
+    """Return the settings of the fetch engine, from the ``monitoring.feeds.fetch`` section of the config"""
+    cfg = {'max_concurrent': DEFAULT_MAX_CONCURRENT,
+           'max_per_provider': DEFAULT_MAX_PER_PROVIDER,
+           'timeout': DEFAULT_TIMEOUT}
+    cfg.update(((core.config or {}).get('monitoring') or {}).get('feeds', {}).get('fetch') or {})
+    return cfg
+
+
+def provider_name(provider):
+    return getattr(provider, 'NAME', getattr(provider, '__name__', str(provider)))
+
+
+def call_provider(provider, asset, base, node=None):
+    """Call the feed provider according to the functions it implements, and return a FeedSet:
+
+     - ``get(asset, base, node)`` if it defines ``REQUIRES_NODE = True``
+     - ``get_all(asset_list, base)`` if asset is a list of assets
+     - ``get(asset, base)`` otherwise
+    """
+    if getattr(provider, 'REQUIRES_NODE', False) is True:
+        feeds = provider.get(asset, base, node)
+    elif isinstance(asset, str):
+        feeds = provider.get(asset, base)
+    else:
+        feeds = provider.get_all(asset, base)
+
+    if isinstance(feeds, FeedPrice):
+        feeds = FeedSet([feeds])
+    return feeds
+
+
+def _call_before(deadline, func, *args):
+    with request_deadline(deadline):
+        return func(*args)
+
+
+async def run_jobs(jobs, executor, max_concurrent=DEFAULT_MAX_CONCURRENT,
+                   max_per_provider=DEFAULT_MAX_PER_PROVIDER, timeout=DEFAULT_TIMEOUT):
+    """Run the given jobs concurrently in the executor, and return the list of their results in
+    the same order. The result of a job that failed or was cancelled is the exception it raised.
+
+    Each job is a tuple (provider, func, args). A provider module can define
+    ``MAX_CONCURRENT_REQUESTS`` to override ``max_per_provider``."""
+    loop = asyncio.get_event_loop()
+    deadline = time.monotonic() + timeout
+    global_limit = asyncio.Semaphore(max_concurrent)
+    provider_limits = {}
+
+    async def run(provider, func, args):
+        name = provider_name(provider)
+        if name not in provider_limits:
+            provider_limits[name] = asyncio.Semaphore(getattr(provider, 'MAX_CONCURRENT_REQUESTS', max_per_provider))
+        async with provider_limits[name]:
+            async with global_limit:
+                return await loop.run_in_executor(executor, _call_before, deadline, func, *args)
+
+    tasks = [asyncio.ensure_future(run(*job)) for job in jobs]
+    if not tasks:
+        return []
+
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+    finally:
+        # also cancel the jobs if we are cancelled ourselves
+        for task in tasks:
+            task.cancel()
+
+    for task, (provider, func, args) in zip(tasks, jobs):
+        if task in pending:
+            log.debug('Cancelling request to {}: no reply after {}s'.format(provider_name(provider), timeout))
+    if pending:
+        await asyncio.wait(pending)
+
+    return [asyncio.TimeoutError('no reply after {}s'.format(timeout)) if task.cancelled()
+            else task.exception() or task.result()
+            for task in tasks]
+
+
+def run(jobs, max_concurrent=None, max_per_provider=None, timeout=None):
+    """Run the given jobs (see run_jobs()) on a new event loop and return their results.
+
+    Settings which are not given are taken from the config, see fetch_settings()."""
+    cfg = fetch_settings()
+    max_concurrent = max_concurrent or cfg['max_concurrent']
+    max_per_provider = max_per_provider or cfg['max_per_provider']
+    timeout = timeout or cfg['timeout']
+
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=max_concurrent)
+    try:
+        return loop.run_until_complete(run_jobs(jobs, executor, max_concurrent, max_per_provider, timeout))
+    finally:
+        # don't wait for the threads of the cancelled requests, their HTTP requests time out at
+        # the end of the cycle anyway (see request_deadline())
+        executor.shutdown(wait=False)
+        loop.close()
+
+
+def fetch_feeds(markets, feed_providers, node=None, **kwargs):
+    """Fetch the feed prices for the given list of (asset, base, provider_name) and return a FeedSet
+    with all of them. ``asset`` can be a list of assets for providers implementing ``get_all()``.
+
+    Keyword arguments are passed to run()."""
+    result = FeedSet()
+    jobs = [(feed_providers[provider], call_provider, (feed_providers[provider], asset, base, node))
+            for asset, base, provider in markets]
+
+    for (asset, base, provider), feeds in zip(markets, run(jobs, **kwargs)):
+        if isinstance(feeds, Exception):
+            log.warning('Could not fetch {}/{} on {}: {}'.format(asset, base, provider, feeds))
+            continue
+        result += feeds
+        log.debug('Provider {} got feeds: {}'.format(provider, feeds))
+
+    return result
@@ -23,11 +23,18 @@
 
 from importlib import import_module
 from functools import wraps
+from requests.adapters import HTTPAdapter
 from requests.exceptions import Timeout
 from collections.abc import Sequence, Set
+from urllib.parse import urlsplit
+from contextlib import contextmanager
 from .. import core
-import inspect
 import functools
+import itertools
+import threading
+import time
+import requests
+import sys
 import statistics
 import pendulum
 import logging
@@ -42,6 +49,63 @@ REQUIRED_VARS = ['NAME', 'AVAILABLE_MARKETS']
 
 PROVIDER_STATES = {}
 
+HTTP_POOL_SIZE = 4      # number of keep-alive connections kept open to each feed provider host
+HTTP_TIMEOUT = 60       # default timeout for the requests to the feed providers, in seconds
+
+_http_sessions = {}     # type: {host: requests.Session}
+_http_sessions_lock = threading.Lock()
+
+_cycle = threading.local()   # deadline of the fetch cycle the current thread is running a request for
+
+
+@contextmanager
+def request_deadline(deadline):
+    """Make the requests done with ``ProviderContext.get()`` in the current thread give up at the
+    given deadline (a ``time.monotonic()`` value), so that they can't outlive their fetch cycle."""
+    previous = getattr(_cycle, 'deadline', None)
+    _cycle.deadline = deadline
+    try:
+        yield
+    finally:
+        _cycle.deadline = previous
+
+
+def http_timeout(timeout=HTTP_TIMEOUT):
+    """Return the given request timeout, shortened to the time left before the deadline of the
+    current fetch cycle if any. Raise Timeout if there is no time left."""
+    deadline = getattr(_cycle, 'deadline', None)
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise Timeout('no time left in the fetch cycle')
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):  # (connect, read) timeouts
+        return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+    return min(timeout, remaining)
+
+
+def http_session(url):
+    """Return the keep-alive HTTP session used for talking to the host of the given url, so that
+    connections to the feed providers are reused from one request to the next."""
+    host = urlsplit(url).netloc
+    try:
+        return _http_sessions[host]
+    except KeyError:
+        pass
+
+    with _http_sessions_lock:
+        session = _http_sessions.get(host)
+        if session is None:
+            log.debug('Creating HTTP session for feed provider host {}'.format(host))
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _http_sessions[host] = session
+        return session
+
 
 def function_call_str(module, func_name, args, kwargs):
     args_str = ', '.join(str(arg) for arg in args)
@@ -145,16 +209,7 @@ def reuse_last_value_on_fail(f):
     return wrapper
 
 
-def to_bts(asset):
-    """The API for FeedProvider requires that all assets be named using their BTS denomination.
-    However, certain providers use other names (eg: GOLD vs. XAG), and this method provides a way
-    to convert an asset from its internal representation to its BTS representation."""
-
-    frm = inspect.stack()[1]
-    mod = inspect.getmodule(frm[0])
-    #print('[%s] %s' % (mod.__name__, ''))
-    asset_map = getattr(mod, 'ASSET_MAP', {})
-
+def _convert_to_bts(asset_map, asset):
     asset = asset.upper()
     for b, y in asset_map.items():
         if asset == y:
@@ -162,17 +217,64 @@ def to_bts(asset):
     return asset
 
 
+def _convert_from_bts(asset_map, asset):
+    asset = asset.upper()
+    return asset_map.get(asset, asset)
+
+
+def to_bts(asset):
+    """The API for FeedProvider requires that all assets be named using their BTS denomination.
+    However, certain providers use other names (eg: GOLD vs. XAG), and this method provides a way
+    to convert an asset from its internal representation to its BTS representation.
+
+    The ASSET_MAP is looked up in the module of the caller, prefer using ``ProviderContext.to_bts``."""
+    return _convert_to_bts(sys._getframe(1).f_globals.get('ASSET_MAP', {}), asset)
+
+
 def from_bts(asset):
     """The API for FeedProvider requires that all assets be named using their BTS denomination.
     However, certain providers use other names (eg: GOLD vs. XAG), and this method provides a way
-    to convert an asset from its BTS representation to its internal representation."""
-    frm = inspect.stack()[1]
-    mod = inspect.getmodule(frm[0])
-    #print('[%s] %s' % (mod.__name__, ''))
-    asset_map = getattr(mod, 'ASSET_MAP', {})
+    to convert an asset from its BTS representation to its internal representation.
 
-    asset = asset.upper()
-    return asset_map.get(asset, asset)
+    The ASSET_MAP is looked up in the module of the caller, prefer using ``ProviderContext.from_bts``."""
+    return _convert_from_bts(sys._getframe(1).f_globals.get('ASSET_MAP', {}), asset)
+
+
+class ProviderContext(object):
+    """Bind the name and asset map of a feed provider, so that the feed prices it creates and the
+    asset conversions it does don't need to look for them in the calling module.
+
+    A feed provider module creates one after having defined its NAME and ASSET_MAP:
+
+        ctx = ProviderContext(NAME, ASSET_MAP)
+
+    and then uses ``ctx.feed_price()``, ``ctx.to_bts()`` and ``ctx.from_bts()``, and ``ctx.get()``
+    for its HTTP requests."""
+
+    def __init__(self, name, asset_map=None):
+        self.name = name
+        self.asset_map = asset_map or {}
+        # the first BTS asset mapping to a given name wins, as in to_bts()
+        self._reverse_map = {y: b for b, y in reversed(list(self.asset_map.items()))}
+
+    def feed_price(self, price, asset, base, volume=None, last_updated=None):
+        return FeedPrice(price, asset, base, volume=volume, last_updated=last_updated, provider=self.name)
+
+    def to_bts(self, asset):
+        asset = asset.upper()
+        return self._reverse_map.get(asset, asset)
+
+    def from_bts(self, asset):
+        return _convert_from_bts(self.asset_map, asset)
+
+    def get(self, url, **kwargs):
+        """Same as requests.get(), but reuses the connections to the provider host and doesn't
+        wait past the deadline of the current fetch cycle."""
+        kwargs['timeout'] = http_timeout(kwargs.get('timeout', HTTP_TIMEOUT))
+        return http_session(url).get(url, **kwargs)
+
+    def __repr__(self):
+        return '<ProviderContext: {}>'.format(self.name)
 
 
 class FeedPrice(object):
@@ -180,6 +282,8 @@ class FeedPrice(object):
 
     volume should be represented as number of <asset> units, not <base>."""
 
+    __slots__ = ('price', 'asset', 'base', 'volume', 'last_updated', 'provider')
+
     def __init__(self, price, asset, base, volume=None, last_updated=None, provider=None):
         self.price = price
         self.asset = asset
@@ -189,11 +293,8 @@ class FeedPrice(object):
         self.provider = provider
 
         if self.provider is None:
-            # try to get the module from the call stack
-            frm = inspect.stack()[1]
-            mod = inspect.getmodule(frm[0])
-            name = getattr(mod, 'NAME', None)
-            self.provider = name
+            # try to get the provider name from the module of the caller
+            self.provider = sys._getframe(1).f_globals.get('NAME')
 
     @staticmethod
     def from_graphene_tx(tx):
@@ -238,25 +339,135 @@ class FeedPrice(object):
         return '<{}>'.format(str(self))
 
 
+def _matches(value, criterion):
+    if criterion is None:
+        return True
+    if isinstance(criterion, str):
+        return value == criterion
+    if isinstance(criterion, (Sequence, Set)):
+        return value in criterion
+    return True
+
+
 class FeedSet(list):
+    """A list of FeedPrice which also maintains an index of the positions of its feeds by market
+    (asset, base) and by provider, so that looking up the prices for a market doesn't need to go
+    through the whole list.
+
+    Appending to the FeedSet updates the index, other modifications of the list rebuild it
+    the next time it is needed."""
     # NOTE: use list for now and not set because we're not sure what to hash or use for __eq__
 
-    def filter(self, asset=None, base=None):
-        """Returns a new FeedSet containing only the feed prices about the given market(s)"""
-        def is_valid(f):
-            if asset is not None:
-                if isinstance(asset, str) and f.asset != asset:
-                    return False
-                elif isinstance(asset, (Sequence, Set)) and f.asset not in asset:
-                    return False
-            if base is not None:
-                if isinstance(base, str) and f.base != base:
-                    return False
-                elif isinstance(base, (Sequence, Set)) and f.base not in base:
-                    return False
-            return True
-
-        return FeedSet([f for f in self if is_valid(f)])
+    def __init__(self, feeds=()):
+        super().__init__()
+        self._market_index = {}    # type: {(asset, base): [position]}
+        self._provider_index = {}  # type: {provider: [position]}
+        self.extend(feeds)
+
+    def __reduce__(self):
+        return self.__class__, (list(self),)
+
+    def _index_feed(self, pos, f):
+        self._market_index.setdefault((f.asset, f.base), []).append(pos)
+        self._provider_index.setdefault(f.provider, []).append(pos)
+
+    def _invalidate_index(self):
+        self._market_index = None
+        self._provider_index = None
+
+    def _index(self):
+        if self._market_index is None:
+            self._market_index = {}
+            self._provider_index = {}
+            for pos, f in enumerate(self):
+                self._index_feed(pos, f)
+        return self._market_index, self._provider_index
+
+    # list modifications
+
+    def append(self, f):
+        super().append(f)
+        if self._market_index is not None:
+            self._index_feed(len(self) - 1, f)
+
+    def extend(self, feeds):
+        for f in feeds:
+            self.append(f)
+
+    def __iadd__(self, feeds):
+        self.extend(feeds)
+        return self
+
+    def insert(self, pos, f):
+        super().insert(pos, f)
+        self._invalidate_index()
+
+    def remove(self, f):
+        super().remove(f)
+        self._invalidate_index()
+
+    def pop(self, pos=-1):
+        self._invalidate_index()
+        return super().pop(pos)
+
+    def clear(self):
+        super().clear()
+        self._market_index = {}
+        self._provider_index = {}
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._invalidate_index()
+
+    def reverse(self):
+        super().reverse()
+        self._invalidate_index()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._invalidate_index()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._invalidate_index()
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self._invalidate_index()
+        return self
+
+    # lookups
+
+    def markets(self):
+        """Return the list of (asset, base) markets for which this FeedSet has feed prices"""
+        market_index, _ = self._index()
+        return list(market_index)
+
+    def filter(self, asset=None, base=None, provider=None):
+        """Returns a new FeedSet containing only the feed prices about the given market(s),
+        and optionally coming from the given provider(s)"""
+        market_index, provider_index = self._index()
+
+        if isinstance(asset, str) and isinstance(base, str):
+            positions = market_index.get((asset, base), [])
+        elif asset is None and base is None:
+            positions = None
+        else:
+            positions = sorted(itertools.chain.from_iterable(
+                pos for (a, b), pos in market_index.items() if _matches(a, asset) and _matches(b, base)))
+
+        if provider is not None:
+            providers = [provider] if isinstance(provider, str) else provider
+            by_provider = sorted(itertools.chain.from_iterable(provider_index.get(p, []) for p in providers))
+            if positions is None:
+                positions = by_provider
+            else:
+                by_provider = set(by_provider)
+                positions = [pos for pos in positions if pos in by_provider]
+
+        if positions is None:
+            return FeedSet(self)
+        return FeedSet(self[pos] for pos in positions)
 
     def _price(self):
         if len(self) == 0:
@@ -273,16 +484,17 @@ class FeedSet(list):
             raise ValueError('FeedSet is empty, can\'t compute price...')
 
         # check that if asset=None or base=None then there is no ambiguity
+        markets = self.markets()
         if asset is None:
-            asset_list = [f.asset for f in self]
-            if asset_list.count(asset_list[0]) != len(asset_list):  # they're not all equal
+            asset_list = {a for a, b in markets}
+            if len(asset_list) > 1:
                 raise ValueError('asset=None: cannot decide which asset to use for computing the price: {}'
-                                 .format(set(asset_list)))
+                                 .format(asset_list))
         if base is None:
-            base_list = [f.base for f in self]
-            if base_list.count(base_list[0]) != len(base_list):  # they're not all equal
+            base_list = {b for a, b in markets}
+            if len(base_list) > 1:
                 raise ValueError('base=None: cannot decide which base to use for computing the price: {}'
-                                 .format(set(base_list)))
+                                 .format(base_list))
 
         asset = asset or self[0].asset
         base = base or self[0].base
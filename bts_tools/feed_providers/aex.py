@@ -18,8 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, check_market, FeedSet
-import requests
+from . import ProviderContext, check_online_status, check_market, FeedSet
 import logging
 
 log = logging.getLogger(__name__)
@@ -28,6 +27,8 @@ NAME = 'AEX'
 
 AVAILABLE_MARKETS = [('BTS', 'BTC')]
 
+ctx = ProviderContext(NAME)
+
 
 def get_all(self, base):
     # FIXME: implement me
@@ -42,8 +43,8 @@ def get(asset, base):
     headers = {'content-type': 'application/json',
                'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:22.0) Gecko/20100101 Firefox/22.0'}
 
-    data = requests.get('http://api.aex.com/ticker.php?c={}&mk_type={}'.format(asset.lower(), base.lower()),
-                        headers=headers).json()
+    data = ctx.get('http://api.aex.com/ticker.php?c={}&mk_type={}'.format(asset.lower(), base.lower()),
+                   headers=headers).json()
     data = data['ticker']
 
-    return FeedPrice(float(data['last']), asset, base, volume=float(data['vol']))
+    return ctx.feed_price(float(data['last']), asset, base, volume=float(data['vol']))
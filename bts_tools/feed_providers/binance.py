@@ -18,8 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, check_market
-import requests
+from . import ProviderContext, check_online_status, check_market
 import logging
 
 log = logging.getLogger(__name__)
@@ -29,6 +28,9 @@ NAME = 'Binance'
 
 AVAILABLE_MARKETS = [('BTS', 'BTC')]
 
+ctx = ProviderContext(NAME)
+
+
 def get_all(self, base):
     # FIXME: implement me
     # does not include volume information...
@@ -39,6 +41,6 @@ def get_all(self, base):
 @check_market
 def get(asset, base):
     log.debug('checking feeds for %s/%s at %s' % (asset, base, NAME))
-    data = requests.get('https://api.binance.com/api/v1/ticker/24hr?symbol={}{}'.format(asset, base)).json()
+    data = ctx.get('https://api.binance.com/api/v1/ticker/24hr?symbol={}{}'.format(asset, base)).json()
 
-    return FeedPrice(float(data['lastPrice']), asset, base, float(data['volume']))
+    return ctx.feed_price(float(data['lastPrice']), asset, base, float(data['volume']))
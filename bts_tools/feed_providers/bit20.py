@@ -18,7 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, check_market, FeedSet
+from . import ProviderContext, FeedPrice, check_online_status, check_market, FeedSet
 from .. import core, feeds, rpcutils
 import pendulum
 import re
@@ -31,6 +31,9 @@ NAME = 'Bit20'
 
 AVAILABLE_MARKETS = [('BTWTY', 'USD')]
 
+ctx = ProviderContext(NAME)
+
+
 def is_valid_bit20_publication(trx):
     """
     check that the transaction is a valid one, ie:
@@ -222,4 +225,4 @@ REQUIRES_NODE = True
 def get(asset, base, node):
     log.debug('checking feeds for %s/%s at %s' % (asset, base, NAME))
 
-    return FeedPrice(get_bit20_feed_usd(node), asset, base)
+    return ctx.feed_price(get_bit20_feed_usd(node), asset, base)
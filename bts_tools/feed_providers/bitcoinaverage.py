@@ -18,7 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, check_market, cachedmodulefunc
+from . import ProviderContext, check_online_status, check_market, cachedmodulefunc
 from .. import core
 from bitcoinaverage import RestfulClient
 from cachetools import TTLCache
@@ -33,6 +33,8 @@ AVAILABLE_MARKETS = [('BTC', 'USD')]
 
 _cache = TTLCache(maxsize=8192, ttl=1200)  # 20 minutes should work for the free plan, developer plan can get rid of the cache if wanted
 
+ctx = ProviderContext(NAME)
+
 
 @check_online_status
 @cachedmodulefunc
@@ -52,6 +54,5 @@ def get(cur, base):
     client = RestfulClient(secret_key=secret_key, public_key=public_key)
     r = client.ticker_short_local()[cur + base]
 
-    return FeedPrice(float(r['last']), cur, base,
-                     last_updated=pendulum.from_timestamp(r['timestamp']),
-                     provider=NAME)
+    return ctx.feed_price(float(r['last']), cur, base,
+                          last_updated=pendulum.from_timestamp(r['timestamp']))
@@ -18,8 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, check_market
-import requests
+from . import ProviderContext, check_online_status, check_market
 import logging
 
 log = logging.getLogger(__name__)
@@ -30,10 +29,13 @@ AVAILABLE_MARKETS = [('BTC', 'USD')]
 
 TIMEOUT = 60
 
+ctx = ProviderContext(NAME)
+
+
 @check_online_status
 @check_market
 def get(cur, base):
     log.debug('checking feeds for %s/%s at %s' % (cur, base, NAME))
-    r = requests.get('https://api.bitfinex.com/v1/pubticker/{}{}'.format(cur.lower(), base.lower()),
-                     timeout=TIMEOUT).json()
-    return FeedPrice(float(r['last_price']), cur, base, float(r['volume']))
+    r = ctx.get('https://api.bitfinex.com/v1/pubticker/{}{}'.format(cur.lower(), base.lower()),
+                timeout=TIMEOUT).json()
+    return ctx.feed_price(float(r['last_price']), cur, base, float(r['volume']))
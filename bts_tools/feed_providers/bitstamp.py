@@ -19,8 +19,7 @@
 #
 
 
-from . import FeedPrice, check_online_status, check_market
-import requests
+from . import ProviderContext, check_online_status, check_market
 import logging
 
 log = logging.getLogger(__name__)
@@ -29,10 +28,13 @@ NAME = 'Bitstamp'
 AVAILABLE_MARKETS = [('BTC', 'USD')]
 TIMEOUT = 60
 
+ctx = ProviderContext(NAME)
+
+
 @check_online_status
 @check_market
 def get(cur, base):
     log.debug('checking feeds for %s/%s at %s' % (cur, base, NAME))
-    r = requests.get('https://www.bitstamp.net/api/ticker/',
-                     timeout=TIMEOUT).json()
-    return FeedPrice(float(r['last']), cur, base, volume=float(r['volume']))
+    r = ctx.get('https://www.bitstamp.net/api/ticker/',
+                timeout=TIMEOUT).json()
+    return ctx.feed_price(float(r['last']), cur, base, volume=float(r['volume']))
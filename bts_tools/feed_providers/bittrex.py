@@ -18,9 +18,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, from_bts, check_market
+from . import ProviderContext, check_online_status, check_market
 import pendulum
-import requests
 import logging
 
 log = logging.getLogger(__name__)
@@ -33,18 +32,20 @@ ASSET_MAP = {'GRIDCOIN': 'GRC'}
 
 TIMEOUT = 60
 
+ctx = ProviderContext(NAME, ASSET_MAP)
+
+
 @check_online_status
 @check_market
 def get(cur, base):
     log.debug('checking feeds for %s/%s at %s' % (cur, base, NAME))
-    r = requests.get(
-        'https://bittrex.com/api/v1.1/public/getmarketsummary?market={}-{}'.format(base, from_bts(cur)),
+    r = ctx.get(
+        'https://bittrex.com/api/v1.1/public/getmarketsummary?market={}-{}'.format(base, ctx.from_bts(cur)),
         timeout=TIMEOUT).json()
 
     summary = r['result'][0]
     # log.debug('Got feed price for {}: {} (from bittrex)'.format(cur, summary['Last']))
-    return FeedPrice(summary['Last'],
-                     cur, base,
-                     volume=summary['Volume'],
-                     last_updated=pendulum.from_format(summary['TimeStamp'].split('.')[0], '%Y-%m-%dT%H:%M:%S'),
-                     provider=NAME)
+    return ctx.feed_price(summary['Last'],
+                          cur, base,
+                          volume=summary['Volume'],
+                          last_updated=pendulum.from_format(summary['TimeStamp'].split('.')[0], '%Y-%m-%dT%H:%M:%S'))
@@ -18,9 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, from_bts, to_bts
-from bs4 import BeautifulSoup
-import requests
+from . import ProviderContext, check_online_status
 import logging
 
 log = logging.getLogger(__name__)
@@ -39,13 +37,17 @@ ASSET_MAP = {'SHENZHEN': 'SZCOMP:IND',
 
 AVAILABLE_MARKETS = [('SHENZHEN', 'CNY'), ('NIKKEI', 'JPY')]
 
+ctx = ProviderContext(NAME, ASSET_MAP)
+
+
 @check_online_status
 def query_quote(q, base_currency=None):
     log.debug('checking quote for %s at %s' % (q, NAME))
-    r = requests.get(_BLOOMBERG_URL.format(from_bts(q)))
+    from bs4 import BeautifulSoup
+    r = ctx.get(_BLOOMBERG_URL.format(ctx.from_bts(q)))
     soup = BeautifulSoup(r.text, 'html.parser')
     r = float(soup.find(class_='price').text.replace(',', ''))
-    return FeedPrice(q, base_currency, r)
+    return ctx.feed_price(q, base_currency, r)
 
 
 def get(asset, base):
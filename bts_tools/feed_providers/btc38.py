@@ -19,7 +19,7 @@
 #
 
 
-from . import FeedPrice, check_online_status, reuse_last_value_on_fail, check_market
+from . import ProviderContext, check_online_status, reuse_last_value_on_fail, check_market
 from retrying import retry
 import requests
 import logging
@@ -30,6 +30,8 @@ NAME = 'Btc38'
 
 AVAILABLE_MARKETS = [('BTS', 'BTC'), ('BTS', 'CNY'), ('BTC', 'CNY')]
 
+ctx = ProviderContext(NAME)
+
 
 @check_online_status
 @reuse_last_value_on_fail
@@ -41,10 +43,10 @@ def get(cur, base):
     log.debug('checking feeds for %s/%s at %s' % (cur, base, NAME))
     headers = {'content-type': 'application/json',
                'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:22.0) Gecko/20100101 Firefox/22.0'}
-    r = requests.get('http://api.btc38.com/v1/ticker.php',
-                     timeout=10,
-                     params={'c': cur.lower(), 'mk_type': base.lower()},
-                     headers=headers)
+    r = ctx.get('http://api.btc38.com/v1/ticker.php',
+                timeout=10,
+                params={'c': cur.lower(), 'mk_type': base.lower()},
+                headers=headers)
     try:
         # see: http://stackoverflow.com/questions/24703060/issues-reading-json-from-txt-file
         r.encoding = 'utf-8-sig'
@@ -52,7 +54,6 @@ def get(cur, base):
     except ValueError:
         log.error('Could not decode response from btc38: %s' % r.text)
         raise
-    return FeedPrice(float(r['ticker']['last']),  # TODO: (bid + ask) / 2 ?
-                     cur, base,
-                     volume=float(r['ticker']['vol']),
-                     provider=NAME)
+    return ctx.feed_price(float(r['ticker']['last']),  # TODO: (bid + ask) / 2 ?
+                          cur, base,
+                          volume=float(r['ticker']['vol']))
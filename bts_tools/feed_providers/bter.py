@@ -19,8 +19,7 @@
 #
 
 
-from . import FeedPrice, check_online_status, check_market
-import requests
+from . import ProviderContext, check_online_status, check_market
 import logging
 
 log = logging.getLogger(__name__)
@@ -29,13 +28,15 @@ NAME = 'Bter'
 AVAILABLE_MARKETS = [('BTS', 'BTC'), ('BTS', 'CNY'), ('BTC', 'CNY')]
 TIMEOUT = 60
 
+ctx = ProviderContext(NAME)
+
+
 @check_online_status
 @check_market
 def get(cur, base):
     log.debug('checking feeds for %s/%s at %s' % (cur, base, NAME))
-    r = requests.get('http://data.bter.com/api/1/ticker/%s_%s' % (cur.lower(), base.lower()),
-                     timeout=TIMEOUT).json()
-    return FeedPrice(float(r['last']) or ((float(r['sell']) + float(r['buy'])) / 2),
-                     cur, base,
-                     volume=float(r['vol_%s' % cur.lower()]),
-                     provider=NAME)
+    r = ctx.get('http://data.bter.com/api/1/ticker/%s_%s' % (cur.lower(), base.lower()),
+                timeout=TIMEOUT).json()
+    return ctx.feed_price(float(r['last']) or ((float(r['sell']) + float(r['buy'])) / 2),
+                          cur, base,
+                          volume=float(r['vol_%s' % cur.lower()]))
@@ -18,7 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, check_market, FeedSet, to_bts
+from . import ProviderContext, check_online_status, check_market, FeedSet
 from retrying import retry
 import pendulum
 import requests
@@ -35,6 +35,9 @@ ASSET_MAP = {'MIOTA': 'IOT'}
 
 TIMEOUT = 60
 
+ctx = ProviderContext(NAME, ASSET_MAP)
+
+
 @check_online_status
 @retry(retry_on_exception=lambda e: isinstance(e, requests.exceptions.Timeout),
        wait_exponential_multiplier=5000,
@@ -44,7 +47,7 @@ def get(cur, base):
     log.debug('checking feeds for %s/%s at %s' % (cur, base, NAME))
 
     if cur == 'ALTCAP':
-        r = requests.get('http://www.coincap.io/global', timeout=TIMEOUT).json()
+        r = ctx.get('http://www.coincap.io/global', timeout=TIMEOUT).json()
 
         btc_cap = float(r['btcCap'])
         alt_cap = float(r['altCap'])
@@ -56,18 +59,17 @@ def get(cur, base):
         log.debug('{} - ALTCAP price: {}'.format(NAME, price))
 
     else:
-        bts = requests.get('http://coincap.io/page/{}'.format(cur)).json()
+        bts = ctx.get('http://coincap.io/page/{}'.format(cur)).json()
         price = bts['price_{}'.format(base.lower())]
 
-    return FeedPrice(price, cur, base)
+    return ctx.feed_price(price, cur, base)
 
 
 def get_all():
-    feeds = requests.get('http://www.coincap.io/front').json()
+    feeds = ctx.get('http://www.coincap.io/front').json()
     result = FeedSet()
     for f in feeds:
-        result.append(FeedPrice(float(f['price']), to_bts(f['short']), 'USD',
-                                volume=float(f['usdVolume']) / float(f['price']),
-                                #last_updated=pendulum.from_timestamp(f['time'] / 1000),  # FIXME: time not present
-                                provider=NAME))
+        result.append(ctx.feed_price(float(f['price']), ctx.to_bts(f['short']), 'USD',
+                                     #last_updated=pendulum.from_timestamp(f['time'] / 1000),  # FIXME: time not present
+                                     volume=float(f['usdVolume']) / float(f['price'])))
     return result
@@ -18,11 +18,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, FeedSet, from_bts, to_bts, check_market
+from . import ProviderContext, check_online_status, FeedSet, check_market
 from .. import core
 import json
 import pendulum
-import requests
 import logging
 
 log = logging.getLogger(__name__)
@@ -36,13 +35,16 @@ ASSET_MAP = {'BTC': 'bitcoin',
              'BTS': 'bitshares'
              }
 
+ctx = ProviderContext(NAME, ASSET_MAP)
+
+
 @check_online_status
 #@check_market
 def get(cur, base):
     log.debug('checking feeds for %s/%s at %s' % (cur, base, NAME))
 
     if cur == 'ALTCAP':
-        r = requests.get('https://api.coinmarketcap.com/v1/global/').json()
+        r = ctx.get('https://api.coinmarketcap.com/v1/global/').json()
         btc_cap = r['bitcoin_percentage_of_market_cap']
         alt_cap = 100 - btc_cap
         price = btc_cap / alt_cap
@@ -52,21 +54,21 @@ def get(cur, base):
         log.debug('{} - ALTCAP price: {}'.format(NAME, price))
 
     else:
-        r = requests.get('https://api.coinmarketcap.com/v1/ticker/{}/?convert={}'.format(from_bts(cur), base)).json()
+        r = ctx.get('https://api.coinmarketcap.com/v1/ticker/{}/?convert={}'.format(ctx.from_bts(cur), base)).json()
         price = float(r[0]['price_{}'.format(base.lower())])
 
-    return FeedPrice(price, cur, base)
+    return ctx.feed_price(price, cur, base)
 
 
 def get_all():
-    feeds = requests.get('https://api.coinmarketcap.com/v1/ticker/').json()
+    feeds = ctx.get('https://api.coinmarketcap.com/v1/ticker/').json()
     result = FeedSet()
     for f in feeds:
         try:
             price = float(f['price_usd'])
             volume = float(f['24h_volume_usd']) / price if f.get('24h_volume_usd') else None
-            result.append(FeedPrice(price, f['symbol'], 'USD', volume=volume,
-                                    last_updated=pendulum.from_timestamp(int(f['last_updated']))))
+            result.append(ctx.feed_price(price, f['symbol'], 'USD', volume=volume,
+                                         last_updated=pendulum.from_timestamp(int(f['last_updated']))))
         except TypeError as e:
             # catches: TypeError: float() argument must be a string or a number, not 'NoneType'
             # on: f['price_usd']
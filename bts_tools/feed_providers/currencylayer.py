@@ -18,12 +18,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, cachedmodulefunc, FeedSet, check_market
-from . import from_bts, to_bts
+from . import ProviderContext, check_online_status, cachedmodulefunc, FeedSet, check_market
 from .. import core
 from ..feeds import FIAT_ASSETS
 from cachetools import TTLCache
-import requests
 import logging
 
 log = logging.getLogger(__name__)
@@ -40,6 +38,7 @@ ASSET_MAP = {'GOLD': 'XAU',
 # TTL = 2 hours, max requests per month = 12 * 30 < 1000, allows for free account
 _cache = TTLCache(maxsize=8192, ttl=7200)
 
+ctx = ProviderContext(NAME, ASSET_MAP)
 
 
 @check_online_status
@@ -47,7 +46,7 @@ _cache = TTLCache(maxsize=8192, ttl=7200)
 @check_market
 def get_all(asset_list, base):
     log.debug('checking feeds for %s / %s at CurrencyLayer' % (' '.join(asset_list), base))
-    asset_list = [from_bts(asset) for asset in asset_list]
+    asset_list = [ctx.from_bts(asset) for asset in asset_list]
     base = base.upper()
 
     try:
@@ -56,13 +55,13 @@ def get_all(asset_list, base):
         raise KeyError('config.yaml does not specify a "credentials.currencylayer.access_key" variable')
 
     url = 'http://apilayer.net/api/live?access_key={}&currencies={}'.format(access_key, ','.join(asset_list))
-    r = requests.get(url).json()
+    r = ctx.get(url).json()
     if not r['success']:
         error = r['error']
         raise ValueError('Error code {}: {}'.format(error['code'], error['info']))
 
-    return FeedSet(FeedPrice(1 / r['quotes']['USD{}'.format(asset)],
-                             to_bts(asset), base)
+    return FeedSet(ctx.feed_price(1 / r['quotes']['USD{}'.format(asset)],
+                                  ctx.to_bts(asset), base)
                    for asset in asset_list)
 
 @check_online_status
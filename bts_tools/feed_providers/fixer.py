@@ -18,10 +18,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, cachedmodulefunc, FeedSet, check_market
+from . import ProviderContext, check_online_status, cachedmodulefunc, FeedSet, check_market
 from ..feeds import FIAT_ASSETS
 from cachetools import TTLCache
-import requests
 import logging
 
 log = logging.getLogger(__name__)
@@ -35,12 +34,14 @@ AVAILABLE_MARKETS = [(asset, 'USD') for asset in FIAT_ASSETS]
 # TTL = 12 hours, Fixer only updates once a day
 _cache = TTLCache(maxsize=8192, ttl=43200)
 
+ctx = ProviderContext(NAME)
+
 
 @check_online_status
 @cachedmodulefunc
 def get_all(asset_list, base):
-    rates = requests.get('https://api.fixer.io/latest?base={}'.format(base)).json()['rates']
-    result = FeedSet(FeedPrice(1 / price, asset, base) for asset, price in rates.items())
+    rates = ctx.get('https://api.fixer.io/latest?base={}'.format(base)).json()['rates']
+    result = FeedSet(ctx.feed_price(1 / price, asset, base) for asset, price in rates.items())
     result = result.filter(asset=[asset for asset, base in AVAILABLE_MARKETS])
     return result
 
@@ -18,7 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, check_market, FeedSet
+from . import ProviderContext, check_online_status, check_market, FeedSet
 import pendulum
 import logging
 
@@ -28,6 +28,8 @@ NAME = 'Hero'
 
 AVAILABLE_MARKETS = [('HERO', 'USD')]
 
+ctx = ProviderContext(NAME)
+
 
 @check_online_status
 @check_market
@@ -36,4 +38,4 @@ def get(asset, base):
 
     price_usd = 1.05 ** ((pendulum.today() - pendulum.Pendulum(1913, 12, 23)).in_days() / 365.2425)
 
-    return FeedPrice(price_usd, asset, base)
+    return ctx.feed_price(price_usd, asset, base)
@@ -18,7 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, check_market, FeedSet
+from . import ProviderContext, check_online_status, check_market, FeedSet
 import math
 import pendulum
 import logging
@@ -29,6 +29,8 @@ NAME = 'Hertz'
 
 AVAILABLE_MARKETS = [('HERTZ', 'USD')]
 
+ctx = ProviderContext(NAME)
+
 
 def get_hertz_feed(reference_timestamp, current_timestamp, period_days, phase_days, amplitude):
     """Given the reference timestamp, the current timestamp, the period (in days), the phase (in days), the reference asset value (ie 1.00) and the amplitude (> 0 && < 1), output the current hertz value.
@@ -61,4 +63,4 @@ def get(asset, base):
                            hertz_period_days, hertz_phase_days,
                            hertz_amplitude)
 
-    return FeedPrice(hertz, asset, base)
+    return ctx.feed_price(hertz, asset, base)
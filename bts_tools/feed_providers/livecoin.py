@@ -18,8 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, check_market
-import requests
+from . import ProviderContext, check_online_status, check_market
 import logging
 
 log = logging.getLogger(__name__)
@@ -28,10 +27,13 @@ NAME = 'Livecoin'
 
 AVAILABLE_MARKETS = [('BTS', 'BTC'), ('GOLOS', 'BTC')]
 
+ctx = ProviderContext(NAME)
+
+
 @check_online_status
 @check_market
 def get(asset, base):
     log.debug('checking feeds for %s/%s at %s' % (asset, base, NAME))
-    data = requests.get('https://api.livecoin.net/exchange/ticker?currencyPair={}/{}'.format(asset, base)).json()
+    data = ctx.get('https://api.livecoin.net/exchange/ticker?currencyPair={}/{}'.format(asset, base)).json()
 
-    return FeedPrice(data['last'], asset, base, volume=data['volume'])
+    return ctx.feed_price(data['last'], asset, base, volume=data['volume'])
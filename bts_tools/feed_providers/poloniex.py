@@ -18,8 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, from_bts, to_bts, check_market
-import requests
+from . import ProviderContext, check_online_status, check_market
 import logging
 
 log = logging.getLogger(__name__)
@@ -30,14 +29,16 @@ AVAILABLE_MARKETS = [('BTS', 'BTC'), ('STEEM', 'BTC'), ('GRIDCOIN', 'BTC')]
 ASSET_MAP = {'GRIDCOIN': 'GRC'}
 TIMEOUT = 60
 
+ctx = ProviderContext(NAME, ASSET_MAP)
+
+
 @check_online_status
 @check_market
 def get(cur, base):
     log.debug('checking feeds for %s/%s at %s' % (cur, base, NAME))
-    r = requests.get('https://poloniex.com/public?command=returnTicker',
-                     timeout=TIMEOUT).json()
-    r = r['{}_{}'.format(base, from_bts(cur))]
-    return FeedPrice(float(r['last']),
-                     cur, base,
-                     volume=float(r['quoteVolume']),
-                     provider=NAME)
+    r = ctx.get('https://poloniex.com/public?command=returnTicker',
+                timeout=TIMEOUT).json()
+    r = r['{}_{}'.format(base, ctx.from_bts(cur))]
+    return ctx.feed_price(float(r['last']),
+                          cur, base,
+                          volume=float(r['quoteVolume']))
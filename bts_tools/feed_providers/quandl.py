@@ -18,10 +18,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, cachedmodulefunc, check_market
+from . import ProviderContext, check_online_status, cachedmodulefunc, check_market
 from cachetools import TTLCache
 import pendulum
-import requests
 import logging
 
 log = logging.getLogger(__name__)
@@ -39,6 +38,9 @@ _cache = TTLCache(maxsize=8192, ttl=43200)
 
 TIMEOUT = 60
 
+ctx = ProviderContext(NAME)
+
+
 @check_online_status
 @cachedmodulefunc
 @check_market
@@ -51,12 +53,12 @@ def get(cur, base):
             dataset=dataset,
             date=(pendulum.utcnow() - pendulum.interval(days=3)).strftime('%Y-%m-%d')
         )
-        data = requests.get(url=url, timeout=TIMEOUT).json()
+        data = ctx.get(url=url, timeout=TIMEOUT).json()
         if 'dataset' not in data:
             raise RuntimeError('Quandl: no dataset found for url: %s' % url)
         d = data['dataset']
         if len(d['data']):
             prices.append(d['data'][0][1])
 
-    return FeedPrice(sum(prices) / len(prices), cur, base)
+    return ctx.feed_price(sum(prices) / len(prices), cur, base)
 
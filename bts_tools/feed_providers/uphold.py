@@ -18,10 +18,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, FeedSet, check_online_status, cachedmodulefunc, to_bts, from_bts, check_market
+from . import ProviderContext, FeedSet, check_online_status, cachedmodulefunc, check_market
 from ..feeds import BIT_ASSETS, FIAT_ASSETS
 from cachetools import TTLCache
-import requests
 import logging
 
 log = logging.getLogger(__name__)
@@ -42,21 +41,23 @@ ASSET_MAP = {'GOLD': 'XAU',
 
 _cache = TTLCache(maxsize=8192, ttl=600)  # 10 mins
 
+ctx = ProviderContext(NAME, ASSET_MAP)
+
 
 def feeds_from_reply(r):
     result = FeedSet()
     for feed in r:
-        asset = to_bts(feed['pair'][:3])
-        base = to_bts(feed['pair'][3:6])
+        asset = ctx.to_bts(feed['pair'][:3])
+        base = ctx.to_bts(feed['pair'][3:6])
         if asset in BIT_ASSETS and base in BIT_ASSETS:
-            result.append(FeedPrice((float(feed['ask'])+float(feed['bid']))/2, asset, base))  # FIXME: remove provider, FeedPrice should guess automatically from calling stack
+            result.append(ctx.feed_price((float(feed['ask'])+float(feed['bid']))/2, asset, base))
 
     # reverse USD pairs where USD is not base
     for f in result:
         if f.asset == 'USD':
             # only reverse if we don't have the pair yet
             if not result.filter(f.base, f.asset):
-                result.append(FeedPrice(1/f.price, f.base, f.asset))
+                result.append(ctx.feed_price(1/f.price, f.base, f.asset))
 
     #log.debug('got from uphold: {}'.format(result))
     return result
@@ -64,7 +65,7 @@ def feeds_from_reply(r):
 
 @cachedmodulefunc
 def _get_all():
-    r = requests.get('https://api.uphold.com/v0/ticker')
+    r = ctx.get('https://api.uphold.com/v0/ticker')
     r = r.json()
     return feeds_from_reply(r)
 
@@ -86,6 +87,6 @@ def get(cur, base):
         return feed.price()
 
     # otherwise, fetch feeds with the given base asset
-    r = requests.get('https://api.uphold.com/v0/ticker/{}'.format(base)).json()
+    r = ctx.get('https://api.uphold.com/v0/ticker/{}'.format(base)).json()
     return feeds_from_reply(r).price(cur, base)
 
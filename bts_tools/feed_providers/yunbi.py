@@ -18,7 +18,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, reuse_last_value_on_fail, check_market
+from . import ProviderContext, check_online_status, reuse_last_value_on_fail, check_market
 from retrying import retry
 import requests
 import logging
@@ -29,6 +29,8 @@ NAME = 'Yunbi'
 
 AVAILABLE_MARKETS = [('BTS', 'BTC'), ('BTS', 'CNY'), ('BTC', 'CNY')]
 
+ctx = ProviderContext(NAME)
+
 
 @check_online_status
 @reuse_last_value_on_fail
@@ -40,13 +42,12 @@ def get(self, cur, base):
     log.debug('checking feeds for %s/%s at %s' % (cur, base, self.NAME))
     headers = {'content-type': 'application/json',
                'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:22.0) Gecko/20100101 Firefox/22.0'}
-    r = requests.get('https://yunbi.com/api/v2/tickers.json',
-                     timeout=10,
-                     headers=headers).json()
+    r = ctx.get('https://yunbi.com/api/v2/tickers.json',
+                timeout=10,
+                headers=headers).json()
     # log.debug('received: {}'.format(json.dumps(r, indent=4)))
     r = r['{}{}'.format(cur.lower(), base.lower())]
-    return FeedPrice(float(r['ticker']['last']),
-                     cur, base,
-                     volume=float(r['ticker']['vol']),
-                     last_updated=datetime.utcfromtimestamp(r['at']),
-                     provider=NAME)
+    return ctx.feed_price(float(r['ticker']['last']),
+                          cur, base,
+                          volume=float(r['ticker']['vol']),
+                          last_updated=datetime.utcfromtimestamp(r['at']))
@@ -18,9 +18,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import FeedPrice, check_online_status, check_market
+from . import ProviderContext, check_online_status, check_market
 import pendulum
-import requests
 import logging
 
 log = logging.getLogger(__name__)
@@ -28,6 +27,8 @@ log = logging.getLogger(__name__)
 NAME = 'ZB'
 AVAILABLE_MARKETS = [('BTS', 'BTC')]
 
+ctx = ProviderContext(NAME)
+
 
 @check_online_status
 @check_market
@@ -36,10 +37,9 @@ def get(asset, base):
     headers = {'content-type': 'application/json',
                'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:22.0) Gecko/20100101 Firefox/22.0'}
 
-    data = requests.get('http://api.zb.com/data/v1/ticker?market={}_{}'.format(asset.lower(), base.lower()),
-                        headers=headers).json()
+    data = ctx.get('http://api.zb.com/data/v1/ticker?market={}_{}'.format(asset.lower(), base.lower()),
+                   headers=headers).json()
     t = data['ticker']
-    return FeedPrice(float(t['last']), asset, base,
-                     volume=float(t['vol']),
-                     last_updated=pendulum.from_timestamp(float(data['date']) / 1000),
-                     provider=NAME)
+    return ctx.feed_price(float(t['last']), asset, base,
+                          volume=float(t['vol']),
+                          last_updated=pendulum.from_timestamp(float(data['date']) / 1000))
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bts_tools - Tools to easily manage the bitshares client
+# Copyright (c) 2018 Nicolas Wack <wackou@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Compilation of the feed rules into a graph of market nodes.
+
+The rules from the config (eg: ``[compose, 'BTS/BTC', 'BTC/USD']``) are parsed once into a list
+of nodes in evaluation order, where each node knows the nodes that produce the prices it reads:
+
+ - a ``source`` node for each market read by a rule, whose value is the feed prices that have
+   been fetched from the feed providers for this market
+ - an ``invert``, ``compose`` or ``copy`` node for each of those rules, which adds a new feed price
+ - a ``publish`` node for each market that should be published
+
+On each cycle, a node whose inputs haven't changed since the last cycle reuses its previous
+result instead of computing it again, and a node for which one of its input markets doesn't have
+a price is skipped without trying to compute it.
+"""
+
+from . import core
+from .feed_providers import FeedPrice
+from collections import OrderedDict
+import threading
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+
+# node statuses
+OK = 'ok'
+FAILED = 'failed'    # computing the node raised an exception
+SKIPPED = 'skipped'  # one of the input markets doesn't have a price
+MISSING = 'missing'  # source node for which no feed price has been fetched
+
+
+def market_str(market):
+    return '{}/{}'.format(*market)
+
+
+def parse_market(market_pair):
+    asset, base = market_pair.split('/')
+    return asset, base
+
+
+class RuleNode(object):
+    def __init__(self, op, market, inputs=(), deps=None, rule=None):
+        self.op = op
+        self.market = market          # market written (or published) by this node
+        self.inputs = list(inputs)    # markets read by this node
+        self.deps = deps or {}        # type: {market: [RuleNode]} nodes producing the prices of each input market
+        self.rule = rule              # rule from which this node was compiled, for display purposes
+        self.status = None
+        self.changed = True           # whether the value of this node changed during the last cycle
+        self.result = None            # FeedPrice computed by this node
+        self.key = None               # for source nodes, the fetched feeds of the last cycle
+        self.error = None
+        self.cause = None             # node responsible for this one being skipped
+        self.duration = 0             # time taken for the last evaluation, in seconds
+
+    def __str__(self):
+        if self.op == 'source':
+            return 'source {}'.format(market_str(self.market))
+        return '{} {}'.format(self.op, ' '.join(market_str(m) for m in self.inputs) +
+                              (' -> {}'.format(market_str(self.market)) if self.op != 'publish' else ''))
+
+    def all_deps(self):
+        for deps in self.deps.values():
+            yield from deps
+
+    def evaluate(self, feeds):
+        """Evaluate this node on the given FeedSet, adding its result to it"""
+        if self.op == 'source':
+            fetched = feeds.filter(*self.market)
+            key = tuple((f.price, f.volume, f.provider) for f in fetched)
+            self.changed = key != self.key
+            self.key = key
+            self.status = OK if fetched else MISSING
+            return
+
+        # short-circuit if one of the input markets doesn't have a price
+        for market, deps in self.deps.items():
+            if not any(d.status == OK for d in deps):
+                self.changed = self.status != SKIPPED
+                self.status = SKIPPED
+                self.result = None
+                self.cause = next(d.cause or d for d in reversed(deps))
+                return
+        self.cause = None
+
+        if self.op == 'publish':
+            self.changed = self.status != OK
+            self.status = OK
+            return
+
+        # reuse the previous result if none of the inputs changed
+        if self.status == OK and not any(d.changed for d in self.all_deps()):
+            self.changed = False
+            feeds.append(self.result)
+            return
+
+        try:
+            result = self.compute(feeds)
+        except Exception as e:
+            self.changed = self.status != FAILED
+            self.status = FAILED
+            self.result = None
+            self.error = e
+            log.warning('Could not execute rule {}: {}'.format(self, e))
+            log.debug('', exc_info=True)
+            return
+
+        self.changed = self.result is None or self.result.price != result.price
+        self.status = OK
+        self.result = result
+        self.error = None
+        feeds.append(result)
+
+    def compute(self, feeds):
+        if self.op == 'invert':
+            asset, base = self.inputs[0]
+            return FeedPrice(price=1 / feeds.price(asset, base),
+                             asset=base, base=asset,
+                             # volume=volume / price   # FIXME: volume needs to be in the opposite unit
+                             )
+
+        elif self.op == 'compose':
+            (market1_asset, market1_base), (market2_asset, market2_base) = self.inputs
+            p1 = feeds.price(market1_asset, market1_base)
+            p2 = feeds.price(market2_asset, market2_base)
+            return FeedPrice(price=p1 * p2, asset=market1_asset, base=market2_base)
+
+        elif self.op == 'copy':
+            dest_asset, dest_base = self.market
+            return FeedPrice(feeds.price(*self.inputs[0]), dest_asset, dest_base)
+
+        raise ValueError('Invalid rule: {}'.format(self.op))
+
+
+class RulePlan(object):
+    """List of RuleNode in evaluation order, compiled from a list of rules."""
+
+    def __init__(self, rules):
+        self.nodes = []
+        self.sources = OrderedDict()  # type: {market: RuleNode}
+        self._writers = {}            # type: {market: [RuleNode]}
+        self.duration = 0
+        self._lock = threading.Lock()  # the nodes keep the state of the last cycle, only one can run at a time
+
+        for rule, *args in rules:
+            try:
+                self._compile_rule(rule, *args)
+            except Exception as e:
+                log.warning('Could not compile rule: {} {}: {}'.format(rule, args, e))
+
+        # sources need to be evaluated before the rules using them
+        self.nodes = list(self.sources.values()) + self.nodes
+        del self._writers
+
+    def _deps(self, market):
+        """Return the nodes producing the price of the given market at this point of the rules"""
+        if market not in self.sources:
+            self.sources[market] = RuleNode('source', market)
+        return [self.sources[market]] + self._writers.get(market, [])
+
+    def _add_node(self, op, market, inputs, rule):
+        node = RuleNode(op, market, inputs, OrderedDict((m, self._deps(m)) for m in inputs), rule)
+        self.nodes.append(node)
+        if op != 'publish':
+            self._writers.setdefault(market, []).append(node)
+
+    def _compile_rule(self, rule, *args):
+        if rule == 'compose':
+            (market1_asset, market1_base), (market2_asset, market2_base) = parse_market(args[0]), parse_market(args[1])
+            if market1_base != market2_asset:
+                raise ValueError('`base` in first market {}/{} is not the same as `asset` in second market {}/{}'
+                                 .format(market1_asset, market1_base, market2_asset, market2_base))
+            self._add_node(rule, (market1_asset, market2_base),
+                           [(market1_asset, market1_base), (market2_asset, market2_base)], [rule, *args])
+
+        elif rule == 'invert':
+            asset, base = parse_market(args[0])
+            self._add_node(rule, (base, asset), [(asset, base)], [rule, *args])
+
+        elif rule == 'loop':
+            rule, *args2 = args[1]
+            for a in args[0]:
+                self._compile_rule(rule, *(arg.format(a) for arg in args2))
+
+        elif rule == 'copy':
+            self._add_node(rule, parse_market(args[1]), [parse_market(args[0])], [rule, *args])
+
+        elif rule == 'publish':
+            market = parse_market(args[0])
+            self._add_node(rule, market, [market], [rule, *args])
+
+        else:
+            raise ValueError('Invalid rule: {}'.format(rule))
+
+    def evaluate(self, feeds):
+        """Apply the rules to the given FeedSet, adding the computed feed prices to it.
+        Return the list of markets (asset, base) that should be published."""
+        with self._lock:
+            return self._evaluate(feeds)
+
+    def _evaluate(self, feeds):
+        start = time.perf_counter()
+        publish_list = []
+        for node in self.nodes:
+            node_start = time.perf_counter()
+            node.evaluate(feeds)
+            node.duration = time.perf_counter() - node_start
+            if node.op == 'publish' and node.status == OK:
+                publish_list.append(node.market)
+        self.duration = time.perf_counter() - start
+
+        skipped = OrderedDict()
+        for node in self.nodes:
+            if node.status == SKIPPED:
+                skipped.setdefault(node.cause, []).append(node)
+        for cause, nodes in skipped.items():
+            log.warning('{}, skipping {} dependent rule(s): {}'.format(
+                'No feed price for market {}'.format(market_str(cause.market)) if cause.status == MISSING
+                else 'Rule {} failed'.format(cause),
+                len(nodes), ', '.join(str(n) for n in nodes)))
+
+        log.debug('Applied feed rules in {:.2f}ms, {} nodes computed'.format(
+            self.duration * 1000, sum(1 for n in self.nodes if n.changed and n.op not in ('source', 'publish'))))
+        return publish_list
+
+    def dump(self):
+        """Return a description of the nodes of this plan, along with the status and the time
+        taken by each of them during the last evaluation"""
+        index = {node: i for i, node in enumerate(self.nodes)}
+        lines = ['{:>4}  {:44s} {:16s} {:8s} {:>9}'.format('#', 'node', 'depends on', 'status', 'time')]
+        for i, node in enumerate(self.nodes):
+            lines.append('{:4d}  {:44s} {:16s} {:8s} {:7.3f}ms'.format(
+                i, str(node), ','.join(str(index[d]) for d in node.all_deps()),
+                node.status or '-', node.duration * 1000))
+        lines.append('total: {} nodes, {:.3f}ms'.format(len(self.nodes), self.duration * 1000))
+        return '\n'.join(lines)
+
+
+_plans = {}  # type: {(owner, rules): RulePlan}
+_plans_lock = threading.Lock()
+
+
+def get_plan(rules, owner=None):
+    """Return the compiled plan for the given list of rules, compiling it only the first time.
+
+    Each owner (eg: the rpc_id of the node publishing the feeds) gets its own plan, so that the
+    results reused from one cycle to the next are those computed for the same node."""
+    key = (owner, core.make_hashable(rules))
+    try:
+        return _plans[key]
+    except KeyError:
+        pass
+
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is None:
+            plan = _plans[key] = RulePlan(rules)
+            log.debug('Compiled feed rules:\n{}'.format(plan.dump()))
+        return plan
@@ -18,13 +18,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from . import core
+from . import core, feed_fetcher, feed_rules
 from .core import hashabledict
 from .feed_providers import FeedPrice, FeedSet
 from .feed_publish import publish_bts_feed, publish_steem_feed, BitSharesFeedControl
 from collections import deque
-from contextlib import suppress
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 import itertools
 import statistics
@@ -73,138 +71,28 @@ def load_feeds():
 
 
 def get_multi_feeds(func, args, providers, stddev_tolerance=None):
-    result = FeedSet()
-    provider_list = []
-
-    def get_price(pargs):
-        args, provider = pargs
-        return provider, args, getattr(provider, func)(*args)
-
-    with ThreadPoolExecutor(max_workers=4) as e:
-        for f in [e.submit(get_price, pargs)
-                  for pargs in itertools.product(args, providers)]:
-            with suppress(Exception):
-                provider, args, price = f.result()
-                result.append(price)
-                provider_list.append(provider)
-
-    return result
+    jobs = [(provider, getattr(provider, func), pargs)
+            for pargs, provider in itertools.product(args, providers)]
+    return FeedSet(price for price in feed_fetcher.run(jobs) if not isinstance(price, Exception))
 
 
 def _fetch_feeds(node, cfg):
-    result = FeedSet()
     feed_providers = core.get_plugin_dict('bts_tools.feed_providers')
+    markets = []
+    for asset, base, providers in cfg['markets']:
+        if isinstance(providers, str):
+            providers = [providers]
+        for provider in providers:
+            markets.append((asset, base, provider))
 
-    def get_price(asset, base, provider):
-        #log.warning('get_price {}/{} at {}'.format(asset, base, provider))
-        return provider.get(asset, base)
-
-    def get_price_multi(asset_list, base, provider):
-        #log.warning('get_price_multi {}/{} at {}'.format(asset_list, base, provider))
-        return provider.get_all(asset_list, base)
-
-    def get_price_with_node(asset, base, provider, node):
-        #log.warning('get_price_with_node {}/{} at {}, node = {}'.format(asset, base, provider, node))
-        return provider.get(asset, base, node)
-
-    with ThreadPoolExecutor(max_workers=6) as e:
-        futures = {}
-        for asset, base, providers in cfg['markets']:
-            if isinstance(providers, str):
-                providers = [providers]
-            for provider in providers:
-                if getattr(feed_providers[provider], 'REQUIRES_NODE', False) is True:
-                    futures[e.submit(get_price_with_node, asset, base, feed_providers[provider], node)] = [asset, base, provider]
-                elif isinstance(asset, str):
-                    futures[e.submit(get_price, asset, base, feed_providers[provider])] = [asset, base, provider]
-                else:
-                    # asset is an asset_list
-                    futures[e.submit(get_price_multi, asset, base, feed_providers[provider])] = [asset, base, provider]
-
-        # futures = {e.submit(get_price, asset, base, feed_providers[provider])
-        #            if isinstance(asset, str)
-        #            else e.submit(get_price_multi, asset, base, feed_providers[provider]): [asset, base, provider]
-        #            for asset, base, provider in cfg['markets']}
-
-        for f in as_completed(futures):
-            asset, base, provider = futures[f]
-            try:
-                feeds = f.result()
-                if isinstance(feeds, FeedPrice):
-                    feeds = FeedSet([feeds])
-                result += feeds
-                log.debug('Provider {} got feeds: {}'.format(provider, feeds))
-            except Exception as e:
-                log.warning('Could not fetch {}/{} on {}: {}'.format(asset, base, provider, e))
-                #log.exception(e)
-
-    return result
+    return feed_fetcher.fetch_feeds(markets, feed_providers, node)
 
 
 def _apply_rules(node, cfg, result):
-    publish_list = []  # list of (asset, base) that need to be published
-
-    def mkt(market_pair):
-        return tuple(market_pair.split('/'))
-
-    def execute_rule(rule, *args):
-        if rule == 'compose':
-            log.debug('composing {} with {}'.format(args[0], args[1]))
-            (market1_asset, market1_base), (market2_asset, market2_base) = mkt(args[0]), mkt(args[1])
-            if market1_base != market2_asset:
-                raise ValueError('`base` in first market {}/{} is not the same as `asset` in second market {}/{}'
-                                 .format(market1_asset, market1_base, market2_asset, market2_base))
-
-            p1 = result.price(market1_asset, market1_base)
-            p2 = result.price(market2_asset, market2_base)
-            if p1 is None:
-                raise core.NoFeedData('No feed for market {}/{}'.format(market1_asset, market1_base))
-            if p2 is None:
-                raise core.NoFeedData('No feed for market {}/{}'.format(market2_asset, market2_base))
-
-            r = FeedPrice(price=p1 * p2, asset=market1_asset, base=market2_base)
-            result.append(r)
-
-        elif rule == 'invert':
-            log.debug('inverting {}'.format(args[0]))
-            asset, base = mkt(args[0])
-            r = FeedPrice(price=1 / result.price(asset, base),
-                          asset=base, base=asset,
-                          # volume=volume / price   # FIXME: volume needs to be in the opposite unit
-                          )
-            result.append(r)
-
-        elif rule == 'loop':
-            log.debug('applying rule {} to the following assets: {}'.format(args[1], args[0]))
-            rule, *args2 = args[1]
-            for a in args[0]:
-                args3 = tuple(arg.format(a) for arg in args2)
-                execute_rule(rule, *args3)
-
-        elif rule == 'copy':
-            log.debug('copying {} to {}'.format(args[0], args[1]))
-            src_asset, src_base = mkt(args[0])
-            dest_asset, dest_base = mkt(args[1])
-
-            r = FeedPrice(result.price(src_asset, src_base), dest_asset, dest_base)
-            result.append(r)
-
-        elif rule == 'publish':
-            asset, base = mkt(args[0])
-            log.debug('should publish {}/{}'.format(asset, base))
-            publish_list.append((asset, base))
-
-        else:
-            raise ValueError('Invalid rule: {}'.format(rule))
-
-    for rule, *args in cfg['rules']:
-        try:
-            execute_rule(rule, *args)
-
-        except Exception as e:
-            log.warning('Could not execute rule: {} {}'.format(rule, args))
-            log.exception(e)
-
+    """Apply the rules from the config to the given FeedSet. The rules are compiled the first time
+    they are used, see bts_tools.feed_rules"""
+    plan = feed_rules.get_plan(cfg['rules'], node.rpc_id)
+    publish_list = plan.evaluate(result)
     return result, publish_list
 
 
@@ -19,10 +19,10 @@
 #
 
 from . import core
-from datetime import datetime
+from datetime import datetime, timedelta
 from functools import partial
 from autobahn.asyncio.websocket import WebSocketClientProtocol, WebSocketClientFactory
-from collections import defaultdict
+from collections import defaultdict, deque
 from concurrent.futures import Future, TimeoutError
 from contextlib import suppress
 from enum import IntEnum
@@ -30,6 +30,7 @@ import functools
 import threading
 import json
 import time
+import random
 import asyncio
 import logging
 
@@ -73,7 +74,16 @@ def api_name(api_id):
         return '??'
 
 
-_event_loops = {}
+# event loop shared by all the websocket connections, running in its own thread
+_event_loop = None
+_event_loop_lock = threading.Lock()
+
+# status of the websocket connections we maintain, see connections_status()
+_connections = {}
+_connections_lock = threading.Lock()
+
+RECONNECT_MIN_DELAY = 1   # delay in seconds before retrying to connect after the first failure...
+RECONNECT_MAX_DELAY = 60  # ...doubling after each failure up to this one
 
 # FIXME: this would probably benefit from being integrated
 #        directly in each node's rpc_cache
@@ -82,23 +92,105 @@ _ws_rpc_cache = defaultdict(dict)
 # dict of active monitoring protocols
 _monitoring_protocols = {}
 
+DEFAULT_MAX_IN_FLIGHT = 100  # max number of requests waiting for a response on a connection, others are queued
+EXPIRE_INTERVAL = 1          # number of seconds between 2 checks for expired requests
+
+BLOCK_APPLIED_CALLBACK = 1   # id of the callback we register for the block applied notices
+
+# last block applied on each witness node, as notified by the node itself. type: {(host, port): (block_num, block_id)}
+_last_block_applied = {}
+_block_applied_events = defaultdict(threading.Event)  # set when a new block has been applied on a witness node
+_ready_events = defaultdict(threading.Event)  # set when we are logged in on a witness node and know the ids of its apis
+
+
+def is_connected(host, port):
+    """Return whether there is an open websocket connection to the witness node on the given host."""
+    protocol = _monitoring_protocols.get((host, port))
+    return protocol is not None and not protocol.closed
+
+
+def is_subscribed(host, port):
+    """Return whether the witness node on the given host notifies us of the blocks being applied."""
+    protocol = _monitoring_protocols.get((host, port))
+    return protocol is not None and protocol.subscribed
+
+
+def is_ready(host, port):
+    """Return whether we are logged in on the witness node on the given host, and know the ids of its apis."""
+    return is_connected(host, port) and _ready_events[(host, port)].is_set()
+
+
+def wait_until_ready(host, port, timeout=None):
+    """Wait until we are logged in on the witness node and know the ids of its apis (see is_ready()).
+
+    Returns whether it is ready, ie: False if it still isn't after timeout seconds."""
+    return _ready_events[(host, port)].wait(timeout) and is_connected(host, port)
+
+
+def block_num_from_id(block_id):
+    """The first 4 bytes of a block id are its block number."""
+    return int(block_id[:8], 16)
+
+
+def last_block_applied(host, port):
+    """Return the (block_num, block_id) of the last block applied on the witness node, or None if unknown."""
+    return _last_block_applied.get((host, port))
 
-def ws_rpc_call(host, port, api, method, *args):
+
+def wait_for_block(host, port, timeout=None):
+    """Wait until a new block has been applied on the witness node, and return its (block_num, block_id).
+
+    Returns None if no new block has been applied after timeout seconds."""
+    event = _block_applied_events[(host, port)]
+    if not event.wait(timeout):
+        return None
+    event.clear()
+    return _last_block_applied.get((host, port))
+
+
+def _connection(host, port):
+    """Return the (event_loop, protocol) for the connection to the given host."""
+    if not is_connected(host, port):
+        raise core.RPCError('Connection aborted: Websocket connection to {}:{} not available yet'.format(host, port))
+    return _event_loop, _monitoring_protocols[(host, port)]
+
+
+def _send_request(host, port, api, method, args, timeout):
+    """Send the request on the event loop of the connection and return a Future for its result."""
+    loop, protocol = _connection(host, port)
+    result = Future()
+    try:
+        loop.call_soon_threadsafe(functools.partial(protocol.rpc_call, api, method, *args,
+                                                    result=result, timeout=timeout))
+    except RuntimeError as e:  # loop has been closed in the meantime
+        raise core.RPCError('Connection aborted: lost connection to {}:{}'.format(host, port)) from e
+    return result
+
+
+def _cancel_request(host, port, result):
+    """Cancel the request for the given Future, so it doesn't stay in the connection's pending requests."""
+    result.cancel()
+    with suppress(KeyError, RuntimeError):
+        _event_loop.call_soon_threadsafe(_monitoring_protocols[(host, port)].expire_requests)
+
+
+def _timeout_error(api, method, args, host, port):
+    log.warning('timeout while calling {} {}({}) on {}:{}'.format(api_name(api), method, ', '.join(str(arg) for arg in args), host, port))
+    return core.RPCTimeoutError('Timeout while calling {}({}) on {}:{}'.format(method, ', '.join(str(arg) for arg in args), host, port))
+
+
+def ws_rpc_call(host, port, api, method, *args, timeout=10):
+    """Call the given method on the witness node and wait for its result.
+
+    Raises RPCTimeoutError if no response has been received after timeout seconds."""
     cached = False  # TODO: decide whether to maintain cached=True
     if not cached:
-        result = Future()
-        try:
-            loop = _event_loops[(host, port)]
-        except KeyError as e:
-            raise core.RPCError('Connection aborted: Websocket event loop for {}:{} not available yet'.format(host, port)) from e
-        protocol = _monitoring_protocols[(host, port)]
-
-        loop.call_soon_threadsafe(functools.partial(protocol.rpc_call, api, method, *args, result=result))
+        result = _send_request(host, port, api, method, args, timeout)
         try:
-            return result.result(timeout=10)
-        except TimeoutError:
-            log.warning('timeout while calling {} {}({}) on {}:{}'.format(api_name(api), method, ', '.join(args), host, port))
-            return None
+            return result.result(timeout=timeout)
+        except TimeoutError as e:
+            _cancel_request(host, port, result)
+            raise _timeout_error(api, method, args, host, port) from e
 
     # else: check whether it is in the cache
     key = (api, method,  args)
@@ -111,7 +203,74 @@ def ws_rpc_call(host, port, api, method, *args):
         raise core.RPCError('{}: {}({}) not in websocket cache'.format(api, method, ', '.join(args)))
 
 
+async def ws_rpc_call_async(host, port, api, method, *args, timeout=10):
+    """Coroutine version of ws_rpc_call, which can be awaited from any event loop.
+
+    Raises RPCTimeoutError if no response has been received after timeout seconds."""
+    result = _send_request(host, port, api, method, args, timeout)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(result), timeout)
+    except asyncio.TimeoutError as e:
+        _cancel_request(host, port, result)
+        raise _timeout_error(api, method, args, host, port) from e
+
+
+def ws_rpc_batch(host, port, api, calls, timeout=10):
+    """Send all the given calls at once on the websocket connection and wait for all the responses.
+
+    calls is a list of (method, args) tuples. Returns a list containing, for each call and in
+    the same order, either its result or the RPCError describing why it failed."""
+    # graphene doesn't understand JSON-RPC batch arrays, but we can pipeline all the requests
+    # on the connection instead, which costs us a single round trip as well
+    futures = [_send_request(host, port, api, method, args, timeout) for method, args in calls]
+
+    deadline = time.time() + timeout
+    result = []
+    for (method, args), f in zip(calls, futures):
+        try:
+            result.append(f.result(timeout=max(0, deadline - time.time())))
+        except TimeoutError:
+            _cancel_request(host, port, f)
+            result.append(_timeout_error(api, method, args, host, port))
+        except core.RPCError as e:
+            result.append(e)
+
+    return result
+
+
+def ws_connection_stats():
+    """Return the number of requests and the latency statistics for each websocket connection.
+
+    type: {(host, port): {'in_flight': int, 'queued': int, 'requests': int, 'errors': int,
+                          'timeouts': int, 'latency_avg': float, 'latency_p95': float, 'latency_max': float}}
+    latencies are in milliseconds, computed over the last responses received"""
+    result = {}
+    for (host, port), protocol in list(_monitoring_protocols.items()):
+        latencies = sorted(protocol.latencies)
+        stats = dict(protocol.stats, in_flight=len(protocol.request_map), queued=len(protocol.queue))
+        if latencies:
+            stats.update(latency_avg=sum(latencies) / len(latencies) * 1000,
+                         latency_p95=latencies[int(len(latencies) * 0.95)] * 1000,
+                         latency_max=latencies[-1] * 1000)
+        result[(host, port)] = stats
+    return result
+
+
+def _resolve(future, result=None, exception=None):
+    """Set the result of the future, unless it has already been cancelled by the caller."""
+    if future is None or future.done():
+        return
+    with suppress(Exception):  # InvalidStateError if cancelled in the caller's thread in the meantime
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+
 class MonitoringProtocol(WebSocketClientProtocol):
+    """Websocket connection to a witness node, multiplexing the rpc calls of all the threads.
+
+    All its methods need to be called from the event loop of the connection."""
     def __init__(self, type, witness_host, witness_port, witness_user, witness_passwd):
         super().__init__()
         self.type = type
@@ -120,35 +279,92 @@ class MonitoringProtocol(WebSocketClientProtocol):
         self.user = witness_user
         self.passwd = witness_passwd
         self.request_id = 0
-        self.request_map = {}
+        self.request_map = {}   # requests sent, waiting for a response. type: {id: (future, call_params, sent, expires)}
+        self.queue = deque()    # requests waiting to be sent. type: [(id, future, call_params, expires)]
+        self.max_in_flight = (core.config or {}).get('rpc', {}).get('ws_max_in_flight', DEFAULT_MAX_IN_FLIGHT)
+        self.stats = {'requests': 0, 'errors': 0, 'timeouts': 0}
+        self.latencies = deque(maxlen=1000)  # response times in seconds of the last requests
+        self.closed = False
+        self.disconnected = None  # asyncio Future resolved when the connection is lost
+        self.subscribed = False  # whether we receive the block applied notices
+        self.setup_requests = set()  # ids of the login requests sent on connection that didn't get a response yet
         _monitoring_protocols[(witness_host, witness_port)] = self
+        _ready_events[(witness_host, witness_port)].clear()
         if core.affiliation(type) == 'steem':
             _ws_rpc_cache[(witness_host, witness_port)] = {'login_api': 1}
         else:
             _ws_rpc_cache[(witness_host, witness_port)] = {'database_api': 0, 'login_api': 1}
 
 
-    def rpc_call(self, api, method, *args, result=None):
-        """result should be a Future instance"""
-        self.request_id += 1
+    def rpc_call(self, api, method, *args, result=None, timeout=None):
+        """result should be a Future instance, timeout is the number of seconds
+        after which the request expires if no response has been received"""
+        if self.closed:
+            _resolve(result, exception=core.RPCError('Connection aborted: lost connection to {}:{}'.format(self.host, self.port)))
+            return
         # TODO: convert args where required to hashable_dict (see: btsproxy.rpc_cache implementation)
         # get actual api id
         real_api = _ws_rpc_cache[(self.host, self.port)].get(api_name(api))
         if real_api is None:
             log.debug('Not calling api: {} - unauthorized access to {} api'.format(method, api_name(api)))
+            _resolve(result, exception=core.RPCError('Unauthorized access to {} api on {}:{}'.format(api_name(api), self.host, self.port)))
             return
-        call_params = (real_api, method, args)
-        self.request_map[self.request_id] = (result, call_params)
-        payload = {'jsonrpc': '2.0',
-                   'id': self.request_id,
-                   'method': 'call',
-                   'params': call_params}
-        log.debug('rpc call for {} on {}:{}: {}'.format(self.type, self.host, self.port, payload))
-        self.sendMessage(json.dumps(payload).encode('utf8'))
+        self.request_id += 1
+        expires = time.time() + timeout if timeout is not None else None
+        self.queue.append((self.request_id, result, (real_api, method, args), expires))
+        self.send_queued_requests()
+
+    def send_queued_requests(self):
+        while self.queue and len(self.request_map) < self.max_in_flight:
+            request_id, result, call_params, expires = self.queue.popleft()
+            if result is not None and result.cancelled():
+                continue
+            self.request_map[request_id] = (result, call_params, time.time(), expires)
+            self.stats['requests'] += 1
+            payload = {'jsonrpc': '2.0',
+                       'id': request_id,
+                       'method': 'call',
+                       'params': call_params}
+            log.debug('rpc call for {} on {}:{}: {}'.format(self.type, self.host, self.port, payload))
+            self.sendMessage(json.dumps(payload).encode('utf8'))
+
+    def expire_requests(self):
+        """Drop the requests that have been cancelled by their caller or that timed out."""
+        now = time.time()
+
+        def expired(result, expires):
+            return (result is not None and result.cancelled()) or (expires is not None and expires < now)
+
+        for request_id in [rid for rid, (result, _, _, expires) in self.request_map.items() if expired(result, expires)]:
+            result, (api, method, args), _, _ = self.request_map.pop(request_id)
+            self.stats['timeouts'] += 1
+            _resolve(result, exception=core.RPCTimeoutError('Timeout while calling {}({}) on {}:{}'
+                                                            .format(method, ', '.join(str(arg) for arg in args), self.host, self.port)))
+        self.queue = deque(r for r in self.queue if not expired(r[1], r[3]))
+        self.send_queued_requests()
+
+    def _check_expired(self):
+        if not self.closed:
+            self.expire_requests()
+            self.factory.loop.call_later(EXPIRE_INTERVAL, self._check_expired)
+
+    def fail_all_requests(self, reason):
+        """Make all the pending requests fail immediately, eg: when the connection has been lost."""
+        error = core.RPCError('Connection aborted: {} on {}:{}'.format(reason, self.host, self.port))
+        for result, _, _, _ in self.request_map.values():
+            _resolve(result, exception=error)
+        for _, result, _, _ in self.queue:
+            _resolve(result, exception=error)
+        if self.request_map or self.queue:
+            log.debug('Failed {} pending requests on {}:{}'.format(len(self.request_map) + len(self.queue), self.host, self.port))
+        self.request_map.clear()
+        self.queue.clear()
 
     def onConnect(self, response) :
         log.debug("Server connected: {0}".format(response.peer))
+        self.factory.loop.call_later(EXPIRE_INTERVAL, self._check_expired)
         # login, authenticate
+        first_request_id = self.request_id + 1
         self.rpc_call(Api.LOGIN_API, 'login', self.user, self.passwd)
         if core.affiliation(self.type) == 'steem':
             self.rpc_call(Api.LOGIN_API, 'get_api_by_name', 'database_api')
@@ -156,21 +372,46 @@ class MonitoringProtocol(WebSocketClientProtocol):
             self.rpc_call(Api.LOGIN_API, 'get_api_by_name', 'network_broadcast_api')  # only needed for feed_publisher role
         else:
             self.rpc_call(Api.LOGIN_API, 'network_node')
+            if (core.config or {}).get('monitoring', {}).get('block_notifications', True):
+                self.rpc_call(Api.DATABASE_API, 'set_block_applied_callback', BLOCK_APPLIED_CALLBACK)
+        self.setup_requests = set(range(first_request_id, self.request_id + 1))
+
+    def on_notice(self, callback_id, params):
+        if callback_id != BLOCK_APPLIED_CALLBACK or not params:
+            return
+        block_id = params[0]
+        block_num = block_num_from_id(block_id)
+        log.debug('Block {} applied on {}:{}'.format(block_num, self.host, self.port))
+        _last_block_applied[(self.host, self.port)] = (block_num, block_id)
+        _block_applied_events[(self.host, self.port)].set()
 
     def onMessage(self, payload, isBinary):
         res = json.loads(payload.decode('utf8'))
-        log.debug('Got response for request id {}: {}'.format(res['id'], json.dumps(res, indent=4)))
-        result, (api, method, args) = self.request_map.pop(res['id'])
+        if res.get('method') == 'notice':
+            self.on_notice(*res['params'])
+            return
+        log.debug('Got response for request id {}: {}'.format(res.get('id'), json.dumps(res, indent=4)))
+        try:
+            result, (api, method, args), sent, _ = self.request_map.pop(res['id'])
+        except KeyError:
+            log.debug('Dropping response for expired or unknown request id {}'.format(res.get('id')))
+            return
+        self.latencies.append(time.time() - sent)
+        self.send_queued_requests()
         args = tuple(core.hashabledict(arg) if isinstance(arg, dict) else arg for arg in args)
         cache = _ws_rpc_cache[(self.host, self.port)]
 
-        # FIXME: what if res raises an exception?
         p = {'result': res['result'] if 'result' in res else None,
              'server_response': res,
              'last_updated': datetime.utcnow()}
         # if we gave a future, return it, otherwise put the result in the cache
         if result is not None:
-            result.set_result(p['result'])
+            if 'error' in res:
+                self.stats['errors'] += 1
+                error = res['error']
+                _resolve(result, exception=core.RPCError(error.get('message', str(error)) if isinstance(error, dict) else str(error)))
+            else:
+                _resolve(result, p['result'])
         else:
             cache[(api, method, args)] = p
 
@@ -182,6 +423,13 @@ class MonitoringProtocol(WebSocketClientProtocol):
             else:
                 log.warning('Refused access to network api on {}:{}. Make sure to set your user/password properly!'.format(self.host, self.port))
 
+        if method == 'set_block_applied_callback':
+            self.subscribed = 'error' not in res
+            if self.subscribed:
+                log.info('Subscribed to block notifications on {}:{}'.format(self.host, self.port))
+            else:
+                log.info('Block notifications not available on {}:{}, falling back to polling'.format(self.host, self.port))
+
         if (api, method) == (Api.LOGIN_API, 'get_api_by_name'):
             api_id = p['result']
             if api_id is not None:
@@ -190,47 +438,113 @@ class MonitoringProtocol(WebSocketClientProtocol):
             else:
                 log.warning('Refused access to {} api on {}:{}. Make sure to set your user/password properly!'.format(args[0], self.host, self.port))
 
+        if self.setup_requests:
+            self.setup_requests.discard(res['id'])
+            if not self.setup_requests:
+                log.debug('Logged in on {}:{}'.format(self.host, self.port))
+                _ready_events[(self.host, self.port)].set()
+
         if not self.request_map:
             log.debug('received all responses to pending requests')
 
     def onClose(self, wasClean, code, reason):
         log.debug("WebSocket connection closed: {0}".format(reason))
         log.warning("WebSocket connection closed: {0}".format(reason))
+        self.closed = True
+        self.subscribed = False
+        _ready_events[(self.host, self.port)].clear()
+        self.fail_all_requests('connection closed')
 
     def connection_lost(self, exc):
-        log.debug('connection closed, stopping run loop')
-        self.factory.loop.stop()
+        log.debug('connection lost to {}:{}'.format(self.host, self.port))
+        super().connection_lost(exc)
+        self.closed = True
+        self.subscribed = False
+        _ready_events[(self.host, self.port)].clear()
+        self.fail_all_requests('connection lost')
+        if self.disconnected is not None and not self.disconnected.done():
+            self.disconnected.set_result(exc)
+
+
+def event_loop():
+    """Return the event loop running all the websocket connections, starting its thread if needed."""
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=_run_event_loop, args=(loop,), name='websocket-loop', daemon=True).start()
+            _event_loop = loop
+        return _event_loop
+
+
+def _run_event_loop(loop):
+    asyncio.set_event_loop(loop)
+    log.debug('Starting websocket event loop {} in thread {}'.format(loop, threading.current_thread().name))
+    loop.run_forever()
+
+
+def connect(type, host, port, user, passwd):
+    """Open a websocket connection to the witness node on the given host, and keep it open by
+    reconnecting whenever it is lost. Does nothing if we already maintain this connection."""
+    with _connections_lock:
+        if (host, port) in _connections:
+            return
+        _connections[(host, port)] = {'type': type, 'status': 'connecting', 'retries': 0,
+                                      'last_error': None, 'connected_since': None, 'next_retry': None}
+    asyncio.run_coroutine_threadsafe(_maintain_connection(type, host, port, user, passwd), event_loop())
 
 
-def run_monitoring(type, host, port, user, passwd):
-    log.info('Starting witness websocket monitoring on {}:{}'.format(host, port))
+def reconnect_delay(failures):
+    """Exponential backoff with jitter, so that connections don't all retry at the same time."""
+    delay = min(RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY * 2 ** (failures - 1))
+    return random.uniform(delay / 2, delay)
 
-    while True:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        _event_loops[(host, port)] = loop
-        log.debug('new event loop: {}'.format(loop))
-        log.debug('in thread {}'.format(threading.current_thread().name))
 
-        factory = WebSocketClientFactory("ws://{}:{:d}".format(host, port))
-        factory.protocol = partial(MonitoringProtocol, type, host, port, user, passwd)
+async def _maintain_connection(type, host, port, user, passwd):
+    log.info('Starting witness websocket monitoring on {}:{}'.format(host, port))
+    loop = asyncio.get_event_loop()
+    status = _connections[(host, port)]
+    failures = 0
 
+    while True:
+        status['status'] = 'connecting'
         try:
-            coro = loop.create_connection(factory, host, port)
-            loop.run_until_complete(coro)
+            factory = WebSocketClientFactory("ws://{}:{:d}".format(host, port), loop=loop)
+            factory.protocol = partial(MonitoringProtocol, type, host, port, user, passwd)
+            _, protocol = await loop.create_connection(factory, host, port)
+        except OSError as e:
+            log.debug('WebSocket connection refused to {}:{}'.format(host, port))
+            status['last_error'] = str(e)
+        except Exception as e:
+            log.warning('Could not connect to witness node on {}:{}: {}'.format(host, port, e))
+            status['last_error'] = str(e)
+        else:
             log.info('Successfully connected to witness on {}:{}'.format(host, port))
-            loop.run_forever()
+            failures = 0
+            status.update(status='connected', retries=0, last_error=None, next_retry=None,
+                          connected_since=datetime.utcnow())
+            if not protocol.closed:
+                protocol.disconnected = loop.create_future()
+                exc = await protocol.disconnected
+                status['last_error'] = str(exc) if exc else 'connection closed'
             log.warning('Lost connection to witness node on {}:{}'.format(host, port))
-        except KeyboardInterrupt:
-            log.info('Run loop exited manually (ctrl-C)')
-        except OSError:
-            log.debug('WebSocket connection refused to {}:{}'.format(host, port))
-        finally:
-            loop.close()
-
-        with suppress(KeyError):
-            del _monitoring_protocols[(host, port)]
-        del _event_loops[(host, port)]
-
-        nseconds = core.config['monitoring']['monitor_time_interval']
-        time.sleep(nseconds) # wait some time before trying to reconnect
+            status['connected_since'] = None
+            if _monitoring_protocols.get((host, port)) is protocol:
+                del _monitoring_protocols[(host, port)]
+
+        failures += 1
+        delay = reconnect_delay(failures)
+        status.update(status='waiting', retries=failures, next_retry=datetime.utcnow() + timedelta(seconds=delay))
+        log.debug('Reconnecting to {}:{} in {:.1f} seconds'.format(host, port, delay))
+        await asyncio.sleep(delay)
+
+
+def connections_status():
+    """Return the status of all the websocket connections to the witness nodes, along with their
+    request statistics (see ws_connection_stats).
+
+    status is one of: 'connecting', 'connected', 'waiting' (for the next reconnection attempt)
+    type: {(host, port): {'type': str, 'status': str, 'retries': int, 'last_error': str,
+                          'connected_since': datetime, 'next_retry': datetime, ...}}"""
+    stats = ws_connection_stats()
+    return {key: dict(status, **stats.get(key, {})) for key, status in list(_connections.items())}
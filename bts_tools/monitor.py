@@ -23,7 +23,7 @@ from itertools import chain, islice
 from contextlib import suppress
 from .feeds import check_feeds
 from .core import AttributeDict
-from . import core, graphene
+from . import core, graphene, rpcutils
 import time
 import threading
 import logging
@@ -105,14 +105,10 @@ def monitoring_thread(*nodes, delay=0):
             m not in {'feeds'}):
             log.warning('Unknown plugin specified in monitoring config: %s' % m)
 
-    # launch async thread for communicating via websockets with a graphene witness client
+    # connect via websockets to the graphene witness client, on the event loop shared by all connections
     if not client_node.proxy_host:
-        t = threading.Thread(target=graphene.run_monitoring, args=(client_node.type(),
-                                                                   client_node.witness_host,
-                                                                   client_node.witness_port,
-                                                                   client_node.witness_user,
-                                                                   client_node.witness_password))
-        t.start()
+        graphene.connect(client_node.type(), client_node.witness_host, client_node.witness_port,
+                         client_node.witness_user, client_node.witness_password)
 
     # launch feed monitoring and publishing thread
     if 'feeds' in all_monitoring and client_node.type().split('-')[0] in ['bts', 'steem']:
@@ -165,6 +161,7 @@ def monitoring_thread(*nodes, delay=0):
     if static_values.get('need_reindex'):
         static_values['need_reindex'] = False
         core.db[client_node.rpc_id] = {'static': static_values}
+        core.truncate_db(client_node.rpc_id, 0)
     monitoring.indexing.init_ctx(client_node, global_ctx, get_config(plugin_name))
 
     # make the stats values available to the outside
@@ -172,6 +169,37 @@ def monitoring_thread(*nodes, delay=0):
     if monitoring.cpu_ram_usage.cpu_total_ctx == global_ctx:
         global_stats_frames = global_ctx.global_stats
 
+    tick_deadline = core.config.get('rpc', {}).get('tick_deadline')
+
+    def process_block(block_num):
+        """index a new block and check for missed blocks as soon as the witness node notifies us about it"""
+        client_node.set_head_block_num(block_num)
+        with rpcutils.rpc_deadline(tick_deadline):
+            try:
+                if monitoring.indexing.is_valid_node(client_node):
+                    monitoring.indexing.monitor(client_node, global_ctx, get_config('indexing'), head_block_num=block_num)
+                for node in nodes:
+                    if 'missed' in node.monitoring and monitoring.missed.is_valid_node(node):
+                        monitoring.missed.monitor(node, contexts[node.name], get_config('missed'))
+            except Exception as e:
+                log.error('An exception occurred while processing block {}:'.format(block_num))
+                log.exception(e)
+
+    def wait_for_next_tick():
+        """sleep until the next loop iteration, processing new blocks as they get applied on the witness node.
+        If it doesn't notify us about them, they will be picked up by polling in the next iteration"""
+        next_tick = time.time() + global_ctx.time_interval
+        while True:
+            remaining = next_tick - time.time()
+            if remaining <= 0:
+                return
+            if not graphene.is_subscribed(client_node.witness_host, client_node.witness_port):
+                time.sleep(remaining)
+                return
+            block = graphene.wait_for_block(client_node.witness_host, client_node.witness_port, timeout=remaining)
+            if block is not None:
+                process_block(block[0])
+
     # we sleep so that all threads try to run at different times, this spreads the load better
     # and helps to have logs that are not interweaved too much
     log.debug('Waiting {} seconds before starting monitoring thread for {} nodes: {}'.format(delay, client_node.type(), node_names))
@@ -183,48 +211,50 @@ def monitoring_thread(*nodes, delay=0):
         # log.debug('-------- Monitoring status of the BitShares client --------')
         client_node.clear_rpc_cache()
 
-        try:
-            online = monitoring.online.monitor(client_node, global_ctx, get_config('online'))
-            if not online:
-                # we still want to monitor global cpu usage when client is offline
-                monitoring.cpu_ram_usage.monitor(client_node, global_ctx, get_config('cpu_ram_usage'))
-
-                time.sleep(global_ctx.time_interval)  # sleep here before looping again
-                continue
-
-            # start by indexing new blocks for given client
-            if monitoring.indexing.is_valid_node(client_node):
-                monitoring.indexing.monitor(client_node, global_ctx, get_config(plugin_name))
-
-            # monitor at a client level
-            global_ctx.info = client_node.info()
-            for plugin_name in CLIENT_PLUGINS:
-                if plugin_name in all_monitoring:
-                    try:
-                        plugin = getattr(monitoring, plugin_name)
-                        if plugin.is_valid_node(client_node):
-                            plugin.monitor(client_node, global_ctx, get_config(plugin_name))
-                    except Exception as e:
-                        log.error('An exception happened in monitoring plugin: %s' % plugin_name)
-                        log.exception(e)
-
-            # monitor each node/role individually
-            for node in nodes:
-                ctx = contexts[node.name]
-                ctx.info = global_ctx.info
-                ctx.online_state = global_ctx.online_state
-                for plugin_name in ROLE_PLUGINS:
-                    if plugin_name in node.monitoring:
+        # all rpc calls made during this loop iteration share a common time budget
+        with rpcutils.rpc_deadline(tick_deadline):
+            try:
+                online = monitoring.online.monitor(client_node, global_ctx, get_config('online'))
+                if not online:
+                    # we still want to monitor global cpu usage when client is offline
+                    monitoring.cpu_ram_usage.monitor(client_node, global_ctx, get_config('cpu_ram_usage'))
+
+                    time.sleep(global_ctx.time_interval)  # sleep here before looping again
+                    continue
+
+                # start by indexing new blocks for given client
+                if monitoring.indexing.is_valid_node(client_node):
+                    monitoring.indexing.monitor(client_node, global_ctx, get_config(plugin_name))
+
+                # monitor at a client level
+                global_ctx.info = client_node.info()
+                for plugin_name in CLIENT_PLUGINS:
+                    if plugin_name in all_monitoring:
                         try:
                             plugin = getattr(monitoring, plugin_name)
-                            if plugin.is_valid_node(node):
-                                plugin.monitor(node, ctx, get_config(plugin_name))
+                            if plugin.is_valid_node(client_node):
+                                plugin.monitor(client_node, global_ctx, get_config(plugin_name))
                         except Exception as e:
                             log.error('An exception happened in monitoring plugin: %s' % plugin_name)
                             log.exception(e)
 
-        except Exception as e:
-            log.error('An exception occurred in the monitoring thread:')
-            log.exception(e)
-
-        time.sleep(global_ctx.time_interval)
+                # monitor each node/role individually
+                for node in nodes:
+                    ctx = contexts[node.name]
+                    ctx.info = global_ctx.info
+                    ctx.online_state = global_ctx.online_state
+                    for plugin_name in ROLE_PLUGINS:
+                        if plugin_name in node.monitoring:
+                            try:
+                                plugin = getattr(monitoring, plugin_name)
+                                if plugin.is_valid_node(node):
+                                    plugin.monitor(node, ctx, get_config(plugin_name))
+                            except Exception as e:
+                                log.error('An exception happened in monitoring plugin: %s' % plugin_name)
+                                log.exception(e)
+
+            except Exception as e:
+                log.error('An exception occurred in the monitoring thread:')
+                log.exception(e)
+
+        wait_for_next_tick()
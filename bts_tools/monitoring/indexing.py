@@ -19,12 +19,18 @@
 #
 
 from .. import core
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
 import logging
 
 log = logging.getLogger(__name__)
 
+BATCH_SIZE = 100    # number of blocks requested in a single batch
+PIPELINE_DEPTH = 4  # number of batches being fetched at the same time
+COMMIT_INTERVAL = 1000  # number of blocks indexed between commits of the db to disk
+
 
 def init_ctx(node, ctx, cfg):
     db = core.db[node.rpc_id]
@@ -44,13 +50,206 @@ def init_ctx(node, ctx, cfg):
 
     ctx.first_reindex = True
     ctx.to_name = {}  # maps witness id -> name
+    ctx.fetch_method = None  # see block_fetcher()
+    ctx.block_ids = None     # ids of the blocks that are not irreversible yet. type: {block_num: block_id}
+
+
+def get_blocks(node, first, last):
+    return node.rpc_batch([('get_block', [n]) for n in range(first, last + 1)], cached=False)
+
+
+def get_block_headers(node, first, last):
+    return node.rpc_batch([('get_block_header', [n]) for n in range(first, last + 1)], cached=False)
+
+
+def get_block_header_batch(node, first, last):
+    return node.get_block_header_batch(list(range(first, last + 1)), cached=False)
+
+
+def block_fetcher(node, ctx, block_num):
+    """Return the fastest function available on this node for fetching a range of blocks.
+
+    We only need the witness and timestamp of each block, so we use the headers of the blocks when
+    the witness node can give them to us: they don't contain the transactions, so they are much
+    smaller to transfer and decode. Otherwise we fall back to fetching the full blocks. The
+    given block_num is used to check which calls are supported."""
+    if node.ws_route('get_block_header') is None:
+        return get_blocks  # headers are only available on the database api of the witness node
+
+    if ctx.fetch_method is None:
+        for fetch in [get_block_header_batch, get_block_headers]:
+            try:
+                result = fetch(node, block_num, block_num)
+                if isinstance(result[0], Exception):
+                    raise result[0]
+                ctx.fetch_method = fetch
+                break
+            except core.RPCError as e:
+                log.debug('Cannot use {} on {}: {}'.format(fetch.__name__, node.rpc_id, e))
+        else:
+            ctx.fetch_method = get_blocks
+        log.debug('Indexing {} using {}'.format(node.rpc_id, ctx.fetch_method.__name__))
+
+    return ctx.fetch_method
+
+
+def fetch_blocks(node, start, end, batch_size=BATCH_SIZE, depth=PIPELINE_DEPTH, fetch=get_blocks):
+    """Yield (block_num, block) for all the blocks from start to end (included), in order.
+
+    Blocks are fetched in batches using `fetch(node, first, last)`, with up to `depth` batches in
+    flight at the same time. Batches are pipelined on the websocket connection to the witness node
+    when possible, and sent as JSON-RPC batch requests to the wallet otherwise (see
+    GrapheneClient.rpc_batch)."""
+    def fetch_batch(first, last):
+        return fetch(node, first, last)
+
+    batches = ((first, min(first + batch_size - 1, end)) for first in range(start, end + 1, batch_size))
+
+    if end - start < batch_size:
+        # no need to start threads to fetch a few blocks
+        for first, last in batches:
+            yield from zip(range(first, last + 1), fetch_batch(first, last))
+        return
+
+    with ThreadPoolExecutor(max_workers=depth, thread_name_prefix='indexing') as executor:
+        pending = deque()
+        for first, last in batches:
+            pending.append((first, last, executor.submit(fetch_batch, first, last)))
+            if len(pending) < depth:
+                continue
+            first, last, f = pending.popleft()
+            yield from zip(range(first, last + 1), f.result())
+        while pending:
+            first, last, f = pending.popleft()
+            yield from zip(range(first, last + 1), f.result())
 
 
 def is_valid_node(node):
     return node.is_witness() and node.is_synced()
 
 
-def monitor(node, ctx, cfg):
+def witness_key(node, witness_name):
+    """Return how the blocks refer to the given witness: by its id on bts chains, by its name
+    on steem chains."""
+    if node.affiliation() == 'steem':
+        return witness_name
+    return node.get_witness(witness_name)['id']
+
+
+def chain_state(node):
+    """Return the head block number, head block id and last irreversible block number,
+    or None if the node can't tell us."""
+    try:
+        props = node.get_dynamic_global_properties()
+        return props['head_block_number'], props['head_block_id'], props['last_irreversible_block_num']
+    except (core.RPCError, KeyError, TypeError) as e:
+        log.debug('Could not get dynamic global properties on {}: {}'.format(node.rpc_id, e))
+        return None
+
+
+def find_fork_point(node, ctx, fetch, block_num, last_irreversible):
+    """Return the last block before block_num which is still on the chain followed by the node."""
+    for n in range(block_num - 1, last_irreversible - 1, -1):
+        expected = ctx.block_ids.get(n)
+        if expected is None:
+            break
+        block = fetch(node, n + 1, n + 1)[0]
+        if isinstance(block, Exception):
+            raise block
+        if block is not None and block['previous'] == expected:
+            return n
+    return last_irreversible
+
+
+def rollback(node, ctx, block_num):
+    """Undo the indexing of all the blocks after block_num."""
+    db = core.db[node.rpc_id]
+    core.commit_db(node.rpc_id)  # so that all the blocks to undo are in the store
+    removed = core.truncate_db(node.rpc_id, block_num)
+
+    for witness_id in {w for _, w, _ in removed}:
+        witness_name = ctx.to_name.get(witness_id, witness_id)
+        if witness_name not in db['static']['monitor_witnesses']:
+            continue
+        db['total_produced'][witness_name] -= sum(1 for _, w, _ in removed if w == witness_id)
+        last = core.db_store.last_block(node.rpc_id, witness_id)
+        if last:
+            db['last_produced'][witness_name] = last[1]
+        else:
+            db['last_produced'].pop(witness_name, None)
+
+    ctx.block_ids = {n: block_id for n, block_id in ctx.block_ids.items() if n <= block_num}
+    log.warning('Chain reorganization on {}: undid {} block(s) after block {}'
+                .format(node.rpc_id, db['last_indexed_block'] - block_num, block_num))
+    db['last_indexed_block'] = block_num
+    core.db_store.set_block_ids(node.rpc_id, ctx.block_ids)
+    core.commit_db(node.rpc_id)
+
+
+def index_blocks(node, ctx, start_block_num, head_block_num, fetch, last_irreversible=None):
+    """Index the blocks from start_block_num to head_block_num (included).
+
+    If last_irreversible is given, the ids of the blocks after it are kept so that chain
+    reorganizations can be detected. In that case, indexing stops when the previous block of a
+    block doesn't match the one that was indexed and the fork point is returned."""
+    db = core.db[node.rpc_id]
+    period = head_block_num // 100 + 1
+    start_time = time.time()
+    commit_interval = core.config.get('index_commit_interval', COMMIT_INTERVAL)
+
+    for current_block_num, block in fetch_blocks(node, start_block_num, head_block_num, fetch=fetch):
+        if isinstance(block, Exception):
+            raise block
+
+        if current_block_num % period == 0:
+            progress = round(current_block_num / head_block_num * 100)
+            log.info('[{:2d}%] Indexing block number {} on {} ({:.0f} blocks/s)'
+                     .format(progress, current_block_num, node.rpc_id,
+                             (current_block_num - start_block_num) / max(time.time() - start_time, 1e-3)))
+
+        # TODO: investigate weird random steem block not found although head number is correct... this is a crappy workaround
+        for i in range(3):  # retry 3 times at 1 second interval
+            if block is None:
+                time.sleep(1)
+                block = node.get_block(current_block_num, cached=False)
+
+        if block is None:
+            log.warning('Could not get {} block number {}: head block = {}'.format(node.type(), current_block_num, node.get_head_block_num()))
+
+        else:
+            if last_irreversible is not None:
+                expected = ctx.block_ids.get(current_block_num - 1)
+                if expected is not None and block['previous'] != expected:
+                    return find_fork_point(node, ctx, fetch, current_block_num - 1, last_irreversible)
+                if current_block_num - 1 >= last_irreversible:
+                    ctx.block_ids[current_block_num - 1] = block['previous']
+
+            timestamp = datetime.strptime(block['timestamp'], '%Y-%m-%dT%H:%M:%S')
+            core.record_block(node.rpc_id, current_block_num, block['witness'], timestamp)
+            witness_name = ctx.to_name.get(block['witness'], block['witness'])
+            if witness_name in db['static']['monitor_witnesses']:
+                db['total_produced'][witness_name] += 1
+                db['last_produced'][witness_name] = timestamp
+
+        # FIXME: should we update this even in the case that block == None?
+        db['last_indexed_block'] = current_block_num
+
+        if (current_block_num - start_block_num + 1) % commit_interval == 0:
+            core.commit_db(node.rpc_id)
+
+    nblocks = head_block_num - start_block_num + 1
+    if nblocks >= BATCH_SIZE:
+        elapsed = time.time() - start_time
+        log.info('Indexed {} blocks on {} in {:.1f} seconds ({:.0f} blocks/s)'
+                 .format(nblocks, node.rpc_id, elapsed, nblocks / max(elapsed, 1e-3)))
+    return None
+
+
+def monitor(node, ctx, cfg, head_block_num=None):
+    """Index all the blocks up to head_block_num, or up to the current head block if not given.
+
+    Blocks that are undone by a chain reorganization are detected using the ids of the blocks that
+    are not irreversible yet, and indexed again from the fork point."""
     db = core.db[node.rpc_id]
 
     # get mapping from witness id -> name
@@ -65,8 +264,9 @@ def monitor(node, ctx, cfg):
                 pass
 
     # Get block number
-    head_block_num = node.get_head_block_num()
-    period = head_block_num // 100 + 1
+    chain = chain_state(node) if core.db_store is not None else None
+    if head_block_num is None:
+        head_block_num = chain[0] if chain else node.get_head_block_num()
 
     if not core.config['index_full_blockchain'] and db['last_indexed_block'] == 0:
         db['last_indexed_block'] = head_block_num - 1
@@ -75,35 +275,36 @@ def monitor(node, ctx, cfg):
     if ctx.first_reindex:
         log.info('Reindexing database on {}...'.format(node.rpc_id))
 
-    # We loop through all blocks we may have missed since the last
-    # block defined above
-    while head_block_num - db['last_indexed_block'] > 0:
-        current_block_num = db['last_indexed_block'] + 1
-
-        if current_block_num % period == 0:
-            progress = round(current_block_num / head_block_num * 100)
-            log.info('[{:2d}%] Indexing block number {} on {}'.format(progress, current_block_num, node.rpc_id))
-
-        # TODO: optimize using get_block_range (BTS, maybe steem?)
-        block = node.get_block(current_block_num)
+    last_irreversible = None
+    if chain:
+        chain_head_block_num, head_block_id, last_irreversible = chain
+        if ctx.block_ids is None:
+            ctx.block_ids = core.db_store.block_ids(node.rpc_id)
 
-        # TODO: investigate weird random steem block not found although head number is correct... this is a crappy workaround
-        for i in range(3):  # retry 3 times at 1 second interval
-            if block is None:
-                time.sleep(1)
-                block = node.get_block(current_block_num)
+        # the head block was undone without any new block after it
+        last_indexed = db['last_indexed_block']
+        if (chain_head_block_num == last_indexed and ctx.block_ids.get(last_indexed, head_block_id) != head_block_id):
+            fetch = block_fetcher(node, ctx, last_indexed)
+            rollback(node, ctx, find_fork_point(node, ctx, fetch, last_indexed, last_irreversible))
 
-        if block is None:
-            log.warning('Could not get {} block number {}: head block = {}'.format(node.type(), current_block_num, node.get_head_block_num()))
+    # We loop through all blocks we may have missed since the last
+    # block defined above, starting again from the fork point if we find a reorg
+    while True:
+        start_block_num = db['last_indexed_block'] + 1
+        fetch = block_fetcher(node, ctx, head_block_num) if head_block_num >= start_block_num else get_blocks
+        fork_point = index_blocks(node, ctx, start_block_num, head_block_num, fetch, last_irreversible)
+        if fork_point is None:
+            break
+        rollback(node, ctx, fork_point)
 
-        else:
-            witness_name = ctx.to_name.get(block['witness'], block['witness'])
-            if witness_name in db['static']['monitor_witnesses']:
-                db['total_produced'][witness_name] += 1
-                db['last_produced'][witness_name] = datetime.strptime(block['timestamp'], '%Y-%m-%dT%H:%M:%S')
+    if last_irreversible is not None:
+        if chain[0] == db['last_indexed_block']:
+            ctx.block_ids[chain[0]] = chain[1]
+        ctx.block_ids = {n: block_id for n, block_id in ctx.block_ids.items() if n >= last_irreversible}
+        core.db_store.set_block_ids(node.rpc_id, ctx.block_ids)
 
-        # FIXME: should we update this even in the case that block == None?
-        db['last_indexed_block'] = current_block_num
+    if head_block_num >= start_block_num:
+        core.commit_db(node.rpc_id)
 
     if ctx.first_reindex:
         log.info('Reindexing done on {}!'.format(node.rpc_id))
@@ -52,12 +52,16 @@ def is_valid_node(node):
 def monitor(node, ctx, cfg):
     db = core.db[node.rpc_id]
 
-    total_missed = node.get_witness(node.name)['total_missed']
+    witness = node.get_witness(node.name)
+    total_missed = witness['total_missed']
     if db['total_missed'][node.name] < 0:  # not initialized yet
         db['total_missed'][node.name] = total_missed
 
     if total_missed > db['total_missed'][node.name]:
         db['last_missed'][node.name] = datetime.utcnow()
+        witness_key = node.name if node.affiliation() == 'steem' else witness['id']  # same as in the blocks
+        core.record_missed(node.rpc_id, witness_key, db['last_missed'][node.name],
+                           total_missed - db['total_missed'][node.name])
         db['streak'][node.name] = min(db['streak'][node.name], 0) - 1
         msg = 'missed another block! (last {} missed // total {})'.format(-db['streak'][node.name], total_missed)
         send_notification([node], msg, alert=True)
@@ -20,8 +20,6 @@
 
 from contextlib import suppress
 from . import core
-import geoip2
-import geoip2.webservice
 import socket
 import fcntl
 import struct
@@ -83,6 +81,7 @@ def copy_cached_value(wrapped, instance, args, kwargs):
 @copy_cached_value
 @cachetools.func.lfu_cache(8192)
 def get_geoip_info(ip_addr):
+    import geoip2.webservice
     try:
         cred = core.config.get('credentials', {})['geoip2']  # check that we have a geoip2 section in config.yaml
         client = geoip2.webservice.Client(cred['user'], cred['password'])
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bts_tools - Tools to easily manage the bitshares client
+# Copyright (c) 2018 Nicolas Wack <wackou@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from . import core
+from collections import defaultdict, OrderedDict
+from concurrent.futures import Future, TimeoutError
+import threading
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+
+# caching policies for the rpc methods
+IMMUTABLE = 'immutable'  # never changes once it has been read (eg: witness names, asset precision)
+PER_BLOCK = 'per_block'  # can only change when a new block is applied on the chain
+TTL       = 'ttl'        # valid for a given number of seconds
+TICK      = 'tick'       # valid until the next clear(), ie: for one monitoring loop iteration or one page view
+NEVER     = 'never'      # never cached (eg: methods that broadcast transactions)
+
+POLICIES = [IMMUTABLE, PER_BLOCK, TTL, TICK, NEVER]
+
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_TTL = 60
+
+DEFAULT_POLICIES = {
+    # methods broadcasting transactions or changing the wallet state
+    'wallet_publish_price_feed': NEVER,
+    'wallet_publish_feeds': NEVER,
+    'wallet_publish_version': NEVER,
+    'publish_asset_feed': NEVER,
+    'publish_feed': NEVER,
+    'begin_builder_transaction': NEVER,
+    'add_operation_to_builder_transaction': NEVER,
+    'set_fees_on_builder_transaction': NEVER,
+    'sign_builder_transaction': NEVER,
+    'network_add_node': NEVER,
+
+    # chain data, which only changes with a new block
+    'get_block': PER_BLOCK,
+    'get_block_header': PER_BLOCK,
+    'get_block_header_batch': PER_BLOCK,
+    'get_witness': PER_BLOCK,
+    'get_committee_member': PER_BLOCK,
+    'get_account': PER_BLOCK,
+    'get_account_history': PER_BLOCK,
+    'get_asset': PER_BLOCK,
+    'get_bitasset_data': PER_BLOCK,
+    'get_object': PER_BLOCK,
+    'get_global_properties': PER_BLOCK,
+    'get_dynamic_global_properties': PER_BLOCK,
+
+    # values computed by GrapheneClient which never change
+    'asset_data': IMMUTABLE,
+    'witness_name': IMMUTABLE,
+    'committee_member_name': IMMUTABLE,
+}
+
+MISSING = object()
+
+
+_policies = None
+
+
+def load_policies():
+    """Build the policy table from the defaults and the `rpc.cache.policies` section of config.yaml.
+
+    A policy in config.yaml can be given either as a policy name, or as a `[ttl, nseconds]` list."""
+    global _policies
+    cfg = (core.config or {}).get('rpc', {}).get('cache', {})
+    default_ttl = cfg.get('default_ttl', DEFAULT_TTL)
+
+    policies = defaultdict(lambda: (cfg.get('default_policy', TICK), default_ttl))
+    for method, policy in dict(DEFAULT_POLICIES, **(cfg.get('policies') or {})).items():
+        if isinstance(policy, str):
+            policy, ttl = policy, default_ttl
+        else:
+            policy, ttl = policy
+        if policy not in POLICIES:
+            log.warning('Invalid caching policy for rpc method {}: {}. Valid ones are: {}'
+                        .format(method, policy, ', '.join(POLICIES)))
+            continue
+        policies[method] = (policy, ttl)
+
+    _policies = policies
+    return policies
+
+
+def policy(method):
+    """Return the (policy, ttl) tuple to be used for caching the given rpc method."""
+    return (_policies or load_policies())[method]
+
+
+class SingleFlight(object):
+    """Coalesce concurrent identical calls: while a call is in flight, other threads making the
+    same call wait for it to complete and share its result (or exception) instead of making their own."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}  # type: {key: Future}
+        self.calls = 0        # number of calls actually made
+        self.saved = 0        # number of calls that waited for an identical one in flight instead
+
+    def do(self, key, func, timeout=None):
+        """Call func() unless an identical call (ie: with the same key) is already in flight, in which
+        case wait at most timeout seconds for it to complete and return its result."""
+        with self._lock:
+            f = self._in_flight.get(key)
+            leader = f is None
+            if leader:
+                f = self._in_flight[key] = Future()
+                self.calls += 1
+            else:
+                self.saved += 1
+
+        if not leader:
+            log.debug('  waiting for identical call in flight: {}'.format(key))
+            try:
+                return f.result(timeout=timeout)
+            except TimeoutError:
+                raise core.RPCTimeoutError('Timeout while waiting for identical call in flight: {}'.format(key))
+
+        try:
+            result = func()
+        except Exception as e:
+            f.set_exception(e)
+            raise
+        else:
+            f.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self):
+        return {'calls': self.calls, 'saved': self.saved}
+
+
+class RPCCache(object):
+    """Cache for the results of the rpc calls made on a single wallet.
+
+    Entries are evicted according to the caching policy of their method, and the least recently
+    used ones are dropped once the cache is full. Hits and misses are counted for each policy."""
+
+    def __init__(self, maxsize=DEFAULT_MAX_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # type: {(method, args): (policy, tag, value)}, least recently used first
+        self._lock = threading.RLock()
+        self.head_block_num = None     # head block for which the PER_BLOCK entries are valid, None if it needs checking
+        self._last_head_block_num = None
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.in_flight = SingleFlight()  # calls in flight on this wallet
+
+    def get(self, method, args, head_block_num=None):
+        """Return the cached value, or MISSING if there is none that is still valid.
+
+        head_block_num needs to be given for methods with a PER_BLOCK policy."""
+        p, ttl = policy(method)
+        if p == NEVER:
+            return MISSING
+
+        with self._lock:
+            entry = self._entries.get((method, args))
+            if entry is not None:
+                entry_policy, tag, value = entry
+                if ((entry_policy == PER_BLOCK and (head_block_num is None or tag != head_block_num)) or
+                    (entry_policy == TTL and tag < time.time())):
+                    del self._entries[(method, args)]
+                else:
+                    self._entries.move_to_end((method, args))
+                    self.hits[entry_policy] += 1
+                    return value
+
+            self.misses[p] += 1
+            return MISSING
+
+    def put(self, method, args, value, head_block_num=None):
+        """Store the value for the given call. head_block_num is the head block at the time the
+        call was made, and needs to be given for methods with a PER_BLOCK policy."""
+        p, ttl = policy(method)
+        if p == NEVER:
+            return
+
+        if isinstance(value, Exception):
+            # errors are transient, never keep them longer than the current tick
+            p = TICK
+        elif p == PER_BLOCK and head_block_num is None:
+            # we don't know which block this has been read at
+            p = TICK
+
+        tag = (head_block_num if p == PER_BLOCK else
+               time.time() + ttl if p == TTL else
+               None)
+
+        with self._lock:
+            self._entries[(method, args)] = (p, tag, value)
+            self._entries.move_to_end((method, args))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def set_head_block_num(self, head_block_num):
+        """Set the current head block and evict all PER_BLOCK entries read at a previous block."""
+        with self._lock:
+            if head_block_num != self._last_head_block_num:
+                stale = [k for k, (p, tag, _) in list(self._entries.items())
+                         if p == PER_BLOCK and tag != head_block_num]
+                for k in stale:
+                    del self._entries[k]
+                if stale:
+                    log.debug('Head block is now {}, evicted {} entries from RPC cache'.format(head_block_num, len(stale)))
+            self.head_block_num = self._last_head_block_num = head_block_num
+
+    def clear(self):
+        """Clear all TICK and expired TTL entries, and force checking the head block again."""
+        now = time.time()
+        with self._lock:
+            for k in [k for k, (p, tag, _) in list(self._entries.items())
+                      if p == TICK or (p == TTL and tag < now)]:
+                del self._entries[k]
+            self.head_block_num = None
+
+    def stats(self):
+        """Return the number of entries, hits and misses for each policy.
+
+        type: {policy: {'size': int, 'hits': int, 'misses': int}}"""
+        with self._lock:
+            sizes = defaultdict(int)
+            for p, _, _ in list(self._entries.values()):
+                sizes[p] += 1
+            return {p: {'size': sizes[p], 'hits': self.hits[p], 'misses': self.misses[p]}
+                    for p in POLICIES if p != NEVER}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(rpc_id):
+    """Return the cache for the given rpc_id. It is shared between all the clients
+    talking to the same wallet, and between the monitoring threads and the web views."""
+    try:
+        return _caches[rpc_id]
+    except KeyError:
+        pass
+
+    with _caches_lock:
+        cache = _caches.get(rpc_id)
+        if cache is None:
+            maxsize = (core.config or {}).get('rpc', {}).get('cache', {}).get('max_size', DEFAULT_MAX_SIZE)
+            cache = _caches[rpc_id] = RPCCache(maxsize=maxsize)
+        return cache
+
+
+def cache_stats():
+    """type: {rpc_id: {policy: {'size': int, 'hits': int, 'misses': int}}}"""
+    return {rpc_id: cache.stats() for rpc_id, cache in list(_caches.items())}
+
+
+def single_flight_stats():
+    """type: {rpc_id: {'calls': int, 'saved': int}}"""
+    return {rpc_id: cache.in_flight.stats() for rpc_id, cache in list(_caches.items())}
@@ -18,46 +18,148 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from .core import UnauthorizedError, RPCError, run, get_data_dir, get_bin_name,\
-    hashabledict, to_list, trace
+from .core import UnauthorizedError, RPCError, BatchNotSupportedError, RPCTimeoutError, run, get_data_dir,\
+    get_bin_name, freeze, to_list, trace
 from .feed_providers import FeedPrice
-from .process import bts_binary_running, witness_process
 from .feeds import BIT_ASSETS
-from .privatekey import PrivateKey
-from . import graphene  # needed to access DATABASE_API, NETWORK_API dynamically, can't import them directly
-from . import core
+from . import core, rpc_cache
 from collections import defaultdict, deque, OrderedDict
+from contextlib import contextmanager
 from os.path import join, expanduser
 from datetime import datetime
-from dogpile.cache import make_region
+from requests.adapters import HTTPAdapter
 import bts_tools.core  # needed to be able to exec('raise bts.core.Exception')
 import builtins        # needed to be able to reraise builtin exceptions
 import importlib
 import functools
+import threading
 import requests
+import asyncio
+import time
 import itertools
 import configparser
+import contextvars
 import json
-import copy
 import re
 import logging
 
 log = logging.getLogger(__name__)
 
+# autobahn is only imported when we actually connect to a witness node
+graphene = core.lazy_import('bts_tools.graphene')
 
-NON_CACHEABLE_METHODS = {'wallet_publish_price_feed',
-                         'wallet_publish_feeds',
-                         'wallet_publish_version'}
 
-_rpc_cache = defaultdict(dict)
 _rpc_call_id = defaultdict(int)
 
 _pubkey_cache = {}  # separate, shared cache of immutable data. type: {(chain_type, priv_key): public_key}
 
-def rpc_call(host, port, user, password,
-             funcname, *args, raw_response=False, rpc_args={}):
+# keep-alive HTTP sessions, one for each (host, port) we talk to. They are shared between the
+# monitoring threads and the web workers: the underlying urllib3 connection pool is thread-safe
+_rpc_sessions = {}
+_rpc_sessions_lock = threading.Lock()
+
+DEFAULT_RPC_POOL_SIZE = 4
+DEFAULT_RPC_TIMEOUT = 10
+
+# deadline for all the rpc calls made by the current thread or asyncio task, see rpc_deadline()
+_deadline = contextvars.ContextVar('rpc_deadline', default=None)
+
+
+def rpc_session(host, port):
+    """Return the pooled keep-alive HTTP session used for talking to the given host."""
+    try:
+        return _rpc_sessions[(host, port)]
+    except KeyError:
+        pass
+
+    with _rpc_sessions_lock:
+        # check again, another thread might have created it while we were waiting for the lock
+        session = _rpc_sessions.get((host, port))
+        if session is None:
+            pool_size = (core.config or {}).get('rpc', {}).get('pool_size', DEFAULT_RPC_POOL_SIZE)
+            log.debug('Creating HTTP session for {}:{} with a pool of {} connection(s)'.format(host, port, pool_size))
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _rpc_sessions[(host, port)] = session
+        return session
+
+
+def rpc_session_stats():
+    """Return connection reuse statistics for all the pooled HTTP sessions.
+
+    type: {(host, port): {'requests': int, 'connections': int, 'reused': int}}"""
+    result = {}
+    for (host, port), session in list(_rpc_sessions.items()):
+        stats = {'requests': 0, 'connections': 0}
+        pools = session.get_adapter('http://').poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            if pool is None:
+                continue
+            stats['requests'] += pool.num_requests
+            stats['connections'] += pool.num_connections
+        stats['reused'] = stats['requests'] - stats['connections']
+        result[(host, port)] = stats
+    return result
+
+
+def close_rpc_sessions():
+    with _rpc_sessions_lock:
+        for session in _rpc_sessions.values():
+            session.close()
+        _rpc_sessions.clear()
+
+
+@contextmanager
+def rpc_deadline(seconds):
+    """All the rpc calls made by the current thread (or asyncio task) inside this block share a
+    time budget of the given number of seconds, after which they raise RPCTimeoutError. A nested
+    deadline can only shorten the enclosing one."""
+    previous = _deadline.get()
+    deadline = time.time() + seconds if seconds is not None else None
+    if previous is not None and (deadline is None or previous < deadline):
+        deadline = previous
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def rpc_timeout(funcname, timeout=None):
+    """Return the timeout in seconds to be used for calling the given method: the given timeout,
+    otherwise the one configured for this method in config.yaml or the default one. It never goes
+    past the current deadline, and RPCTimeoutError is raised if that one has already passed."""
+    if timeout is None:
+        cfg = (core.config or {}).get('rpc', {})
+        timeout = (cfg.get('timeouts') or {}).get(funcname, cfg.get('timeout', DEFAULT_RPC_TIMEOUT))
+
+    deadline = _deadline.get()
+    if deadline is not None:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise RPCTimeoutError('Deadline exceeded before calling {}'.format(funcname))
+        timeout = remaining if timeout is None else min(timeout, remaining)
+
+    return timeout
+
+
+def _rpc_post(host, port, user, password, payload, timeout):
     url = 'http://%s:%d/rpc' % (host, port)
     headers = {'content-type': 'application/json'}
+    try:
+        return rpc_session(host, port).post(url,
+                                            auth=(user, password),
+                                            data=json.dumps(payload),
+                                            headers=headers,
+                                            timeout=timeout)
+    except requests.exceptions.Timeout as e:
+        raise RPCTimeoutError('No response from {}:{} after {:.1f} seconds'.format(host, port, timeout)) from e
+
+
+def _rpc_payload(host, port, funcname, args, rpc_args):
     _rpc_call_id[(host, port)] += 1
 
     payload = {
@@ -68,11 +170,22 @@ def rpc_call(host, port, user, password,
     }
 
     payload.update(rpc_args or {})
+    return payload
+
 
-    response = requests.post(url,
-                             auth=(user, password),
-                             data=json.dumps(payload),
-                             headers=headers)
+def _rpc_error(r, payload):
+    if 'detail' in r['error']:
+        return RPCError(r['error']['detail'] + '\n\nFor RPC call:\n{}'.format(json.dumps(payload, indent=4)))
+    else:
+        return RPCError(r['error']['message'] + '\n\nFor RPC call:\n{}'.format(json.dumps(payload, indent=4)))
+
+
+def rpc_call(host, port, user, password,
+             funcname, *args, raw_response=False, rpc_args={}, timeout=None):
+    """Call the given method over JSON-RPC. timeout is in seconds, None means wait forever."""
+    payload = _rpc_payload(host, port, funcname, args, rpc_args)
+
+    response = _rpc_post(host, port, user, password, payload, timeout)
 
     log.debug('  received: %s %s' % (type(response), response))
 
@@ -85,14 +198,184 @@ def rpc_call(host, port, user, password,
         return r
 
     if 'error' in r:
-        if 'detail' in r['error']:
-            raise RPCError(r['error']['detail'] + '\n\nFor RPC call:\n{}'.format(json.dumps(payload, indent=4)))
-        else:
-            raise RPCError(r['error']['message'] + '\n\nFor RPC call:\n{}'.format(json.dumps(payload, indent=4)))
+        raise _rpc_error(r, payload)
 
     return r['result']
 
 
+def rpc_batch_call(host, port, user, password, calls, rpc_args={}, timeout=None):
+    """Send all the given calls in a single JSON-RPC batch request.
+
+    calls is a list of (funcname, args) tuples. Returns a list containing, for each
+    call and in the same order, either its result or the RPCError it raised."""
+    payload = [_rpc_payload(host, port, funcname, args, rpc_args) for funcname, args in calls]
+
+    response = _rpc_post(host, port, user, password, payload, timeout)
+
+    log.debug('  received: %s %s' % (type(response), response))
+
+    if response.status_code == 401:
+        raise UnauthorizedError()
+
+    try:
+        r = response.json()
+    except ValueError as e:
+        raise BatchNotSupportedError('Invalid response to batch request on {}:{}'.format(host, port)) from e
+
+    if not isinstance(r, list):
+        raise BatchNotSupportedError('{}:{} does not support JSON-RPC batch requests'.format(host, port))
+
+    responses = {res.get('id'): res for res in r}
+    result = []
+    for p in payload:
+        res = responses.get(p['id'])
+        if res is None:
+            result.append(RPCError('No response for batched RPC call:\n{}'.format(json.dumps(p, indent=4))))
+        elif 'error' in res:
+            result.append(_rpc_error(res, p))
+        else:
+            result.append(res['result'])
+
+    return result
+
+
+_SCALAR_TYPES = {str, int, float, bool, type(None)}
+
+
+def _args_key(args):
+    """Return a cheap canonical cache key for the given call args. This is the args tuple itself when
+    all of them are scalars (ie: most of the calls), and their canonical json representation otherwise."""
+    for arg in args:
+        if type(arg) not in _SCALAR_TYPES:
+            return json.dumps(args, sort_keys=True, separators=(',', ':'), default=str)
+    return args
+
+
+_OBJECT_ID = re.compile(r'^\d+\.\d+\.\d+$')
+
+
+def _ws_object(oid):
+    objects = yield ('get_objects', [oid])
+    if not objects or objects[0] is None:
+        raise RPCError('No object with id {}'.format(oid))
+    return objects[0]
+
+
+def _ws_get_account(name_or_id):
+    if _OBJECT_ID.match(name_or_id):
+        return (yield from _ws_object(name_or_id))
+    account = yield ('get_account_by_name', name_or_id)
+    if account is None:
+        raise RPCError('No account with name {}'.format(name_or_id))
+    return account
+
+
+def _ws_get_witness(owner):
+    if owner.startswith('1.6.'):
+        return (yield from _ws_object(owner))
+    account = yield from _ws_get_account(owner)
+    witness = yield ('get_witness_by_account', account['id'])
+    if witness is None:
+        raise RPCError('Account {} is not registered as a witness'.format(owner))
+    return witness
+
+
+def _ws_get_committee_member(owner):
+    if owner.startswith('1.5.'):
+        return (yield from _ws_object(owner))
+    account = yield from _ws_get_account(owner)
+    member = yield ('get_committee_member_by_account', account['id'])
+    if member is None:
+        raise RPCError('Account {} is not registered as a committee member'.format(owner))
+    return member
+
+
+def _ws_get_asset(symbol_or_id):
+    if _OBJECT_ID.match(symbol_or_id):
+        return (yield from _ws_object(symbol_or_id))
+    assets = yield ('lookup_asset_symbols', [symbol_or_id])
+    if not assets or assets[0] is None:
+        raise RPCError('No asset with symbol {}'.format(symbol_or_id))
+    return assets[0]
+
+
+def _ws_get_bitasset_data(symbol_or_id):
+    asset = yield from _ws_get_asset(symbol_or_id)
+    if 'bitasset_data_id' not in asset:
+        raise RPCError('Asset {} is not a bitasset'.format(symbol_or_id))
+    return (yield from _ws_object(asset['bitasset_data_id']))
+
+
+def _ws_get_block_header_batch(block_nums):
+    headers = yield ('get_block_header_batch', block_nums)  # map serialized as a list of [block_num, header] pairs
+    headers = {int(n): header for n, header in (headers.items() if isinstance(headers, dict) else headers)}
+    return [headers.get(n) for n in block_nums]
+
+
+def _ws_route(steps):
+    """Make a translator out of a generator function, which yields the (method, *args) calls to
+    the database api it needs and receives their results.
+
+    The translator sends these calls using the blocking `call(method, *args)` function it is
+    given, while AsyncGrapheneClient awaits them on its event loop using the same steps."""
+    def translator(call, *args):
+        gen = steps(*args)
+        try:
+            method, *call_args = next(gen)
+            while True:
+                method, *call_args = gen.send(call(method, *call_args))
+        except StopIteration as e:
+            return e.value
+    translator.steps = steps
+    return translator
+
+
+async def _ws_route_async(route, call, *args):
+    """Same as calling the given translator, with `call(method, *args)` being a coroutine."""
+    gen = route.steps(*args)
+    try:
+        method, *call_args = next(gen)
+        while True:
+            method, *call_args = gen.send(await call(method, *call_args))
+    except StopIteration as e:
+        return e.value
+
+
+def _ws_same_call(funcname):
+    def steps(*args):
+        return (yield (funcname,) + args)
+    translator = _ws_route(steps)
+    translator.ws_method = funcname  # single call, can be pipelined with the other ones in a batch
+    return translator
+
+
+# read-only wallet methods that can be sent directly to the witness node over its websocket
+# connection instead of going through the cli_wallet. Each one maps to a translator function
+# taking a `call(method, *args)` function for the database api, and the args of the wallet method.
+# Note: blocks read from the database api don't have the 'block_id', 'signing_key' and
+#       'transaction_ids' fields that the cli_wallet adds
+WS_ROUTES = {
+    'get_block': _ws_same_call('get_block'),
+    # not available on the cli_wallet, only on the database api of the witness node
+    'get_block_header': _ws_same_call('get_block_header'),
+    'get_block_header_batch': _ws_route(_ws_get_block_header_batch),
+    'get_account': _ws_route(_ws_get_account),
+    'get_witness': _ws_route(_ws_get_witness),
+    'get_committee_member': _ws_route(_ws_get_committee_member),
+    'get_asset': _ws_route(_ws_get_asset),
+    'get_bitasset_data': _ws_route(_ws_get_bitasset_data),
+    'get_global_properties': _ws_same_call('get_global_properties'),
+    'get_dynamic_global_properties': _ws_same_call('get_dynamic_global_properties'),
+}
+
+
+def _raise_if_error(result):
+    """Raise the given result if it is an exception, as returned in the list of results of a batch call."""
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
 ALL_SLOTS = {}
 
 
@@ -161,46 +444,109 @@ class GrapheneClient(object):
         self.witness_id = witness_id
         self.witness_signing_key = signing_key or self.witness_signing_key
 
-        # direct json-rpc call
-        def direct_call(funcname, *args):
+        def check_running():
             # we want to avoid connecting to the client and block because
             # it is in a stopped state (eg: in gdb after having crashed)
-
-
             if self.witness_host is not None and self.witness_port is not None:
                 # check pre-emptively whether the witness client is running to avoid timeouts on the rpc call
-                # TODO: verify we do indeed have timeouts
+                from .process import bts_binary_running
                 if (client_name in core.config.get('clients', []) and
                     self.is_localhost() and not bts_binary_running(self)):
                     raise RPCError('Connection aborted: {} binary does not seem to be running'.format(self.type()))
 
+        def endpoint():
+            """return the (host, port, user, password, rpc_args) to be used for json-rpc calls"""
             if self.proxy_host is not None and self.proxy_port is not None:
-                return rpc_call(self.proxy_host, self.proxy_port,
-                                None, None,
-                                funcname, *args,
-                                rpc_args=dict(proxy_user=self.proxy_user,
-                                              proxy_password=self.proxy_password,
-                                              wallet_port=self.wallet_port))
+                return (self.proxy_host, self.proxy_port, None, None,
+                        dict(proxy_user=self.proxy_user,
+                             proxy_password=self.proxy_password,
+                             wallet_port=self.wallet_port))
+
+            return self.wallet_host, self.wallet_port, self.wallet_user, self.wallet_password, None
+
+        def ws_call(timeout):
+            """return a function calling the database api of the witness node over the websocket"""
+            def call(method, *args):
+                return graphene.ws_rpc_call(self.witness_host, self.witness_port, graphene.Api.DATABASE_API,
+                                            method, *args, timeout=timeout or DEFAULT_RPC_TIMEOUT)
+            return call
+
+        # direct json-rpc call, or websocket call to the witness node for the methods that support it
+        def direct_call(funcname, *args, timeout=None):
+            check_running()
+            route = self.ws_route(funcname)
+            if route is not None:
+                return route(ws_call(timeout), *args)
+            host, port, user, password, rpc_args = endpoint()
+            return rpc_call(host, port, user, password, funcname, *args, rpc_args=rpc_args, timeout=timeout)
+
+        # direct json-rpc batch call, with the calls that support it sent to the witness node instead
+        def direct_batch_call(calls, timeout=None):
+            check_running()
+            result = [None] * len(calls)
+            wallet_calls = []
+            pipelined_calls = []  # sent all at once on the websocket connection
+            for i, (funcname, args) in enumerate(calls):
+                route = self.ws_route(funcname)
+                if route is None:
+                    wallet_calls.append(i)
+                elif getattr(route, 'ws_method', None) is not None:
+                    pipelined_calls.append((i, route.ws_method))
+                else:
+                    try:
+                        result[i] = route(ws_call(timeout), *args)
+                    except RPCError as e:
+                        result[i] = e
 
-            return rpc_call(self.wallet_host, self.wallet_port,
-                            self.wallet_user, self.wallet_password,
-                            funcname, *args)
+            if pipelined_calls:
+                try:
+                    ws_result = graphene.ws_rpc_batch(self.witness_host, self.witness_port, graphene.Api.DATABASE_API,
+                                                      [(method, calls[i][1]) for i, method in pipelined_calls],
+                                                      timeout=timeout or DEFAULT_RPC_TIMEOUT)
+                except RPCError as e:
+                    ws_result = [e] * len(pipelined_calls)
+                for (i, _), r in zip(pipelined_calls, ws_result):
+                    result[i] = r
+
+            if wallet_calls:
+                wallet_result = wallet_batch_call([calls[i] for i in wallet_calls], timeout)
+                for i, r in zip(wallet_calls, wallet_result):
+                    result[i] = r
+            return result
+
+        # json-rpc batch call on the wallet, falls back to sequential calls if the wallet doesn't support batches
+        def wallet_batch_call(calls, timeout=None):
+            host, port, user, password, rpc_args = endpoint()
+            if self._batch_supported:
+                try:
+                    return rpc_batch_call(host, port, user, password, calls, rpc_args=rpc_args, timeout=timeout)
+                except BatchNotSupportedError as e:
+                    log.info('{}, falling back to sequential calls'.format(e))
+                    self._batch_supported = False
 
+            result = []
+            for funcname, args in calls:
+                try:
+                    result.append(rpc_call(host, port, user, password, funcname, *args, rpc_args=rpc_args,
+                                           timeout=rpc_timeout(funcname, timeout)))
+                except RPCError as e:
+                    result.append(e)
+            return result
+
+        self._batch_supported = True
+        self._rpc_batch_call = direct_batch_call
         self._rpc_call = direct_call
 
         if core.config.get('profile', False):
             self._rpc_call = core.profile(self._rpc_call)
+            self._rpc_batch_call = core.profile(self._rpc_batch_call)
 
         self.opts = kwargs
         if self.opts:
             log.debug('Additional opts for node {} - {}'.format(self.name, self.opts))
 
-        # get a special "smart" cache for slots as it is a very expensive call
-        self._slot_cache = make_region().configure('dogpile.cache.memory')
-
-        # caches for committee member and witness names
-        self._witness_names = {}
-        self._committee_member_names = {}
+        # shared with all other clients connected to the same wallet
+        self._cache = rpc_cache.get_cache(self.rpc_id)
 
     def __str__(self):
         try:
@@ -216,49 +562,131 @@ class GrapheneClient(object):
     def __getattr__(self, funcname):
         if funcname.startswith('_'):
             raise AttributeError
-        def call(*args, cached=True):
-            return self.rpc_call(funcname, *args, cached=cached)
+        def call(*args, cached=True, timeout=None):
+            return self.rpc_call(funcname, *args, cached=cached, timeout=timeout)
         return call
 
-    def rpc_call(self, funcname, *args, cached=True):
-        log.debug(('RPC call @ %s: %s(%s)' % (self.rpc_id, funcname, ', '.join(repr(arg) for arg in args))
-                  + (' (cached = False)' if not cached else '')))
-        args = tuple(hashabledict(arg) if isinstance(arg, dict) else
-                     tuple(arg) if isinstance(arg, list) else
-                     arg
-                     for arg in args)
-
-        if cached and funcname not in NON_CACHEABLE_METHODS:
-            if (funcname, args) in _rpc_cache[self.rpc_id]:
-                result = _rpc_cache[self.rpc_id][(funcname, args)]
-                if isinstance(result, Exception):
-                    log.debug('  using cached exception %s' % result.__class__)
-                    raise result
-                else:
-                    log.debug('  using cached result')
-                    return copy.copy(result)
+    def _cache_head_block_num(self, funcname):
+        """Return the head block number against which per-block cache entries are validated, or None
+        if the given method doesn't have a per-block caching policy.
+
+        This is read at most once between 2 calls to clear_rpc_cache(), and when it has advanced
+        all per-block entries read at a previous head block are evicted."""
+        if rpc_cache.policy(funcname)[0] != rpc_cache.PER_BLOCK:
+            return None
+
+        head = self._cache.head_block_num
+        if head is None:
+            try:
+                head = self.get_head_block_num()
+            except Exception:
+                return None  # we can't tell, per-block entries will only be kept for the current tick
+            self._cache.set_head_block_num(head)
+
+        return head
+
+    def cached(self, funcname, args, compute):
+        """Return the cached value for funcname(*args), calling compute() to get it if needed.
+
+        This allows to use the rpc cache policies for values computed out of several rpc calls."""
+        key = _args_key(args)
+        result = self._cache.get(funcname, key, self._cache_head_block_num(funcname))
+        if result is rpc_cache.MISSING:
+            result = freeze(compute())
+            self._cache.put(funcname, key, result, self._cache_head_block_num(funcname))
+        return result
 
+    def rpc_call(self, funcname, *args, cached=True, timeout=None):
+        """Call the given method on the wallet. The result is returned as a read-only structure (see
+        core.freeze) which is shared with the cache, use copy.copy() on it if you need to modify it.
+
+        timeout defaults to the one configured for this method (see rpc_timeout), and the call
+        raises RPCTimeoutError if it doesn't complete in time."""
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(('RPC call @ %s: %s(%s)' % (self.rpc_id, funcname, ', '.join(repr(arg) for arg in args))
+                      + (' (cached = False)' if not cached else '')))
+        key = _args_key(args)
+
+        # get the head block before doing the call, so results are never tagged with a newer block than they were read at
+        head_block_num = self._cache_head_block_num(funcname)
+
+        if cached:
+            result = self._cache.get(funcname, key, head_block_num)
+            if isinstance(result, Exception):
+                log.debug('  using cached exception %s' % result.__class__)
+                raise result
+            elif result is not rpc_cache.MISSING:
+                log.debug('  using cached result')
+                return result
+
+        def call():
+            return freeze(self._rpc_call(funcname, *args, timeout=timeout))
+
+        timeout = rpc_timeout(funcname, timeout)
         try:
-            result = self._rpc_call(funcname, *args)
+            if rpc_cache.policy(funcname)[0] == rpc_cache.NEVER:
+                result = call()  # never coalesce calls with side effects
+            else:
+                # concurrent identical calls (eg: from the monitoring and the web threads) share the same request
+                result = self._cache.in_flight.do((funcname, key), call, timeout=timeout)
         except Exception as e:
             # also cache when exceptions are raised
-            if funcname not in NON_CACHEABLE_METHODS:
-                _rpc_cache[self.rpc_id][(funcname, args)] = e
-                log.debug('  added exception %s in cache: %s' % (e.__class__, str(e)))
+            self._cache.put(funcname, key, e, head_block_num)
             raise
 
-        if funcname not in NON_CACHEABLE_METHODS:
-            _rpc_cache[self.rpc_id][(funcname, args)] = result
-            log.debug('  added result in cache')
+        self._cache.put(funcname, key, result, head_block_num)
+
+        return result
 
-        return copy.copy(result)
+    def rpc_batch(self, calls, cached=True, timeout=None):
+        """Perform all the given calls using a single JSON-RPC batch request.
+
+        calls is a list of (funcname, args) tuples. Returns a list containing, for each call
+        and in the same order, either its result or the RPCError it raised. Calls that already
+        have a value in the RPC cache are not sent, and new results are added to the cache.
+        With cached=False, the cache is not used at all (eg: for fetching lots of blocks once).
+
+        timeout defaults to the longest one configured for the methods being called."""
+        log.debug('RPC batch call @ %s: %d calls' % (self.rpc_id, len(calls))
+                  + (' (cached = False)' if not cached else ''))
+
+        keys = [_args_key(tuple(args)) for _, args in calls]  # same keys as rpc_call(), args are usually given as lists
+        head_blocks = [self._cache_head_block_num(funcname) if cached else None for funcname, _ in calls]
+        result = [None] * len(calls)
+        to_send = []
+        for i, (funcname, args) in enumerate(calls):
+            r = self._cache.get(funcname, keys[i], head_blocks[i]) if cached else rpc_cache.MISSING
+            if r is rpc_cache.MISSING:
+                to_send.append(i)
+            else:
+                result[i] = r
+
+        if to_send:
+            log.debug('  sending %d calls, %d from cache' % (len(to_send), len(calls) - len(to_send)))
+            if timeout is None:
+                timeouts = [rpc_timeout(calls[i][0]) for i in to_send]
+                timeout = None if None in timeouts else max(timeouts)
+            else:
+                timeout = rpc_timeout(calls[to_send[0]][0], timeout)
+            batch_result = self._rpc_batch_call([calls[i] for i in to_send], timeout=timeout)
+            for i, r in zip(to_send, batch_result):
+                r = freeze(r)
+                if cached:
+                    self._cache.put(calls[i][0], keys[i], r, head_blocks[i])
+                result[i] = r
+
+        return result
+
+    def set_head_block_num(self, head_block_num):
+        """Notify the client that a new head block has been applied (eg: when pushed by the witness
+        node), so the per-block entries of its rpc cache are refreshed without polling the wallet."""
+        self._cache.set_head_block_num(head_block_num)
 
     def clear_rpc_cache(self):
-        try:
-            log.debug('Clearing RPC cache for host: %s:%d' % self.rpc_id)
-            del _rpc_cache[self.rpc_id]
-        except KeyError:
-            pass
+        """Clear the RPC cache for this client, except for the results whose caching policy
+        allows them to live longer than a single tick (see rpc_cache.POLICIES)."""
+        log.debug('Clearing RPC cache for host: %s:%d' % self.rpc_id)
+        self._cache.clear()
 
     def ws_rpc_call(self, api, method, *args):
         log.debug('WebSocket RPC call @ %s: %s::%s(%s)' % (self.ws_rpc_id,
@@ -268,6 +696,24 @@ class GrapheneClient(object):
 
         return graphene.ws_rpc_call(self.witness_host, self.witness_port, api, method, *args)
 
+    def ws_route(self, funcname):
+        """Return the translator (see WS_ROUTES) to be used for sending the given wallet method
+        directly to the witness node, or None if it needs to go through the cli_wallet.
+
+        The routing can be changed in the `rpc.routing` section of config.yaml."""
+        route = ((core.config or {}).get('rpc', {}).get('routing') or {}).get(funcname)
+        if route == 'wallet' or (route is None and funcname not in WS_ROUTES):
+            return None
+        if (self.proxy_host or self.affiliation() != 'bts' or
+            not graphene.is_connected(self.witness_host, self.witness_port)):
+            return None  # only bts has all the database api calls, and only when we are connected to it
+        return WS_ROUTES.get(funcname) or _ws_same_call(funcname)
+
+    def ws_rpc_batch(self, api, calls):
+        log.debug('WebSocket RPC batch call @ %s: %s: %d calls' % (self.ws_rpc_id, graphene.api_name(api), len(calls)))
+
+        return graphene.ws_rpc_batch(self.witness_host, self.witness_port, api, calls)
+
     def get_account_balance(self, account, symbol):
         log.debug('get_account_balance for asset %s in %s' % (symbol, account))
         asset = self.blockchain_get_asset(symbol)
@@ -294,6 +740,7 @@ class GrapheneClient(object):
             return 'online'
 
         except (requests.exceptions.ConnectionError,  # http connection refused
+                RPCTimeoutError,                      # wallet is stuck (eg: stopped in gdb) or too slow to answer
                 RPCError,                             # bts binary is not running, no connection attempted
                 RuntimeError) as e:                   # host is down, ssh doesn't work
             log.debug('Seems like {} wallet on {}:{} is offline because: {}'
@@ -334,35 +781,45 @@ class GrapheneClient(object):
         # the config file only specifies the private key, we need to derive the public key
         public_key = _pubkey_cache.get((self.type(), self.witness_signing_key))
         if public_key is None:
+            from .privatekey import PrivateKey
             private_key = PrivateKey(self.witness_signing_key)
             public_key = format(private_key.pubkey, self.type())
             _pubkey_cache[(self.type(), self.witness_signing_key)] = public_key
 
         return public_key == self.get_witness(self.name)['signing_key']
 
-    # FIXME: use a decorator for this (forever) caching (also see bitasset_data)
     def get_witness_name(self, witness_id):
-        try:
-            return self._witness_names[witness_id]
-        except KeyError:
-            pass
+        return self.get_witness_names([witness_id])[0]
 
-        result = self.get_account(self.get_witness(witness_id)['witness_account'])['name']
-        self._witness_names[witness_id] = result
+    def get_witness_names(self, witness_ids):
+        """Return the names of all the given witnesses, using at most 2 batch rpc calls."""
+        names = {wid: self._cache.get('witness_name', _args_key((wid,))) for wid in witness_ids}
+        missing = [wid for wid, name in names.items() if name is rpc_cache.MISSING]
+        if missing:
+            witnesses = self.rpc_batch([('get_witness', [wid]) for wid in missing])
+            accounts = self.rpc_batch([('get_account', [_raise_if_error(w)['witness_account']]) for w in witnesses])
+            for wid, account in zip(missing, accounts):
+                names[wid] = _raise_if_error(account)['name']
+                self._cache.put('witness_name', _args_key((wid,)), names[wid])
 
-        return result
+        return [names[wid] for wid in witness_ids]
 
-    # FIXME: use a decorator for this (forever) caching (also see bitasset_data)
     def get_committee_member_name(self, committee_member_id):
-        try:
-            return self._committee_member_names[committee_member_id]
-        except KeyError:
-            pass
-
-        result = self.get_account(self.get_committee_member(committee_member_id)['committee_member_account'])['name']
-        self._committee_member_names[committee_member_id] = result
-
-        return result
+        return self.get_committee_member_names([committee_member_id])[0]
+
+    def get_committee_member_names(self, committee_member_ids):
+        """Return the names of all the given committee members, using at most 2 batch rpc calls."""
+        names = {cid: self._cache.get('committee_member_name', _args_key((cid,))) for cid in committee_member_ids}
+        missing = [cid for cid, name in names.items() if name is rpc_cache.MISSING]
+        if missing:
+            members = self.rpc_batch([('get_committee_member', [cid]) for cid in missing])
+            accounts = self.rpc_batch([('get_account', [_raise_if_error(m)['committee_member_account']])
+                                       for m in members])
+            for cid, account in zip(missing, accounts):
+                names[cid] = _raise_if_error(account)['name']
+                self._cache.put('committee_member_name', _args_key((cid,)), names[cid])
+
+        return [names[cid] for cid in committee_member_ids]
 
     def network_get_info(self):
         if not self.proxy_host:
@@ -398,6 +855,7 @@ class GrapheneClient(object):
         return self.ws_rpc_call(graphene.Api.DATABASE_API, 'get_objects', [oid])
 
     def process(self):
+        from .process import witness_process
         return witness_process(self)
 
     def client(self):
@@ -438,8 +896,7 @@ class GrapheneClient(object):
         if self.affiliation() == 'steem':
             return self.rpc_call('get_active_witnesses')
         else:
-            return [self.get_witness_name(w)
-                    for w in self.info()['active_witnesses']]
+            return self.get_witness_names(self.info()['active_witnesses'])
 
     def is_active(self, witness):
         try:
@@ -473,28 +930,35 @@ class GrapheneClient(object):
 
     def asset_data(self, asset):
         # bitAssets data (id, precision, etc.) don't ever change, so cache them forever
-        try:
-            all_data = self._all_bitassets_data
-        except AttributeError:
+        def all_bitassets_data():
             all_data = {}
-            for asset_name in BIT_ASSETS | {'BTS'}:
-                asset_data = self.get_asset(asset_name)
+            asset_names = sorted(BIT_ASSETS | {'BTS'})
+            for asset_name, asset_data in zip(asset_names,
+                                              self.rpc_batch([('get_asset', [a]) for a in asset_names])):
+                if isinstance(asset_data, Exception):
+                    log.debug('Unknown blockchain asset: {}'.format(asset_name))
+                    continue
                 all_data[asset_name] = asset_data        # resolve SYMBOL
                 all_data[asset_data['id']] = asset_data  # resolve id
+            return all_data
 
-            self._all_bitassets_data = all_data
+        return self.cached('asset_data', (), all_bitassets_data)[asset]
 
-        return all_data[asset]
-
-    def get_blockchain_feeds(self, asset_list):
+    def get_bitasset_data_list(self, asset_list):
+        """Return a list of (asset, bitasset_data) for all valid assets in the given list,
+        using a single batch rpc call."""
+        asset_list = list(asset_list)
         result = []
-        for asset in asset_list:
-            try:
-                asset_data = self.get_bitasset_data(asset)
-            except RPCError:
+        for asset, asset_data in zip(asset_list, self.rpc_batch([('get_bitasset_data', [a]) for a in asset_list])):
+            if isinstance(asset_data, RPCError):
                 log.warning('Unknown blockchain asset: {}'.format(asset))
                 continue
+            result.append((asset, asset_data))
+        return result
 
+    def get_blockchain_feeds(self, asset_list):
+        result = []
+        for asset, asset_data in self.get_bitasset_data_list(asset_list):
             try:
                 base  = asset_data['current_feed']['settlement_price']['base']
                 quote = asset_data['current_feed']['settlement_price']['quote']
@@ -514,13 +978,7 @@ class GrapheneClient(object):
         witness_id = self.get_witness(witness_name)['witness_account']
         asset_list = asset_list or BIT_ASSETS
         result = []
-        for asset in asset_list:
-            try:
-                asset_data = self.get_bitasset_data(asset)
-            except RPCError:
-                log.warning('Unknown blockchain asset: {}'.format(asset))
-                continue
-
+        for asset, asset_data in self.get_bitasset_data_list(asset_list):
             try:
                 for feed in asset_data['feeds']:
                     if feed[0] == witness_id:
@@ -542,11 +1000,161 @@ class GrapheneClient(object):
 
         return result
 
-
 nodes = []
 main_node = None
 
 
+class AsyncGrapheneClient(object):
+    """Asyncio version of a GrapheneClient: it has the same methods, but they return coroutines.
+
+    Calls to the witness websocket, including the wallet methods routed there (see WS_ROUTES),
+    are sent on the connection's event loop and awaited without blocking a thread. They share
+    the rpc cache of the GrapheneClient. Calls to the cli_wallet are blocking HTTP requests on
+    the pooled sessions, so they are run in the default executor of the event loop, as are the
+    methods that GrapheneClient builds on top of several calls (eg: info, get_witness_names).
+
+    Calls on several clients can be run concurrently using asyncio.gather()."""
+
+    def __init__(self, client):
+        self.client = client  # the GrapheneClient to which calls are delegated
+
+    def __str__(self):
+        return str(self.client)
+
+    def __repr__(self):
+        return '<AsyncGrapheneClient(%s)>' % str(self.client)
+
+    def __getattr__(self, funcname):
+        if funcname.startswith('_'):
+            raise AttributeError(funcname)
+
+        if funcname in vars(self.client):
+            return getattr(self.client, funcname)  # instance attribute, eg: name, rpc_id
+
+        if not hasattr(type(self.client), funcname):
+            # not implemented by GrapheneClient, forward it directly to the wallet
+            async def call(*args, cached=True, timeout=None):
+                return await self.rpc_call(funcname, *args, cached=cached, timeout=timeout)
+            return call
+
+        async def call(*args, **kwargs):
+            return await self._run_in_executor(getattr(self.client, funcname), *args, **kwargs)
+        return call
+
+    async def _run_in_executor(self, func, *args, **kwargs):
+        # the deadline of the calling task also applies to the calls made in the executor
+        deadline = _deadline.get()
+
+        def run():
+            with rpc_deadline(None if deadline is None else deadline - time.time()):
+                return func(*args, **kwargs)
+
+        return await asyncio.get_event_loop().run_in_executor(None, run)
+
+    async def _cache_head_block_num(self, funcname):
+        if self.client._cache.head_block_num is None and rpc_cache.policy(funcname)[0] == rpc_cache.PER_BLOCK:
+            # need to ask the wallet for it
+            return await self._run_in_executor(self.client._cache_head_block_num, funcname)
+        return self.client._cache_head_block_num(funcname)
+
+    def _ws_call(self, timeout):
+        async def call(method, *args):
+            return await graphene.ws_rpc_call_async(self.client.witness_host, self.client.witness_port,
+                                                    graphene.Api.DATABASE_API, method, *args,
+                                                    timeout=timeout or DEFAULT_RPC_TIMEOUT)
+        return call
+
+    async def rpc_call(self, funcname, *args, cached=True, timeout=None):
+        route = self.client.ws_route(funcname)
+        if route is None:
+            return await self._run_in_executor(self.client.rpc_call, funcname, *args, cached=cached, timeout=timeout)
+
+        # same as GrapheneClient.rpc_call(), awaiting the websocket calls instead of blocking on them
+        key = _args_key(args)
+        head_block_num = await self._cache_head_block_num(funcname)
+        if cached:
+            result = self.client._cache.get(funcname, key, head_block_num)
+            if isinstance(result, Exception):
+                raise result
+            elif result is not rpc_cache.MISSING:
+                return result
+
+        try:
+            result = freeze(await _ws_route_async(route, self._ws_call(rpc_timeout(funcname, timeout)), *args))
+        except Exception as e:
+            self.client._cache.put(funcname, key, e, head_block_num)
+            raise
+
+        self.client._cache.put(funcname, key, result, head_block_num)
+        return result
+
+    async def rpc_batch(self, calls, cached=True, timeout=None):
+        """Same as GrapheneClient.rpc_batch(): the calls routed to the witness node are awaited
+        concurrently, and the other ones sent to the wallet in a single batch."""
+        async def routed_call(funcname, args):
+            try:
+                return await self.rpc_call(funcname, *args, cached=cached, timeout=timeout)
+            except RPCError as e:
+                return e
+
+        async def wallet_batch(calls):
+            return await self._run_in_executor(self.client.rpc_batch, calls, cached=cached, timeout=timeout)
+
+        routed = [self.client.ws_route(funcname) is not None for funcname, _ in calls]
+        wallet_calls = [c for c, r in zip(calls, routed) if not r]
+        results = await asyncio.gather(*[routed_call(*c) for c, r in zip(calls, routed) if r],
+                                       *([wallet_batch(wallet_calls)] if wallet_calls else []))
+        routed_results = iter(results[:len(calls) - len(wallet_calls)])
+        wallet_results = iter(results[-1] if wallet_calls else [])
+        return [next(routed_results) if r else next(wallet_results) for r in routed]
+
+    async def ws_rpc_call(self, api, method, *args, timeout=None):
+        log.debug('Async WebSocket RPC call @ %s: %s::%s(%s)' % (self.client.ws_rpc_id,
+                                                               graphene.api_name(api),
+                                                               method,
+                                                               ', '.join(repr(arg) for arg in args)))
+        return await graphene.ws_rpc_call_async(self.client.witness_host, self.client.witness_port,
+                                                api, method, *args, timeout=rpc_timeout(method, timeout))
+
+    async def ws_rpc_batch(self, api, calls, timeout=None):
+        """Same as GrapheneClient.ws_rpc_batch: return, for each call, either its result or the RPCError it raised."""
+        return await asyncio.gather(*(self.ws_rpc_call(api, method, *args, timeout=timeout) for method, args in calls),
+                                    return_exceptions=True)
+
+    async def network_get_info(self):
+        if not self.client.proxy_host:
+            return await self.ws_rpc_call(graphene.Api.NETWORK_API, 'get_info')
+        else:
+            return await self.rpc_call('network_get_info')
+
+    async def network_get_connected_peers(self):
+        if not self.client.proxy_host:
+            return [p['info'] for p in await self.ws_rpc_call(graphene.Api.NETWORK_API, 'get_connected_peers')]
+        else:
+            return await self.rpc_call('network_get_connected_peers')
+
+    async def network_get_potential_peers(self):
+        if not self.client.proxy_host:
+            return await self.ws_rpc_call(graphene.Api.NETWORK_API, 'get_potential_peers')
+        else:
+            return await self.rpc_call('network_get_potential_peers')
+
+    async def network_set_advanced_node_parameters(self, params):
+        if not self.client.proxy_host:
+            return await self.ws_rpc_call(graphene.Api.NETWORK_API, 'set_advanced_node_parameters', params)
+        else:
+            return await self.rpc_call('network_set_advanced_node_parameters', params)
+
+    async def network_get_advanced_node_parameters(self):
+        if not self.client.proxy_host:
+            return await self.ws_rpc_call(graphene.Api.NETWORK_API, 'get_advanced_node_parameters')
+        else:
+            return await self.rpc_call('network_get_advanced_node_parameters')
+
+    async def get_object(self, oid):
+        return await self.ws_rpc_call(graphene.Api.DATABASE_API, 'get_objects', [oid])
+
+
 def load_graphene_clients():
     global nodes, main_node
     nodes = []
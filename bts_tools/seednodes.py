@@ -158,9 +158,6 @@ def check_valid_seed_nodes():
                 for host, i, provider in found:
                     log.error(' - {}  ({})'.format(host, provider))
 
-# basic check when launching the app
-check_valid_seed_nodes()
-
 
 def check_seed_status(seed):
     host, port = seed.split(':')
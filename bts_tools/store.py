@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bts_tools - Tools to easily manage the bitshares client
+# Copyright (c) 2018 Nicolas Wack <wackou@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Persistent storage of the indexing database (see core.db) in a SQLite file.
+
+The db is still used as a dict in memory by the monitoring plugins, but instead of being dumped
+all at once when exiting, the counters of each client are committed regularly to the SQLite
+file. The store also keeps a compact record of every block (number, witness, timestamp) with
+hourly and daily rollups of the blocks produced and missed by each witness, so that production
+statistics can be queried without going through the blockchain again."""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+import calendar
+import threading
+import sqlite3
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS clients (
+    id INTEGER PRIMARY KEY,
+    rpc_id TEXT NOT NULL UNIQUE,      -- host:port of the wallet
+    last_indexed_block INTEGER NOT NULL DEFAULT 0,
+    static TEXT NOT NULL DEFAULT '{}' -- json
+);
+
+CREATE TABLE IF NOT EXISTS witnesses (
+    rpc_id TEXT NOT NULL,
+    witness TEXT NOT NULL,
+    total_produced INTEGER,
+    last_produced TEXT,
+    total_missed INTEGER,
+    last_missed TEXT,
+    streak INTEGER,
+    PRIMARY KEY (rpc_id, witness)
+);
+
+-- witness is as given in the blocks: its id on bts chains (eg: 1.6.N), its name on steem chains
+-- timestamp is in seconds since epoch
+CREATE TABLE IF NOT EXISTS blocks (
+    client INTEGER NOT NULL,
+    block_num INTEGER NOT NULL,
+    witness TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    PRIMARY KEY (client, block_num)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS blocks_by_witness ON blocks (client, witness, block_num);
+
+-- ids of the blocks that are not irreversible yet, to detect chain reorganizations
+CREATE TABLE IF NOT EXISTS block_ids (
+    client INTEGER NOT NULL,
+    block_num INTEGER NOT NULL,
+    block_id TEXT NOT NULL,
+    PRIMARY KEY (client, block_num)
+) WITHOUT ROWID;
+
+-- number of blocks produced and missed by each witness, for each hour and each day
+CREATE TABLE IF NOT EXISTS production (
+    client INTEGER NOT NULL,
+    witness TEXT NOT NULL,
+    period INTEGER NOT NULL,          -- HOUR or DAY
+    bucket INTEGER NOT NULL,          -- start of the period, in seconds since epoch
+    produced INTEGER NOT NULL DEFAULT 0,
+    missed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (client, witness, period, bucket)
+) WITHOUT ROWID;
+"""
+
+TABLES = ['meta', 'clients', 'witnesses', 'blocks', 'block_ids', 'production']
+
+HOUR = 3600
+DAY = 86400
+PERIODS = [HOUR, DAY]
+
+WITNESS_FIELDS = ['total_produced', 'last_produced', 'total_missed', 'last_missed', 'streak']
+DATETIME_FIELDS = {'last_produced', 'last_missed'}
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def rpc_id_key(rpc_id):
+    return '{}:{}'.format(*rpc_id)
+
+
+def rpc_id_from_key(key):
+    host, port = key.rsplit(':', 1)
+    return host, int(port)
+
+
+def to_epoch(dt):
+    return calendar.timegm(dt.timetuple())
+
+
+def from_epoch(seconds):
+    return datetime.utcfromtimestamp(seconds)
+
+
+def _to_sql(field, value):
+    if field in DATETIME_FIELDS and isinstance(value, datetime):
+        return value.strftime(DATETIME_FORMAT)
+    return value
+
+
+def _from_sql(field, value):
+    if field in DATETIME_FIELDS and value is not None:
+        return datetime.strptime(value, DATETIME_FORMAT)
+    return value
+
+
+def _rollups(rows, sign=1):
+    """Aggregate (witness, timestamp, produced, missed) rows into the rollup buckets.
+
+    type: {(witness, period, bucket): [produced, missed]}"""
+    result = defaultdict(lambda: [0, 0])
+    for witness, timestamp, produced, missed in rows:
+        for period in PERIODS:
+            counts = result[(witness, period, timestamp - timestamp % period)]
+            counts[0] += sign * produced
+            counts[1] += sign * missed
+    return result
+
+
+class SQLiteStore(object):
+    """SQLite database in WAL mode, which can be shared by all the monitoring threads.
+
+    Use ':memory:' as filename for a store that is not persisted. If retention is given (in seconds),
+    the blocks and rollups older than that are pruned on commit, so the store doesn't grow forever."""
+
+    def __init__(self, filename, retention=None):
+        self.filename = filename
+        self.retention = retention
+        self._lock = threading.RLock()
+        self._client_ids = {}                     # type: {rpc_id: int}
+        self._pending_blocks = defaultdict(list)  # blocks not committed yet. type: {rpc_id: [(block_num, witness, timestamp)]}
+        self._pending_missed = defaultdict(list)  # type: {rpc_id: [(witness, timestamp, 0, nmissed)]}
+        self._pending_block_ids = {}              # type: {rpc_id: {block_num: block_id}}
+        self._pruned = {}                         # time up to which blocks were pruned. type: {client: int}
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')  # safe in WAL mode, only the last commits can be lost on power failure
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def get_version(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else None
+
+    def set_version(self, version):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(version),))
+
+    def reset(self):
+        """Remove all data and recreate the tables, eg: when the schema changed and we need to reindex."""
+        with self._lock:
+            self.conn.executescript(''.join('DROP TABLE IF EXISTS {};'.format(t) for t in TABLES) + SCHEMA)
+            self._client_ids.clear()
+            self._pending_blocks.clear()
+            self._pending_missed.clear()
+            self._pending_block_ids.clear()
+            self._pruned.clear()
+
+    def is_empty(self):
+        return self.conn.execute('SELECT COUNT(*) FROM clients').fetchone()[0] == 0
+
+    def client_id(self, rpc_id):
+        """Return the integer id used to refer to the given client in the blocks and production tables."""
+        try:
+            return self._client_ids[rpc_id]
+        except KeyError:
+            pass
+        with self._lock, self.conn:
+            key = rpc_id_key(rpc_id)
+            self.conn.execute('INSERT OR IGNORE INTO clients (rpc_id) VALUES (?)', (key,))
+            cid = self._client_ids[rpc_id] = self.conn.execute('SELECT id FROM clients WHERE rpc_id = ?', (key,)).fetchone()[0]
+            return cid
+
+    def load(self):
+        """Return the contents of the store, in the same format as core.db.
+
+        type: {rpc_id: {'static': dict, 'last_indexed_block': int, 'total_produced': {witness_name: int}, ...}}"""
+        result = {}
+        with self._lock:
+            for key, last_indexed_block, static in self.conn.execute('SELECT rpc_id, last_indexed_block, static FROM clients'):
+                data = {field: {} for field in WITNESS_FIELDS}
+                data.update(static=json.loads(static), last_indexed_block=last_indexed_block)
+                result[rpc_id_from_key(key)] = data
+
+            for row in self.conn.execute('SELECT rpc_id, witness, {} FROM witnesses'.format(', '.join(WITNESS_FIELDS))):
+                data = result.get(rpc_id_from_key(row[0]))
+                if data is None:
+                    continue
+                for field, value in zip(WITNESS_FIELDS, row[2:]):
+                    if value is not None:
+                        data[field][row[1]] = _from_sql(field, value)
+        return result
+
+    def add_block(self, rpc_id, block_num, witness, timestamp):
+        """Record a block produced by the given witness. It is written to disk on the next commit()."""
+        with self._lock:
+            self._pending_blocks[rpc_id].append((block_num, str(witness), to_epoch(timestamp)))
+
+    def add_missed(self, rpc_id, witness, timestamp, nmissed=1):
+        """Record blocks missed by the given witness. It is written to disk on the next commit()."""
+        with self._lock:
+            self._pending_missed[rpc_id].append((str(witness), to_epoch(timestamp), 0, nmissed))
+
+    def _update_rollups(self, client, rollups):
+        self.conn.executemany('INSERT OR IGNORE INTO production (client, witness, period, bucket) VALUES (?, ?, ?, ?)',
+                              [(client,) + k for k in rollups])
+        self.conn.executemany('UPDATE production SET produced = produced + ?, missed = missed + ? '
+                              'WHERE client = ? AND witness = ? AND period = ? AND bucket = ?',
+                              [(p, m, client) + k for k, (p, m) in rollups.items()])
+
+    def _remove_blocks(self, client, first, last=None):
+        """Remove the blocks from first to last (included) and their counts in the rollups.
+
+        type: [(block_num, witness, timestamp)]"""
+        last = last if last is not None else 2**62
+        removed = self.conn.execute('SELECT block_num, witness, timestamp FROM blocks '
+                                    'WHERE client = ? AND block_num BETWEEN ? AND ? ORDER BY block_num',
+                                    (client, first, last)).fetchall()
+        if removed:
+            self.conn.execute('DELETE FROM blocks WHERE client = ? AND block_num BETWEEN ? AND ?', (client, first, last))
+            self._update_rollups(client, _rollups(((w, t, 1, 0) for _, w, t in removed), sign=-1))
+        return removed
+
+    def _write_blocks(self, client, blocks):
+        if not blocks:
+            return
+        # blocks that were already written (eg: a range being reindexed again) are replaced
+        self._remove_blocks(client, min(b[0] for b in blocks), max(b[0] for b in blocks))
+        self.conn.executemany('INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)', [(client,) + b for b in blocks])
+        self._update_rollups(client, _rollups((w, t, 1, 0) for _, w, t in blocks))
+
+    def write_blocks(self, rpc_id, blocks):
+        """Write the given (block_num, witness, timestamp) blocks to disk right away, in a single transaction."""
+        client = self.client_id(rpc_id)
+        with self._lock, self.conn:
+            self._write_blocks(client, [(n, str(w), to_epoch(t)) for n, w, t in blocks])
+
+    def truncate(self, rpc_id, block_num):
+        """Remove all the blocks after block_num, eg: when reindexing or when they have been undone
+        by a chain reorganization. Pending blocks are dropped too, along with all the missed blocks
+        if block_num is 0.
+
+        Return the removed blocks. type: [(block_num, witness, timestamp)]"""
+        client = self.client_id(rpc_id)
+        with self._lock, self.conn:
+            pending = self._pending_blocks.pop(rpc_id, [])
+            self._pending_blocks[rpc_id] = [b for b in pending if b[0] <= block_num]
+            removed = self._remove_blocks(client, block_num + 1) + [b for b in pending if b[0] > block_num]
+            self.conn.execute('DELETE FROM block_ids WHERE client = ? AND block_num > ?', (client, block_num))
+            if block_num == 0:
+                self._pending_missed.pop(rpc_id, None)
+                self.conn.execute('DELETE FROM production WHERE client = ?', (client,))
+        return [(n, w, from_epoch(t)) for n, w, t in sorted(removed)]
+
+    def last_block(self, rpc_id, witness):
+        """Return the last block recorded for the given witness, or None if there is none.
+
+        type: (block_num, timestamp)"""
+        client = self.client_id(rpc_id)
+        with self._lock:
+            pending = [(n, t) for n, w, t in self._pending_blocks.get(rpc_id, []) if w == str(witness)]
+            row = self.conn.execute('SELECT block_num, timestamp FROM blocks WHERE client = ? AND witness = ? '
+                                    'ORDER BY block_num DESC LIMIT 1', (client, str(witness))).fetchone()
+        last = max(pending + ([row] if row else []), default=None)
+        return (last[0], from_epoch(last[1])) if last else None
+
+    def block_ids(self, rpc_id):
+        """Return the ids of the blocks that were not irreversible yet at the last commit.
+
+        type: {block_num: block_id}"""
+        client = self.client_id(rpc_id)
+        with self._lock:
+            return dict(self.conn.execute('SELECT block_num, block_id FROM block_ids WHERE client = ?', (client,)))
+
+    def set_block_ids(self, rpc_id, block_ids):
+        """Set the ids of the blocks that are not irreversible yet. They are written to disk on the next commit()."""
+        with self._lock:
+            self._pending_block_ids[rpc_id] = dict(block_ids)
+
+    def commit(self, rpc_id, data):
+        """Write the current state of a client (ie: core.db[rpc_id]) and its pending blocks to disk,
+        in a single transaction."""
+        client = self.client_id(rpc_id)
+        key = rpc_id_key(rpc_id)
+        with self._lock, self.conn:
+            self.conn.execute('UPDATE clients SET last_indexed_block = ?, static = ? WHERE id = ?',
+                              (data.get('last_indexed_block', 0), json.dumps(data.get('static', {})), client))
+
+            self.conn.execute('DELETE FROM witnesses WHERE rpc_id = ?', (key,))
+            witnesses = set()
+            for field in WITNESS_FIELDS:
+                witnesses |= set(data.get(field, {}))
+            self.conn.executemany('INSERT INTO witnesses VALUES (?, ?, {})'.format(', '.join('?' * len(WITNESS_FIELDS))),
+                                  [(key, w) + tuple(_to_sql(field, data.get(field, {}).get(w)) for field in WITNESS_FIELDS)
+                                   for w in witnesses])
+
+            self._write_blocks(client, self._pending_blocks.pop(rpc_id, []))
+            self._update_rollups(client, _rollups(self._pending_missed.pop(rpc_id, [])))
+
+            block_ids = self._pending_block_ids.pop(rpc_id, None)
+            if block_ids is not None:
+                self.conn.execute('DELETE FROM block_ids WHERE client = ?', (client,))
+                self.conn.executemany('INSERT INTO block_ids VALUES (?, ?, ?)',
+                                      [(client, n, block_id) for n, block_id in block_ids.items()])
+
+            if self.retention is not None:
+                self._prune(client)
+
+    def _prune(self, client):
+        """Remove the blocks and rollups older than the retention time, relative to the last block.
+        The last block of each witness is kept, so that it can be found again after a rollback."""
+        row = self.conn.execute('SELECT MAX(timestamp) FROM blocks WHERE client = ?', (client,)).fetchone()
+        if row[0] is None:
+            return
+        cutoff = row[0] - self.retention
+        if cutoff - self._pruned.get(client, cutoff - HOUR) < HOUR:
+            return  # pruning needs a full scan of the blocks, don't do it on every commit
+        self._pruned[client] = cutoff
+        self.conn.execute('DELETE FROM blocks WHERE client = ? AND timestamp < ? AND block_num NOT IN '
+                          '(SELECT MAX(block_num) FROM blocks WHERE client = ? GROUP BY witness)',
+                          (client, cutoff, client))
+        self.conn.execute('DELETE FROM production WHERE client = ? AND bucket + period <= ?', (client, cutoff))
+
+    def commit_all(self, db):
+        for rpc_id, data in list(db.items()):
+            if isinstance(rpc_id, tuple):
+                self.commit(rpc_id, data)
+
+    # queries on the production of the witnesses
+
+    def production(self, rpc_id, witness, since, until=None, period=DAY):
+        """Return the number of blocks produced and missed by a witness for each hour or day
+        in the given time range. Periods with no block produced or missed are omitted.
+
+        type: [(datetime, produced, missed)]"""
+        until = until or datetime.utcnow()
+        client = self.client_id(rpc_id)
+        with self._lock:
+            rows = self.conn.execute('SELECT bucket, produced, missed FROM production '
+                                     'WHERE client = ? AND witness = ? AND period = ? AND bucket BETWEEN ? AND ? '
+                                     'ORDER BY bucket',
+                                     (client, str(witness), period,
+                                      to_epoch(since) - to_epoch(since) % period, to_epoch(until))).fetchall()
+        return [(from_epoch(bucket), produced, missed) for bucket, produced, missed in rows if produced or missed]
+
+    def production_totals(self, rpc_id, witness, since, until=None):
+        """Return the number of blocks produced and missed by a witness in the given time range,
+        with a precision of one hour.
+
+        type: {'produced': int, 'missed': int}"""
+        rows = self.production(rpc_id, witness, since, until, period=HOUR)
+        return {'produced': sum(r[1] for r in rows), 'missed': sum(r[2] for r in rows)}
+
+    def production_gaps(self, rpc_id, witness, since=None, min_gap=timedelta(hours=1)):
+        """Return the periods of at least min_gap during which a witness didn't produce any block.
+
+        type: [(last_block_before, first_block_after, gap_start, gap_end)]"""
+        client = self.client_id(rpc_id)
+        with self._lock:
+            rows = self.conn.execute('SELECT block_num, timestamp FROM blocks '
+                                     'WHERE client = ? AND witness = ? AND timestamp >= ? ORDER BY block_num',
+                                     (client, str(witness), to_epoch(since) if since else 0)).fetchall()
+        gaps = []
+        min_gap = min_gap.total_seconds()
+        prev = None
+        for block_num, timestamp in rows:
+            if prev is not None and timestamp - prev[1] >= min_gap:
+                gaps.append((prev[0], block_num, from_epoch(prev[1]), from_epoch(timestamp)))
+            prev = (block_num, timestamp)
+        return gaps
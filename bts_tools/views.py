@@ -27,6 +27,7 @@ from . import core, monitor, slogging, backbone, seednodes, network_utils, feed_
 from .seednodes import split_columns
 import bts_tools
 import psutil
+import copy
 import json
 import requests.exceptions
 import logging
@@ -105,6 +106,8 @@ def catch_error(f):
 # of args, no matter how many times we call it from the view (ie: we might need
 # to call 'is_online' or 'info' quite a few times, and we don't want to be sending
 # all these requests over ssh...)
+# Results whose caching policy allows it (see rpc_cache.DEFAULT_POLICIES) are
+# kept across views and monitoring loops, eg: until the head block number advances
 def clear_rpc_cache(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -236,15 +239,14 @@ def view_info():
     attrs = defaultdict(list)
     n = rpc.main_node
     try:
-        info = n.info()
+        info = copy.copy(n.info())  # rpc results are read-only
     except Exception as e:
         log.exception(e)
         info = {}
     # TODO: we should cache the witness and committee member names, they never change
     info['active_witnesses'] = n.get_active_witnesses()
     if n.type() in ['bts', 'bts-testnet']:
-        info['active_committee_members'] = [n.get_committee_member_name(cm)
-                                            for cm in info['active_committee_members']]
+        info['active_committee_members'] = n.get_committee_member_names(info['active_committee_members'])
     info_items = sorted(info.items())
 
     attrs['bold'] = [(i, 0) for i in range(len(info_items))]
@@ -98,6 +98,9 @@ def create_app(settings_override=None):
                                  monitor=bts_tools.monitor,
                                  process=bts_tools.process)
 
+    # basic check when launching the app
+    seednodes.check_valid_seed_nodes()
+
     t = threading.Thread(target=bts_tools.seednodes.monitor_seed_nodes, args=(chain,))
     t.daemon = True
     t.start()
@@ -79,6 +79,18 @@ def task_gen_config_yaml_doc():
             'verbosity': 2}
 
 
+def task_plugin_manifests():
+    """Regenerate the manifests of the plugins packages, needed after adding or modifying a plugin"""
+    def build_manifests():
+        from bts_tools.core import build_plugin_manifest
+        for plugin_type in ['bts_tools.commands', 'bts_tools.feed_providers']:
+            manifest = build_plugin_manifest(plugin_type)
+            print('{}: {} plugins'.format(plugin_type, len(manifest['plugins'])))
+
+    return {'actions': [build_manifests],
+            'verbosity': 2}
+
+
 # Release management functions
 
 def set_version(pos):
@@ -58,13 +58,16 @@ args = dict(name='bts_tools',
                          'License :: OSI Approved :: GNU General Public License v3 or later (GPLv3+)',
                          'Operating System :: OS Independent',
                          'Programming Language :: Python :: 3',
-                         'Programming Language :: Python :: 3.4',
+                         'Programming Language :: Python :: 3 :: Only',
+                         'Programming Language :: Python :: 3.7',
+                         'Programming Language :: Python :: 3.8',
                          ],
             keywords='Graphene blockchain witness management tools bitshares steem peerplays muse',
             author='Nicolas Wack',
             author_email='wackou@gmail.com',
             url='https://github.com/wackou/bts_tools',
             packages=find_packages(),
+            python_requires='>=3.7',
             include_package_data=True,
             install_requires=install_requires,
             setup_requires=setup_requires,
@@ -54,3 +54,1110 @@ def test_stable_state_monitor():
     s.push('offline')
     assert s.just_changed() == False
     assert s.just_changed() == False
+
+
+def test_rpc_cache_policies():
+    from bts_tools import rpc_cache
+    c = rpc_cache.RPCCache(maxsize=3)
+
+    c.put('info', (), {'head_block_num': 10})
+    c.put('get_witness', ('init0',), {'id': '1.6.1'}, head_block_num=10)
+    c.put('asset_data', (), {'BTS': {'precision': 5}})
+    c.put('wallet_publish_feeds', (), True)
+    assert c.get('wallet_publish_feeds', ()) is rpc_cache.MISSING
+
+    # a new tick only clears the 'tick' entries
+    c.clear()
+    assert c.get('info', ()) is rpc_cache.MISSING
+    c.set_head_block_num(10)
+    assert c.get('get_witness', ('init0',), head_block_num=10) == {'id': '1.6.1'}
+
+    # per-block entries are evicted when the head block advances
+    c.set_head_block_num(11)
+    assert c.get('get_witness', ('init0',), head_block_num=11) is rpc_cache.MISSING
+    assert c.get('asset_data', ()) == {'BTS': {'precision': 5}}
+
+    # least recently used entries are evicted first
+    for i in range(3):
+        c.put('get_block', (i,), {}, head_block_num=11)
+    assert len(c) == 3
+    assert c.get('asset_data', ()) is rpc_cache.MISSING
+
+    stats = c.stats()
+    assert stats['immutable']['hits'] == 1
+    assert stats['per_block']['size'] == 3
+
+
+def test_rpc_cache_per_block(monkeypatch):
+    from bts_tools import core
+    from bts_tools.rpcutils import GrapheneClient
+
+    monkeypatch.setattr(core, 'config', {})
+    node = GrapheneClient('seed', 'test_per_block', None, {'wallet_host': 'test_per_block', 'wallet_port': 8093}, type='bts')
+    head = {'block_num': 10}
+    sent = []
+
+    def fake_rpc_call(funcname, *args, timeout=None):
+        sent.append(funcname)
+        if funcname == 'info':
+            return {'head_block_num': head['block_num']}
+        return {'name': args[0], 'read_at': head['block_num']}
+
+    node._rpc_call = fake_rpc_call
+    assert node.get_witness('init0') == {'name': 'init0', 'read_at': 10}
+
+    # per-block entries survive a new tick as long as the head block didn't change
+    node.clear_rpc_cache()
+    assert node.get_witness('init0') == {'name': 'init0', 'read_at': 10}
+    assert sent == ['info', 'get_witness', 'info']
+
+    head['block_num'] = 11
+    node.clear_rpc_cache()
+    assert node.get_witness('init0') == {'name': 'init0', 'read_at': 11}
+    assert sent[3:] == ['info', 'get_witness']
+
+    # a head block pushed by the witness node evicts them too, without polling the wallet
+    head['block_num'] = 12
+    node.set_head_block_num(12)
+    assert node.get_witness('init0') == {'name': 'init0', 'read_at': 12}
+    assert sent[5:] == ['get_witness']
+
+
+def test_frozen_rpc_results():
+    import copy
+    import pytest
+    from bts_tools.core import freeze
+
+    r = freeze({'witness': '1.6.1', 'transactions': [{'operations': []}]})
+    assert r == {'witness': '1.6.1', 'transactions': [{'operations': []}]}
+    with pytest.raises(TypeError):
+        r['witness'] = '1.6.2'
+    with pytest.raises(TypeError):
+        r['transactions'].append({})
+
+    # copies are mutable
+    c = copy.copy(r)
+    c['witness'] = '1.6.2'
+    assert r['witness'] == '1.6.1'
+
+
+def test_rpc_cache_keys(monkeypatch):
+    from bts_tools import core
+    from bts_tools.rpcutils import GrapheneClient
+
+    monkeypatch.setattr(core, 'config', {})
+    node = GrapheneClient('seed', 'test_keys', None, {'wallet_host': 'test_keys', 'wallet_port': 8093}, type='bts')
+    node._rpc_batch_call = lambda calls, timeout=None: [{'id': args[0]} for _, args in calls]
+    node._rpc_call = lambda funcname, *args, timeout=None: {'id': args[0], 'sent': True}
+    node.set_head_block_num(10)
+
+    # batch calls take their args as lists, they share the cache entries with the single calls
+    assert node.rpc_batch([('get_witness', ['1.6.1'])]) == [{'id': '1.6.1'}]
+    assert node.get_witness('1.6.1') == {'id': '1.6.1'}
+    assert node.rpc_batch([('get_witness', ['1.6.1']), ('get_account', [{'name': 'init0'}])]) == \
+        [{'id': '1.6.1'}, {'id': {'name': 'init0'}}]
+
+
+def test_single_flight():
+    import threading
+    import time
+    from bts_tools.rpc_cache import SingleFlight
+
+    sf = SingleFlight()
+    started = threading.Event()
+    results = []
+
+    def slow_call():
+        started.set()
+        time.sleep(0.2)
+        return {'head_block_num': 42}
+
+    def run():
+        results.append(sf.do(('info', ()), slow_call))
+
+    threads = [threading.Thread(target=run) for _ in range(5)]
+    threads[0].start()
+    started.wait()
+    for t in threads[1:]:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [{'head_block_num': 42}] * 5
+    assert sf.stats() == {'calls': 1, 'saved': 4}
+
+
+def test_rpc_session(monkeypatch):
+    from bts_tools import core, rpcutils
+
+    monkeypatch.setattr(core, 'config', {'rpc': {'pool_size': 2}})
+    monkeypatch.setattr(rpcutils, '_rpc_sessions', {})
+
+    # one session for each (host, port)
+    session = rpcutils.rpc_session('localhost', 8093)
+    assert rpcutils.rpc_session('localhost', 8093) is session
+    assert rpcutils.rpc_session('localhost', 8094) is not session
+    assert session.get_adapter('http://')._pool_maxsize == 2
+
+    assert rpcutils.rpc_session_stats() == {('localhost', 8093): {'requests': 0, 'connections': 0, 'reused': 0},
+                                            ('localhost', 8094): {'requests': 0, 'connections': 0, 'reused': 0}}
+
+    rpcutils.close_rpc_sessions()
+    assert rpcutils.rpc_session_stats() == {}
+    assert rpcutils.rpc_session('localhost', 8093) is not session
+
+
+def test_rpc_deadline(monkeypatch):
+    import time
+    import pytest
+    from bts_tools import core
+    from bts_tools.core import RPCTimeoutError
+    from bts_tools.rpcutils import rpc_deadline, rpc_timeout
+
+    monkeypatch.setattr(core, 'config', {'rpc': {'timeout': 10, 'timeouts': {'get_account_history': 30}}})
+    assert rpc_timeout('info') == 10
+    assert rpc_timeout('get_account_history') == 30
+    assert rpc_timeout('info', timeout=2) == 2
+
+    with rpc_deadline(5):
+        assert 4 < rpc_timeout('get_account_history') <= 5
+        with rpc_deadline(60):  # can't extend the enclosing deadline
+            assert rpc_timeout('info') <= 5
+    assert rpc_timeout('info') == 10
+
+    with rpc_deadline(0.01):
+        time.sleep(0.02)
+        with pytest.raises(RPCTimeoutError):
+            rpc_timeout('info')
+
+
+def test_async_client(monkeypatch):
+    import asyncio
+    import threading
+    from bts_tools import core
+    from bts_tools.rpcutils import GrapheneClient, AsyncGrapheneClient
+
+    monkeypatch.setattr(core, 'config', core.config or {})
+    node = GrapheneClient('seed', 'test_async', None, {}, type='bts')
+    threads = set()
+
+    def fake_rpc_call(funcname, *args, timeout=None):
+        threads.add(threading.current_thread())
+        return {'funcname': funcname, 'args': list(args)}
+
+    node._rpc_call = fake_rpc_call
+    anode = AsyncGrapheneClient(node)
+    assert anode.name == 'test_async'
+
+    async def gather_calls():
+        return await asyncio.gather(*(anode.about(i) for i in range(10)))
+
+    loop = asyncio.new_event_loop()
+    result = loop.run_until_complete(gather_calls())
+    loop.close()
+
+    assert [r['args'] for r in result] == [[i] for i in range(10)]
+    assert threading.current_thread() not in threads
+
+
+def test_async_ws_routes(monkeypatch):
+    import asyncio
+    import threading
+    from bts_tools import core, graphene
+    from bts_tools.core import RPCError
+    from bts_tools.rpcutils import GrapheneClient, AsyncGrapheneClient
+
+    monkeypatch.setattr(core, 'config', {})
+    node = GrapheneClient('seed', 'test_async_ws', None, {'wallet_host': 'test_async_ws', 'wallet_port': 8093,
+                                                          'witness_host': 'test_async_ws', 'witness_port': 8090}, type='bts')
+    node.set_head_block_num(10)
+    threads = set()
+    sent = []
+
+    async def fake_ws_rpc_call_async(host, port, api, method, *args, timeout=None):
+        threads.add(threading.current_thread())
+        sent.append(method)
+        await asyncio.sleep(0)
+        if args == ('unknown',):
+            return None
+        return {'get_account_by_name': {'id': '1.2.5'}, 'get_witness_by_account': {'id': '1.6.1'}}.get(method)
+
+    def blocking_call(*args, **kwargs):
+        raise AssertionError('blocking websocket call')
+
+    monkeypatch.setattr(graphene, 'is_connected', lambda host, port: True)
+    monkeypatch.setattr(graphene, 'ws_rpc_call_async', fake_ws_rpc_call_async)
+    monkeypatch.setattr(graphene, 'ws_rpc_call', blocking_call)
+    node._rpc_batch_call = lambda calls, timeout=None: [{'wallet': funcname} for funcname, _ in calls]
+    anode = AsyncGrapheneClient(node)
+
+    async def calls():
+        witness = await anode.get_witness('init0')
+        cached = await anode.get_witness('init0')
+        batch = await anode.rpc_batch([('get_witness', ['init0']), ('about', []), ('get_account', ['unknown'])])
+        return witness, cached, batch
+
+    loop = asyncio.new_event_loop()
+    witness, cached, batch = loop.run_until_complete(calls())
+    loop.close()
+
+    # routed calls are awaited on the event loop, and share the cache of the GrapheneClient
+    assert witness == cached == {'id': '1.6.1'}
+    assert threads == {threading.current_thread()}
+    assert sent == ['get_account_by_name', 'get_witness_by_account', 'get_account_by_name']
+    assert batch[:2] == [{'id': '1.6.1'}, {'wallet': 'about'}] and isinstance(batch[2], RPCError)
+
+
+def test_async_deadline():
+    import asyncio
+    import pytest
+    from bts_tools.core import RPCTimeoutError
+    from bts_tools.rpcutils import rpc_deadline, rpc_timeout
+
+    async def with_deadline(entered, checked):
+        with rpc_deadline(0.01):
+            entered.set()
+            await checked.wait()
+            await asyncio.sleep(0.02)
+            with pytest.raises(RPCTimeoutError):
+                rpc_timeout('info', timeout=10)
+
+    async def without_deadline(entered, checked):
+        await entered.wait()
+        # the deadline of the other task doesn't apply to this one
+        timeout = rpc_timeout('info', timeout=10)
+        checked.set()
+        return timeout
+
+    async def run():
+        entered, checked = asyncio.Event(), asyncio.Event()
+        return await asyncio.gather(with_deadline(entered, checked), without_deadline(entered, checked))
+
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(run())[1] == 10
+    loop.close()
+
+
+def test_rpc_batch(monkeypatch):
+    import json
+    from bts_tools import core, rpcutils
+    from bts_tools.core import RPCError
+    from bts_tools.rpcutils import GrapheneClient, rpc_batch_call
+
+    monkeypatch.setattr(core, 'config', {})
+
+    class FakeResponse(object):
+        status_code = 200
+
+        def __init__(self, data):
+            self.data = data
+
+        def json(self):
+            return self.data
+
+    class FakeSession(object):
+        def __init__(self, batch_supported=True):
+            self.batch_supported = batch_supported
+            self.posted = []
+
+        def post(self, url, auth=None, data=None, headers=None, timeout=None):
+            payload = json.loads(data)
+            self.posted.append(payload)
+            if not isinstance(payload, list):
+                return FakeResponse(self.response(payload))
+            if not self.batch_supported:
+                return FakeResponse({'id': None, 'error': {'message': 'invalid request'}})
+            # responses to batches can come in any order
+            return FakeResponse([self.response(p) for p in reversed(payload) if p['params'][2] != ['lost']])
+
+        def response(self, p):
+            funcname, args = p['params'][1:]
+            if args == ['unknown']:
+                return {'id': p['id'], 'error': {'message': 'no witness named unknown'}}
+            return {'id': p['id'], 'result': {'funcname': funcname, 'arg': args[0]}}
+
+    session = FakeSession()
+    monkeypatch.setattr(rpcutils, 'rpc_session', lambda host, port: session)
+
+    # results are given in the order of the calls, with the errors of the failed ones
+    result = rpc_batch_call('localhost', 8093, 'user', 'password',
+                            [('get_witness', ['init0']), ('get_witness', ['unknown']),
+                             ('get_witness', ['lost']), ('get_account', ['init1'])])
+    assert len(session.posted) == 1 and len(session.posted[0]) == 4
+    assert result[0] == {'funcname': 'get_witness', 'arg': 'init0'}
+    assert isinstance(result[1], RPCError) and 'no witness named unknown' in str(result[1])
+    assert isinstance(result[2], RPCError)
+    assert result[3] == {'funcname': 'get_account', 'arg': 'init1'}
+
+    # only the calls that are not cached yet are sent
+    node = GrapheneClient('seed', 'test_batch', None, {'wallet_host': 'test_batch', 'wallet_port': 8093}, type='bts')
+    node.set_head_block_num(10)
+    assert node.get_witness('init0') == {'funcname': 'get_witness', 'arg': 'init0'}
+    calls = [('get_witness', [name]) for name in ['init0', 'init1', 'unknown', 'init2']]
+    result = node.rpc_batch(calls)
+    assert [p['params'][2] for p in session.posted[-1]] == [['init1'], ['unknown'], ['init2']]
+    assert [r['arg'] for i, r in enumerate(result) if i != 2] == ['init0', 'init1', 'init2']
+    assert isinstance(result[2], RPCError)
+    nposted = len(session.posted)
+    assert node.rpc_batch(calls)[3] == {'funcname': 'get_witness', 'arg': 'init2'}
+    assert len(session.posted) == nposted
+
+    # wallets which don't support batches get sequential calls instead, and are not sent batches anymore
+    session = FakeSession(batch_supported=False)
+    monkeypatch.setattr(rpcutils, 'rpc_session', lambda host, port: session)
+    node = GrapheneClient('seed', 'test_batch', None, {'wallet_host': 'test_batch', 'wallet_port': 8094}, type='bts')
+    for _ in range(2):
+        result = node.rpc_batch(calls, cached=False)
+        assert [r['arg'] for i, r in enumerate(result) if i != 2] == ['init0', 'init1', 'init2']
+        assert isinstance(result[2], RPCError)
+    assert node._batch_supported is False
+    assert isinstance(session.posted[0], list)
+    assert [p['params'][2] for p in session.posted[1:]] == [[name] for name in ['init0', 'init1', 'unknown', 'init2']] * 2
+
+
+def test_rpc_batch_uncached(monkeypatch):
+    from bts_tools import core
+    from bts_tools.rpcutils import GrapheneClient
+
+    monkeypatch.setattr(core, 'config', {})
+    node = GrapheneClient('seed', 'test_uncached', None, {'wallet_host': 'test_uncached', 'wallet_port': 8093}, type='bts')
+    sent = []
+
+    def fake_rpc_batch_call(calls, timeout=None):
+        sent.extend(calls)
+        return [{'block_num': args[0]} for _, args in calls]
+
+    node._rpc_batch_call = fake_rpc_batch_call
+    node.set_head_block_num(10)
+
+    # blocks fetched without the cache are sent every time, and don't fill the cache
+    calls = [('get_block', [n]) for n in range(3)]
+    for _ in range(2):
+        assert node.rpc_batch(calls, cached=False) == [{'block_num': n} for n in range(3)]
+    assert len(sent) == 6
+    assert len(node._cache) == 0
+
+
+def test_ws_routes():
+    import pytest
+    from bts_tools.rpcutils import WS_ROUTES
+    from bts_tools.core import RPCError
+
+    objects = {'1.2.5': {'id': '1.2.5', 'name': 'init0'},
+               '1.6.1': {'id': '1.6.1', 'witness_account': '1.2.5'}}
+
+    def call(method, *args):
+        if method == 'get_objects':
+            return [objects.get(oid) for oid in args[0]]
+        if method == 'get_account_by_name':
+            return objects['1.2.5'] if args[0] == 'init0' else None
+        if method == 'get_witness_by_account':
+            return objects['1.6.1'] if args[0] == '1.2.5' else None
+        if method == 'lookup_asset_symbols':
+            return [None]
+
+    assert WS_ROUTES['get_witness'](call, 'init0') == objects['1.6.1']
+    assert WS_ROUTES['get_witness'](call, '1.6.1') == objects['1.6.1']
+    assert WS_ROUTES['get_account'](call, '1.2.5') == objects['1.2.5']
+    with pytest.raises(RPCError):
+        WS_ROUTES['get_account'](call, 'unknown')
+    with pytest.raises(RPCError):
+        WS_ROUTES['get_asset'](call, 'FOO')
+
+
+def test_ws_requests(monkeypatch):
+    import json
+    import pytest
+    from concurrent.futures import Future
+    from bts_tools import core, graphene
+    from bts_tools.core import RPCError
+
+    monkeypatch.setattr(core, 'config', core.config or {})
+    p = graphene.MonitoringProtocol('bts', 'test_ws', 8090, 'user', 'password')
+    sent = []
+    p.sendMessage = lambda payload: sent.append(json.loads(payload.decode('utf8')))
+    p.max_in_flight = 2
+
+    futures = [Future() for _ in range(3)]
+    for i, f in enumerate(futures):
+        p.rpc_call(graphene.Api.DATABASE_API, 'get_block', i, result=f, timeout=10)
+    assert len(sent) == 2 and len(p.queue) == 1
+
+    # queued requests are sent as soon as a response comes back
+    p.onMessage(json.dumps({'id': sent[0]['id'], 'result': {'witness': '1.6.1'}}).encode('utf8'), False)
+    assert futures[0].result() == {'witness': '1.6.1'}
+    assert len(sent) == 3
+
+    # cancelled requests are dropped, and late responses to them ignored
+    futures[1].cancel()
+    p.expire_requests()
+    assert len(p.request_map) == 1
+    p.onMessage(json.dumps({'id': sent[1]['id'], 'result': None}).encode('utf8'), False)
+
+    # pending requests fail as soon as the connection is lost
+    p.fail_all_requests('connection lost')
+    with pytest.raises(RPCError):
+        futures[2].result(timeout=0)
+    assert p.request_map == {}
+
+    del graphene._monitoring_protocols[('test_ws', 8090)]
+
+
+def test_block_notifications(monkeypatch):
+    import json
+    from bts_tools import core, graphene
+
+    monkeypatch.setattr(core, 'config', core.config or {})
+    p = graphene.MonitoringProtocol('bts', 'test_notice', 8090, 'user', 'password')
+    assert graphene.wait_for_block('test_notice', 8090, timeout=0) is None
+
+    block_id = '01a2b3c4d1f0c7e5b8b1a1c5e8d2f5e0c5b6a7d8'
+    p.onMessage(json.dumps({'method': 'notice', 'params': [graphene.BLOCK_APPLIED_CALLBACK, [block_id]]}).encode('utf8'), False)
+    assert graphene.wait_for_block('test_notice', 8090, timeout=0) == (0x01a2b3c4, block_id)
+    assert graphene.wait_for_block('test_notice', 8090, timeout=0) is None
+
+    del graphene._monitoring_protocols[('test_notice', 8090)]
+
+
+def test_ws_login(monkeypatch):
+    import json
+    import types
+    from bts_tools import core, graphene
+
+    monkeypatch.setattr(core, 'config', {})
+    p = graphene.MonitoringProtocol('bts', 'test_login', 8090, 'user', 'password')
+    p.factory = types.SimpleNamespace(loop=types.SimpleNamespace(call_later=lambda *args: None))
+    sent = []
+    p.sendMessage = lambda payload: sent.append(json.loads(payload.decode('utf8')))
+
+    # the connection is ready once all the login requests got a response
+    p.onConnect(types.SimpleNamespace(peer='test_login'))
+    assert [r['params'][1] for r in sent] == ['login', 'network_node', 'set_block_applied_callback']
+    for r in sent:
+        assert not graphene.is_ready('test_login', 8090)
+        p.onMessage(json.dumps({'id': r['id'], 'result': 2 if r['params'][1] == 'network_node' else True}).encode('utf8'), False)
+    assert graphene.is_ready('test_login', 8090) and graphene.wait_until_ready('test_login', 8090, timeout=0)
+    assert graphene._ws_rpc_cache[('test_login', 8090)]['network_node_api'] == 2
+
+    p.onClose(False, None, 'test')
+    assert not graphene.wait_until_ready('test_login', 8090, timeout=0)
+
+    del graphene._monitoring_protocols[('test_login', 8090)]
+
+
+def test_reconnect_delay():
+    from bts_tools import graphene
+
+    delays = [graphene.reconnect_delay(n) for n in range(1, 12)]
+    assert graphene.RECONNECT_MIN_DELAY / 2 <= delays[0] <= graphene.RECONNECT_MIN_DELAY
+    assert all(d <= graphene.RECONNECT_MAX_DELAY for d in delays)
+    assert delays[-1] >= graphene.RECONNECT_MAX_DELAY / 2
+
+
+def test_fetch_blocks():
+    import threading
+    from bts_tools.monitoring.indexing import fetch_blocks
+
+    class FakeNode:
+        def __init__(self):
+            self.batches = []
+            self.lock = threading.Lock()
+
+        def rpc_batch(self, calls, cached=True):
+            with self.lock:
+                self.batches.append(len(calls))
+            return [{'block_num': args[0]} for _, args in calls]
+
+    node = FakeNode()
+    blocks = list(fetch_blocks(node, 1, 1050, batch_size=100, depth=3))
+    assert [n for n, _ in blocks] == list(range(1, 1051))
+    assert all(n == block['block_num'] for n, block in blocks)
+    assert sorted(node.batches) == [50] + [100] * 10
+
+    node = FakeNode()
+    assert list(fetch_blocks(node, 5, 6)) == [(5, {'block_num': 5}), (6, {'block_num': 6})]
+    assert node.batches == [2]
+
+
+def test_block_fetcher():
+    from bts_tools.core import AttributeDict, RPCError
+    from bts_tools.monitoring import indexing
+
+    class FakeNode:
+        rpc_id = ('localhost', 8093)
+
+        def ws_route(self, funcname):
+            return funcname
+
+        def get_block_header_batch(self, block_nums, cached=True):
+            raise RPCError('Assert Exception: method not found: get_block_header_batch')
+
+        def rpc_batch(self, calls, cached=True):
+            return [{'witness': '1.6.{}'.format(args[0])} for _, args in calls]
+
+    ctx = AttributeDict(fetch_method=None)
+    assert indexing.block_fetcher(FakeNode(), ctx, 100) is indexing.get_block_headers
+    assert list(indexing.fetch_blocks(FakeNode(), 1, 2, fetch=ctx.fetch_method)) == [(1, {'witness': '1.6.1'}),
+                                                                                      (2, {'witness': '1.6.2'})]
+
+
+def test_reindex_chunks():
+    from bts_tools.commands.reindex import chunks, merge_chunks
+
+    assert chunks(1, 250, 100) == [(1, 99), (100, 199), (200, 250)]
+    assert chunks(150, 199, 100) == [(150, 199)]
+
+    produced, last_produced = merge_chunks([
+        {'produced': {'1.6.1': 10, '1.6.2': 5}, 'last_produced': {'1.6.1': '2018-01-02T00:00:00', '1.6.2': '2018-01-01T00:00:00'}},
+        {'produced': {'1.6.1': 3}, 'last_produced': {'1.6.1': '2018-01-01T00:00:00'}}])
+    assert produced == {'1.6.1': 13, '1.6.2': 5}
+    assert last_produced == {'1.6.1': '2018-01-02T00:00:00', '1.6.2': '2018-01-01T00:00:00'}
+
+
+def test_reindex_resume(tmpdir, monkeypatch):
+    from collections import defaultdict
+    from bts_tools import core, rpcutils
+    from bts_tools.store import SQLiteStore
+    from bts_tools.commands import reindex
+
+    class FakeNode:
+        rpc_id = ('localhost', 8093)
+        client_name = 'bts'
+        name = 'init1'
+        proxy_host = 'localhost'  # don't try to connect to the witness node
+
+        def __init__(self):
+            self.head_block_num = 250
+            self.failing = range(0)
+
+        def type(self):
+            return 'bts'
+
+        def affiliation(self):
+            return 'bts'
+
+        def is_witness(self):
+            return True
+
+        def ws_route(self, funcname):
+            return None
+
+        def get_head_block_num(self):
+            return self.head_block_num
+
+        def get_witness(self, name):
+            return {'id': '1.6.1'}
+
+        def rpc_batch(self, calls, cached=True):
+            return [core.RPCError('unavailable') if args[0] in self.failing else
+                    {'witness': '1.6.{}'.format(args[0] % 2), 'timestamp': '2018-01-01T00:00:00'}
+                    for _, args in calls]
+
+    node = FakeNode()
+    store = SQLiteStore(':memory:')
+
+    def load_db():
+        core.db = defaultdict(dict)
+        core.db_store = store
+
+    monkeypatch.setattr(core, 'BTS_TOOLS_HOMEDIR', str(tmpdir))
+    monkeypatch.setattr(core, 'config', {'index_full_blockchain': True, 'reindex': {'chunk_size': 100}})
+    monkeypatch.setattr(core, 'db', {})
+    monkeypatch.setattr(core, 'db_store', None)
+    monkeypatch.setattr(core, 'load_db', load_db)
+    monkeypatch.setattr(rpcutils, 'nodes', [node])
+
+    # the first run is interrupted with chunks 1-99 and 200-250 done
+    node.failing = range(100, 200)
+    reindex.run_command(env='bts')
+    assert sorted(reindex.load_checkpoint(node.rpc_id)['chunks']) == ['1-99', '200-250']
+
+    # the head block advanced when resuming, 200-250 is replaced by 200-270
+    node.failing = range(0)
+    node.head_block_num = 270
+    reindex.run_command(env='bts')
+    assert core.db[node.rpc_id]['total_produced']['init1'] == 135
+    assert not tmpdir.join('reindex_localhost_8093.json').exists()
+
+
+def test_sqlite_store(tmpdir):
+    from datetime import datetime
+    from bts_tools.store import SQLiteStore
+
+    store = SQLiteStore(str(tmpdir.join('db.sqlite')))
+    rpc_id = ('localhost', 8093)
+    data = {'static': {'monitor_witnesses': ['init0'], 'need_reindex': False},
+            'last_indexed_block': 120,
+            'total_produced': {'init0': 2}, 'last_produced': {'init0': datetime(2018, 1, 1, 12)},
+            'total_missed': {'init0': -1}, 'last_missed': {}, 'streak': {'init0': 0}}
+    store.add_block(rpc_id, 100, '1.6.1', datetime(2018, 1, 1, 11))
+    store.add_block(rpc_id, 120, '1.6.1', datetime(2018, 1, 1, 12))
+    store.commit(rpc_id, data)
+    store.close()
+
+    store = SQLiteStore(str(tmpdir.join('db.sqlite')))
+    assert store.load() == {rpc_id: data}
+    assert store.conn.execute('SELECT block_num FROM blocks').fetchall() == [(100,), (120,)]
+
+    # reindexing removes all the blocks
+    store.truncate(rpc_id, 0)
+    assert store.conn.execute('SELECT COUNT(*) FROM blocks').fetchone() == (0,)
+
+
+def test_production_rollups():
+    from datetime import datetime, timedelta
+    from bts_tools.store import SQLiteStore, HOUR
+
+    store = SQLiteStore(':memory:')
+    rpc_id = ('localhost', 8093)
+    start = datetime(2018, 1, 1)
+    for i in range(48 * 60):  # one block per minute for 2 days, alternating between 2 witnesses
+        if not 600 <= i < 720:  # 1.6.1 and 1.6.2 don't produce from 10:00 to 12:00 on the first day
+            store.add_block(rpc_id, i + 1, '1.6.{}'.format(i % 2 + 1), start + timedelta(minutes=i))
+    store.add_missed(rpc_id, '1.6.1', start + timedelta(hours=10, minutes=30), 2)
+    store.commit(rpc_id, {'last_indexed_block': 48 * 60})
+
+    assert store.production(rpc_id, '1.6.1', start) == [(start, 660, 2), (start + timedelta(days=1), 720, 0)]
+    assert store.production_totals(rpc_id, '1.6.2', start + timedelta(hours=9), start + timedelta(hours=12)) == \
+        {'produced': 60, 'missed': 0}
+    assert store.production(rpc_id, '1.6.1', start + timedelta(hours=10), start + timedelta(hours=11), period=HOUR) == \
+        [(start + timedelta(hours=10), 0, 2)]
+    assert store.production_gaps(rpc_id, '1.6.1') == [(599, 721, start + timedelta(minutes=598), start + timedelta(minutes=720))]
+
+    # undone blocks are removed from the rollups
+    store.truncate(rpc_id, 24 * 60)
+    assert store.production_totals(rpc_id, '1.6.1', start, start + timedelta(days=2)) == {'produced': 660, 'missed': 2}
+
+
+def test_store_retention():
+    from datetime import datetime, timedelta
+    from bts_tools.store import SQLiteStore, DAY
+
+    store = SQLiteStore(':memory:', retention=DAY)
+    rpc_id = ('localhost', 8093)
+    start = datetime(2018, 1, 1)
+    store.add_block(rpc_id, 1, '1.6.3', start)  # 1.6.3 doesn't produce anymore afterwards
+    for i in range(1, 3 * 24 * 60 + 1):  # one block per minute for 3 days
+        store.add_block(rpc_id, i + 1, '1.6.{}'.format(i % 2 + 1), start + timedelta(minutes=i))
+    store.commit(rpc_id, {'last_indexed_block': 3 * 24 * 60 + 1})
+
+    client = store.client_id(rpc_id)
+    assert store.conn.execute('SELECT MIN(block_num) FROM blocks WHERE client = ? AND witness != ?',
+                              (client, '1.6.3')).fetchone()[0] == 2 * 24 * 60 + 1
+    assert store.production(rpc_id, '1.6.1', start) == [(start + timedelta(days=2), 720, 0), (start + timedelta(days=3), 1, 0)]
+    # the last block of each witness is kept
+    assert store.last_block(rpc_id, '1.6.3') == (1, start)
+
+    # without retention, nothing is pruned
+    store = SQLiteStore(':memory:')
+    for i in range(3 * 24 * 60):
+        store.add_block(rpc_id, i + 1, '1.6.1', start + timedelta(minutes=i))
+    store.commit(rpc_id, {'last_indexed_block': 3 * 24 * 60})
+    assert store.production_totals(rpc_id, '1.6.1', start, start + timedelta(days=3)) == {'produced': 3 * 24 * 60, 'missed': 0}
+
+
+def test_reorg(monkeypatch):
+    from datetime import datetime, timedelta
+    from bts_tools import core
+    from bts_tools.core import AttributeDict
+    from bts_tools.store import SQLiteStore
+    from bts_tools.monitoring import indexing
+
+    start = datetime(2018, 1, 1)
+
+    class FakeNode:
+        rpc_id = ('localhost', 8093)
+
+        def __init__(self):
+            self.blocks = {}
+            self.last_irreversible = 0
+
+        def extend(self, first, last, prefix, witness=None):
+            for n in range(first, last + 1):
+                self.blocks[n] = {'id': '{}{}'.format(prefix, n),
+                                  'previous': self.blocks[n - 1]['id'] if n > 1 else '',
+                                  'witness': witness or '1.6.{}'.format(n % 2 + 1),
+                                  'timestamp': (start + timedelta(seconds=3 * n)).strftime('%Y-%m-%dT%H:%M:%S')}
+            for n in range(last + 1, max(self.blocks) + 1):
+                del self.blocks[n]
+
+        def ws_route(self, funcname):
+            return None
+
+        def get_witness(self, name):
+            return {'id': '1.6.2'}
+
+        def get_dynamic_global_properties(self):
+            head = max(self.blocks)
+            return {'head_block_number': head, 'head_block_id': self.blocks[head]['id'],
+                    'last_irreversible_block_num': self.last_irreversible}
+
+        def rpc_batch(self, calls, cached=True):
+            return [self.blocks.get(args[0]) for _, args in calls]
+
+    monkeypatch.setattr(core, 'config', {'index_full_blockchain': True})
+    monkeypatch.setattr(core, 'db_store', SQLiteStore(':memory:'))
+    node = FakeNode()
+    monkeypatch.setattr(core, 'db', {node.rpc_id: {'static': {'monitor_witnesses': ['init1']}}})
+    ctx = AttributeDict()
+    indexing.init_ctx(node, ctx, {})
+    core.db[node.rpc_id]['total_produced']['init1'] = 0
+
+    node.extend(1, 10, 'a')
+    node.last_irreversible = 5
+    indexing.monitor(node, ctx, {})
+    db = core.db[node.rpc_id]
+    assert db['total_produced']['init1'] == 5 and db['last_indexed_block'] == 10
+
+    # blocks 8 to 10 are replaced by blocks from 1.6.1 only
+    node.extend(8, 12, 'b', witness='1.6.1')
+    node.last_irreversible = 6
+    indexing.monitor(node, ctx, {})
+    assert db['total_produced']['init1'] == 4 and db['last_indexed_block'] == 12
+    assert db['last_produced']['init1'] == start + timedelta(seconds=21)
+    assert core.db_store.production_totals(node.rpc_id, '1.6.1', start) == {'produced': 8, 'missed': 0}
+    assert ctx.block_ids == {n: node.blocks[n]['id'] for n in range(6, 13)}
+
+    # the head block is replaced
+    node.extend(12, 12, 'c', witness='1.6.2')
+    indexing.monitor(node, ctx, {})
+    assert db['total_produced']['init1'] == 5 and db['last_indexed_block'] == 12
+
+
+def test_name_based_witnesses(monkeypatch):
+    from datetime import datetime, timedelta
+    from bts_tools import core
+    from bts_tools.core import AttributeDict
+    from bts_tools.store import SQLiteStore
+    from bts_tools.monitoring import indexing, missed
+    from bts_tools.commands import reindex
+
+    start = datetime(2018, 1, 1)
+
+    class FakeSteemNode:
+        """steem blocks refer to their witness by name, and witnesses have an integer id"""
+        rpc_id = ('localhost', 8095)
+        name = 'init1'
+
+        def affiliation(self):
+            return 'steem'
+
+        def ws_route(self, funcname):
+            return None
+
+        def get_witness(self, name):
+            return {'id': 2, 'owner': name, 'total_missed': 3}
+
+        def get_dynamic_global_properties(self):
+            raise core.RPCError('not available')
+
+        def rpc_batch(self, calls, cached=True):
+            return [{'witness': 'init{}'.format(args[0] % 2), 'previous': '',
+                     'timestamp': (start + timedelta(seconds=3 * args[0])).strftime('%Y-%m-%dT%H:%M:%S')}
+                    for _, args in calls]
+
+    node = FakeSteemNode()
+    monkeypatch.setattr(core, 'config', {'index_full_blockchain': True})
+    monkeypatch.setattr(core, 'db_store', SQLiteStore(':memory:'))
+    monkeypatch.setattr(core, 'db', {node.rpc_id: {'static': {'monitor_witnesses': ['init1']}}})
+    monkeypatch.setattr(missed, 'send_notification', lambda *args, **kwargs: None)
+
+    ctx = AttributeDict()
+    indexing.init_ctx(node, ctx, {})
+    core.db[node.rpc_id]['total_produced']['init1'] = 0
+    indexing.monitor(node, ctx, {}, head_block_num=10)
+    assert core.db[node.rpc_id]['total_produced']['init1'] == 5
+
+    missed.init_ctx(node, AttributeDict(), {})
+    core.db[node.rpc_id]['total_missed']['init1'] = 1
+    missed.monitor(node, AttributeDict(total_produced=5), {})
+    core.commit_db(node.rpc_id)
+    assert core.db_store.production_totals(node.rpc_id, 'init1', start) == {'produced': 5, 'missed': 2}
+
+    result = reindex.index_chunk(node, indexing.get_blocks, 11, 20, node.rpc_id)
+    assert result['produced'] == {'init0': 5, 'init1': 5}
+    assert indexing.witness_key(node, 'init1') == 'init1'
+    assert core.db_store.last_block(node.rpc_id, 'init0')[0] == 20
+
+
+def test_config_cache(tmpdir, monkeypatch):
+    from bts_tools import core
+
+    monkeypatch.setattr(core, 'BTS_TOOLS_CONFIG_FILE', str(tmpdir.join('config.yaml')))
+    monkeypatch.setattr(core, 'BTS_TOOLS_CONFIG_CACHE_FILE', str(tmpdir.join('config_cache.pickle')))
+    tmpdir.join('config.yaml').write('clients: {}\n')
+
+    key = core.config_cache_key()
+    assert core.load_cached_config(key) is None
+    core.save_cached_config(key, {'clients': {}})
+    assert core.load_cached_config(core.config_cache_key()) == {'clients': {}}
+
+    tmpdir.join('config.yaml').write('clients: {bts: {}}\n')
+    assert core.load_cached_config(core.config_cache_key()) is None
+
+
+def test_lazy_imports():
+    import subprocess
+    import sys
+
+    check = ('import sys, bts_tools.cmdline; from bts_tools import core; '
+             'print(sorted(m for m in ["autobahn", "ecdsa", "geoip2", "bs4", "flask", "psutil"] if m in sys.modules)); '
+             'print(core.get_version.cache_info().currsize)')
+    out = subprocess.run([sys.executable, '-c', check], stdout=subprocess.PIPE, check=True,
+                         universal_newlines=True).stdout.split('\n')
+    assert out[:2] == ['[]', '0']
+
+
+def test_create_app(monkeypatch):
+    import bts_tools
+    from bts_tools import core, rpcutils
+
+    # the web app needs all the modules used by the templates, even those that nothing imported yet
+    monkeypatch.setattr(core, 'config', {})
+    monkeypatch.setattr(core, 'load_db', lambda: None)
+    monkeypatch.setattr(rpcutils, 'graphene_clients', lambda: [])
+    from bts_tools.frontend import create_app
+
+    app = create_app()
+    assert app.jinja_env.globals['process'] is bts_tools.process
+    assert app.jinja_env.globals['rpc'] is rpcutils
+
+
+def test_plugin_registry(tmpdir, monkeypatch):
+    import sys
+    from bts_tools import core
+
+    pkg = tmpdir.mkdir('test_plugins')
+    pkg.join('__init__.py').write("REQUIRED_FUNCTIONS = ['get']\n")
+    pkg.join('first.py').write("def get():\n    return 1\n\ndef short_description():\n    return 'first plugin'\n")
+    pkg.join('invalid.py').write("def other():\n    return 2\n")
+    monkeypatch.syspath_prepend(str(tmpdir))
+
+    plugins = core.get_plugin_dict('test_plugins')
+    assert list(plugins) == ['first'] and plugins.First.get() == 1
+    assert core.get_plugin_dict('test_plugins') is plugins
+
+    # with a manifest, plugins are only imported when first used
+    core.build_plugin_manifest('test_plugins')
+    core.reload_plugins('test_plugins')
+    del sys.modules['test_plugins.first']
+    plugins = core.get_plugin_dict('test_plugins')
+    assert list(plugins) == ['first']
+    assert core.plugin_metadata('test_plugins', 'first') == {'short_description': 'first plugin'}
+    assert 'test_plugins.first' not in sys.modules
+    assert plugins.first.get() == 1
+
+    # the manifest is ignored when a module is modified or added
+    pkg.join('first.py').write("def get():\n    return 1\n\ndef short_description():\n    return 'modified'\n")
+    core.reload_plugins('test_plugins')
+    assert core.plugin_manifest('test_plugins') is None
+    del sys.modules['test_plugins.first']
+    core.build_plugin_manifest('test_plugins')
+    assert core.plugin_metadata('test_plugins', 'first') == {'short_description': 'modified'}
+
+    pkg.join('second.py').write("def get():\n    return 2\n")
+    core.reload_plugins('test_plugins')
+    assert sorted(core.get_plugin_dict('test_plugins')) == ['first', 'second']
+    core.reload_plugins('test_plugins')
+
+
+def test_plugin_manifests_up_to_date():
+    import importlib
+    import json
+    from pathlib import Path
+    from bts_tools import core
+
+    # if this fails, run "doit plugin_manifests" and commit the result
+    for plugin_type in ['bts_tools.commands', 'bts_tools.feed_providers']:
+        manifest_file = Path(importlib.import_module(plugin_type).__file__).parent / core.PLUGIN_MANIFEST
+        with open(str(manifest_file)) as f:
+            assert core.build_plugin_manifest(plugin_type, write=False) == json.load(f)
+
+
+def test_provider_context():
+    from bts_tools.feed_providers import ProviderContext, FeedPrice, to_bts, from_bts
+
+    ctx = ProviderContext('Test', {'GOLD': 'XAU', 'SILVER': 'XAG'})
+    assert ctx.to_bts('xau') == 'GOLD' and ctx.to_bts('BTS') == 'BTS'
+    assert ctx.from_bts('silver') == 'XAG' and ctx.from_bts('USD') == 'USD'
+    f = ctx.feed_price(1.5, 'BTS', 'USD', volume=10)
+    assert (f.price, f.asset, f.base, f.volume, f.provider) == (1.5, 'BTS', 'USD', 10, 'Test')
+
+    # the module-level functions still look for NAME and ASSET_MAP in the calling module
+    ns = {'NAME': 'Caller', 'ASSET_MAP': {'GOLD': 'XAU'}, 'FeedPrice': FeedPrice,
+          'to_bts': to_bts, 'from_bts': from_bts}
+    exec("f = FeedPrice(1, 'GOLD', 'USD')\nasset = to_bts('XAU')\nname = from_bts('GOLD')", ns)
+    assert (ns['f'].provider, ns['asset'], ns['name']) == ('Caller', 'GOLD', 'XAU')
+    assert FeedPrice(1, 'BTS', 'USD').provider is None
+
+
+def test_feedset_index():
+    import pickle
+    from bts_tools.feed_providers import FeedPrice, FeedSet
+
+    feeds = FeedSet([FeedPrice(1, 'BTS', 'USD', volume=1, provider='A'),
+                     FeedPrice(2, 'BTC', 'USD', provider='A')])
+    feeds += [FeedPrice(3, 'BTS', 'USD', volume=3, provider='B')]
+    feeds.append(FeedPrice(4, 'BTS', 'CNY', provider='B'))
+
+    assert [f.price for f in feeds.filter('BTS', 'USD')] == [1, 3]
+    assert [f.price for f in feeds.filter(base='USD')] == [1, 2, 3]
+    assert [f.price for f in feeds.filter(asset=['BTS', 'BTC'], base={'USD'})] == [1, 2, 3]
+    assert [f.price for f in feeds.filter(provider='B')] == [3, 4]
+    assert [f.price for f in feeds.filter('BTS', provider=['A'])] == [1]
+    assert feeds.price('BTS', 'USD') == 2.5
+    assert sorted(feeds.markets()) == [('BTC', 'USD'), ('BTS', 'CNY'), ('BTS', 'USD')]
+
+    # other modifications of the list rebuild the index
+    del feeds[0]
+    feeds.insert(0, FeedPrice(5, 'BTS', 'USD', provider='C'))
+    assert [f.price for f in feeds.filter('BTS', 'USD')] == [5, 3]
+    assert [f.price for f in pickle.loads(pickle.dumps(feeds)).filter('BTS', 'USD')] == [5, 3]
+
+    try:
+        FeedPrice(1, 'BTS', 'USD').other = 1
+        assert False, 'FeedPrice should not have a __dict__'
+    except AttributeError:
+        pass
+
+
+def test_feed_rules():
+    import threading
+    from bts_tools.feed_providers import FeedPrice, FeedSet
+    from bts_tools.feed_rules import RulePlan, get_plan
+
+    rules = [['invert', 'BTS/BTC'],
+             ['compose', 'BTS/BTC', 'BTC/USD'],
+             ['invert', 'BTS/USD'],
+             ['loop', ['CNY', 'EUR'], ['compose', '{}/USD', 'USD/BTS']],
+             ['compose', 'HERO/USD', 'USD/BTS'],
+             ['publish', 'USD/BTS'],
+             ['loop', ['CNY', 'EUR'], ['publish', '{}/BTS']],
+             ['publish', 'HERO/BTS']]
+    plan = RulePlan(rules)
+    assert [str(n) for n in plan.nodes][:5] == ['source BTS/BTC', 'source BTC/USD', 'source BTS/USD',
+                                                'source CNY/USD', 'source USD/BTS']
+    assert 'compose CNY/USD USD/BTS -> CNY/BTS' in plan.dump()
+
+    def fetched(eur=0.8):
+        return FeedSet([FeedPrice(0.0001, 'BTS', 'BTC', provider='A'),
+                        FeedPrice(10000, 'BTC', 'USD', provider='A'),
+                        FeedPrice(0.15, 'CNY', 'USD', provider='A'),
+                        FeedPrice(eur, 'EUR', 'USD', provider='A')])
+
+    feeds = fetched()
+    # HERO/USD has no feed, the rules depending on it are skipped
+    assert plan.evaluate(feeds) == [('USD', 'BTS'), ('CNY', 'BTS'), ('EUR', 'BTS')]
+    assert abs(feeds.price('EUR', 'BTS') - 0.8) < 1e-9
+    assert [n.status for n in plan.nodes if str(n).startswith(('compose HERO', 'publish HERO'))] == ['skipped'] * 2
+
+    # only the rules whose inputs changed are computed again
+    feeds = fetched(eur=0.9)
+    plan.evaluate(feeds)
+    assert abs(feeds.price('EUR', 'BTS') - 0.9) < 1e-9 and abs(feeds.price('CNY', 'BTS') - 0.15) < 1e-9
+    assert [str(n) for n in plan.nodes if n.changed] == ['source EUR/USD', 'compose EUR/USD USD/BTS -> EUR/BTS']
+
+    # each node gets its own plan, which can be evaluated from several threads
+    assert get_plan(rules, ('localhost', 8093)) is get_plan(rules, ('localhost', 8093))
+    assert get_plan(rules, ('localhost', 8093)) is not get_plan(rules, ('localhost', 8094))
+
+    errors = []
+
+    def run(eur):
+        for _ in range(50):
+            feeds = fetched(eur)
+            plan.evaluate(feeds)
+            if abs(feeds.price('EUR', 'BTS') - eur) > 1e-9:
+                errors.append(eur)
+
+    threads = [threading.Thread(target=run, args=(0.5 + i / 10,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+
+
+def test_feed_fetcher():
+    import threading
+    import time
+    import types
+    from bts_tools import feed_fetcher
+    from bts_tools.feed_providers import FeedPrice, FeedSet
+
+    running = {}
+    max_running = {}
+    lock = threading.Lock()
+
+    def make_provider(name, delay, **attrs):
+        def get(asset, base, *args):
+            with lock:
+                running[name] = running.get(name, 0) + 1
+                max_running[name] = max(max_running.get(name, 0), running[name])
+            time.sleep(delay)
+            with lock:
+                running[name] -= 1
+            return FeedPrice(1, asset, base, provider=name)
+
+        def get_all(asset_list, base):
+            return FeedSet(get(asset, base) for asset in asset_list)
+
+        return types.SimpleNamespace(NAME=name, get=get, get_all=get_all, **attrs)
+
+    providers = {'Fast': make_provider('Fast', 0.05),
+                 'Single': make_provider('Single', 0.05, MAX_CONCURRENT_REQUESTS=1),
+                 'Node': make_provider('Node', 0.05, REQUIRES_NODE=True),
+                 'Slow': make_provider('Slow', 2)}
+    markets = ([('A{}'.format(i), 'USD', 'Fast') for i in range(6)] +
+               [('B{}'.format(i), 'USD', 'Single') for i in range(2)] +
+               [(['C1', 'C2'], 'USD', 'Fast'), ('D', 'BTS', 'Node'), ('E', 'USD', 'Slow')])
+
+    start = time.time()
+    feeds = feed_fetcher.fetch_feeds(markets, providers, node=object(),
+                                     max_concurrent=8, max_per_provider=3, timeout=0.5)
+    assert time.time() - start < 1.5
+
+    # the slow provider has been cancelled, all the others returned their feeds
+    assert len(feeds) == 11 and not feeds.filter('E', 'USD')
+    assert max_running == {'Fast': 3, 'Single': 1, 'Node': 1, 'Slow': 1}
+
+
+def test_feed_fetcher_timeout(monkeypatch):
+    import threading
+    import time
+    import types
+    from requests.exceptions import Timeout
+    from bts_tools import feed_fetcher, feed_providers
+    from bts_tools.feed_providers import ProviderContext
+
+    timeouts = []
+    finished = threading.Event()
+
+    class HangingSession(object):
+        def get(self, url, timeout=None):
+            # a server that never replies: the request only ends when its timeout expires
+            timeouts.append(timeout)
+            time.sleep(timeout)
+            finished.set()
+            raise Timeout(url)
+
+    monkeypatch.setattr(feed_providers, 'http_session', lambda url: HangingSession())
+    ctx = ProviderContext('Hanging')
+
+    def get(asset, base):
+        ctx.get('https://hanging.example.com/{}/{}'.format(asset, base))
+
+    providers = {'Hanging': types.SimpleNamespace(NAME='Hanging', get=get)}
+
+    start = time.time()
+    feeds = feed_fetcher.fetch_feeds([('A', 'USD', 'Hanging')], providers, timeout=0.3)
+    assert time.time() - start < 1
+    assert len(feeds) == 0
+
+    # the request was given the time left in the cycle instead of HTTP_TIMEOUT, so its thread
+    # doesn't keep running long after the cycle
+    assert len(timeouts) == 1 and timeouts[0] <= 0.3
+    assert finished.wait(1)
+
+    # outside of a fetch cycle the default timeout applies
+    assert feed_providers.http_timeout() == feed_providers.HTTP_TIMEOUT